@@ -0,0 +1,116 @@
+"""
+Groups the alerts generated during a single monitor cycle by destination so that
+clients sharing a phone number or email address receive one merged message.
+"""
+
+import enum
+import typing as T
+
+STOCK_EMOJI = "\U0001f943"
+
+INVENTORY_ALERT_HEADER = "NC ABC Inventory Alert\n"
+NEW_ITEM_ALERT_HEADER = "NC ABC New Item Alert\n"
+
+
+class Channel(enum.Enum):
+    SMS = "sms"
+    EMAIL = "email"
+
+
+class AlertItem(T.NamedTuple):
+    nc_code: str
+    brand_name: str
+    total_available: int
+
+
+class CoalescedAlert(T.NamedTuple):
+    channel: Channel
+    address: str
+    client_ids: T.List[str]
+    inventory_items: T.List[AlertItem]
+    new_items: T.List[AlertItem]
+
+    @property
+    def num_items(self) -> int:
+        return len(self.inventory_items) + len(self.new_items)
+
+
+def format_alert_items(header: str, items: T.Iterable[AlertItem]) -> str:
+    message = header
+    for item in items:
+        message += (
+            f"{STOCK_EMOJI} {item.nc_code}: {item.brand_name} "
+            f"is now in stock with {item.total_available}\n\n"
+        )
+    return message
+
+
+def format_alert_message(alert: CoalescedAlert) -> str:
+    sections = []
+    if alert.inventory_items:
+        sections.append(format_alert_items(INVENTORY_ALERT_HEADER, alert.inventory_items))
+    if alert.new_items:
+        sections.append(format_alert_items(NEW_ITEM_ALERT_HEADER, alert.new_items))
+    return "".join(sections)
+
+
+class _PendingAlert:
+    def __init__(self) -> None:
+        self.client_ids: T.List[str] = []
+        self.inventory_items: T.Dict[str, AlertItem] = {}
+        self.new_items: T.Dict[str, AlertItem] = {}
+
+
+class AlertCoalescer:
+    """
+    Collects alerts for a cycle keyed by (channel, address). The same restock seen by
+    several clients that share a destination is only reported once per destination.
+    """
+
+    def __init__(self) -> None:
+        self._pending: T.Dict[T.Tuple[Channel, str], _PendingAlert] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(
+        self,
+        channel: Channel,
+        address: str,
+        client_id: str,
+        items: T.Iterable[AlertItem],
+        is_new_inventory: bool = False,
+    ) -> None:
+        if not address:
+            return
+
+        pending = self._pending.setdefault((channel, address), _PendingAlert())
+        if client_id not in pending.client_ids:
+            pending.client_ids.append(client_id)
+
+        bucket = pending.new_items if is_new_inventory else pending.inventory_items
+        for item in items:
+            alert_item = AlertItem(*item)
+            # an item that already triggered an inventory alert doesn't need a second line
+            if is_new_inventory and alert_item.nc_code in pending.inventory_items:
+                continue
+            bucket.setdefault(alert_item.nc_code, alert_item)
+
+        if not is_new_inventory:
+            for nc_code in list(pending.inventory_items.keys()):
+                pending.new_items.pop(nc_code, None)
+
+    def drain(self) -> T.List[CoalescedAlert]:
+        alerts = [
+            CoalescedAlert(
+                channel=channel,
+                address=address,
+                client_ids=pending.client_ids,
+                inventory_items=list(pending.inventory_items.values()),
+                new_items=list(pending.new_items.values()),
+            )
+            for (channel, address), pending in self._pending.items()
+            if pending.inventory_items or pending.new_items
+        ]
+        self._pending = {}
+        return alerts
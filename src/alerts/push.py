@@ -0,0 +1,309 @@
+"""
+Pushes restock events to local listeners as soon as they are published: signed HTTP
+webhooks and a server-sent events feed. Publishing only queues the events, every
+subscriber is drained from its own thread through a bounded queue so a slow or dead
+listener drops its oldest events instead of holding up the monitor.
+"""
+
+import hmac
+import http.server
+import json
+import queue
+import threading
+import time
+import typing as T
+import urllib.parse
+import urllib.request
+
+from restock_events import RestockEvent, RestockEventStream
+from util import log, metrics
+
+SIGNATURE_HEADER = "X-Restock-Signature"
+TIMESTAMP_HEADER = "X-Restock-Timestamp"
+
+PUSH_EVENTS = metrics.REGISTRY.counter(
+    "push_events_total", "Restock events handed to push subscribers", ["channel", "outcome"]
+)
+
+EventBatch = T.List[RestockEvent]
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over the timestamp and body, so a captured request can't be replayed later"""
+    digest = hmac.new(secret.encode("utf-8"), timestamp.encode("utf-8") + b"." + body, "sha256")
+    return f"sha256={digest.hexdigest()}"
+
+
+def verify_signature(
+    secret: str,
+    timestamp: str,
+    body: bytes,
+    signature: str,
+    now: T.Optional[float] = None,
+    tolerance: float = 300.0,
+) -> bool:
+    try:
+        age = (now or time.time()) - float(timestamp)
+    except ValueError:
+        return False
+    if abs(age) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
+
+
+def encode_events(events: EventBatch) -> bytes:
+    return json.dumps({"events": [event.to_json() for event in events]}).encode("utf-8")
+
+
+class PushSubscriber:
+    """A bounded queue of event batches, the oldest batch is dropped when it is full"""
+
+    channel = ""
+
+    def __init__(self, max_pending: int = 100) -> None:
+        self.pending: "queue.Queue[T.Optional[EventBatch]]" = queue.Queue(max_pending)
+        self.dropped = 0
+        self.closed = threading.Event()
+
+    def offer(self, events: EventBatch) -> None:
+        """Never blocks the caller"""
+        if self.closed.is_set():
+            return
+        while True:
+            try:
+                self.pending.put_nowait(events)
+                return
+            except queue.Full:
+                pass
+            try:
+                dropped = self.pending.get_nowait()
+            except queue.Empty:
+                continue
+            if dropped:
+                self.dropped += len(dropped)
+                PUSH_EVENTS.inc(len(dropped), channel=self.channel, outcome="dropped")
+
+    def next_batch(self, timeout: T.Optional[float] = None) -> T.Optional[EventBatch]:
+        """The next batch, or None once closed or when nothing arrived within the timeout"""
+        if self.closed.is_set():
+            return None
+        try:
+            events = self.pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return None if self.closed.is_set() else events
+
+    def close(self) -> None:
+        self.closed.set()
+        # wakes a waiting reader, if the queue is full it has batches to wake up to anyway
+        try:
+            self.pending.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class WebhookSubscriber(PushSubscriber):
+    """POSTs each batch as JSON, signed with the shared secret, from a daemon thread"""
+
+    channel = "webhook"
+    # how often an idle delivery thread checks whether it has been closed
+    POLL_SECONDS = 1.0
+
+    def __init__(self, url: str, secret: str, max_pending: int = 100, timeout: float = 5.0) -> None:
+        if not secret:
+            raise ValueError(f"A webhook secret is needed to sign the requests to {url}")
+        super().__init__(max_pending)
+        self.url = url
+        self.secret = secret
+        self.timeout = timeout
+        self.thread = threading.Thread(target=self._run, name="WebhookSubscriber", daemon=True)
+
+    def start(self) -> "WebhookSubscriber":
+        self.thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self.closed.is_set():
+            events = self.next_batch(self.POLL_SECONDS)
+            if events:
+                self.deliver(events)
+
+    def deliver(self, events: EventBatch) -> bool:
+        body = encode_events(events)
+        timestamp = str(int(time.time()))
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            method="POST",
+            headers={
+                "Content-Type": "application/json",
+                TIMESTAMP_HEADER: timestamp,
+                SIGNATURE_HEADER: sign(self.secret, timestamp, body),
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except Exception as e:  # pylint: disable=broad-except
+            log.print_fail(f"Failed to deliver {len(events)} restock events to {self.url}: {e}")
+            PUSH_EVENTS.inc(len(events), channel=self.channel, outcome="failed")
+            return False
+
+        PUSH_EVENTS.inc(len(events), channel=self.channel, outcome="sent")
+        return True
+
+
+class SseSubscriber(PushSubscriber):
+    """One connected /events client, written to by its request handler thread"""
+
+    channel = "sse"
+
+
+class PushServer:
+    """
+    Hands the restock events to the webhooks and, when given a port, serves them from a
+    daemon thread:
+
+    GET /events         server-sent events, resuming after Last-Event-ID when given
+    GET /events/recent  the events still in the stream history after ?since=<id>
+    """
+
+    def __init__(
+        self,
+        stream: RestockEventStream,
+        port: T.Optional[int] = None,
+        host: str = "127.0.0.1",
+        max_pending: int = 100,
+        keepalive_seconds: float = 15.0,
+    ) -> None:
+        self.stream = stream
+        self.max_pending = max_pending
+        self.keepalive_seconds = keepalive_seconds
+        self.subscribers: T.List[PushSubscriber] = []
+        self.lock = threading.Lock()
+
+        self.server: T.Optional[http.server.ThreadingHTTPServer] = None
+        self.port = 0
+        if port is not None:
+            self.server = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+            self.port = self.server.server_address[1]
+
+    def add_webhook(self, url: str, secret: str) -> WebhookSubscriber:
+        webhook = WebhookSubscriber(url, secret, self.max_pending)
+        self._add(webhook)
+        return webhook.start()
+
+    def publish(self, events: EventBatch) -> None:
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(events)
+
+    def _add(self, subscriber: PushSubscriber) -> PushSubscriber:
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def _remove(self, subscriber: PushSubscriber) -> None:
+        subscriber.close()
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def _make_handler(self) -> T.Type[http.server.BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args: T.Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                path, _, query = self.path.partition("?")
+                if path == "/events":
+                    self._stream_events()
+                elif path == "/events/recent":
+                    self._recent_events(query)
+                else:
+                    self.send_error(404)
+
+            def _recent_events(self, query: str) -> None:
+                params = urllib.parse.parse_qs(query)
+                try:
+                    since = int(params.get("since", ["0"])[0])
+                except ValueError:
+                    self.send_error(400, "since must be an event id")
+                    return
+                body = encode_events(server.stream.since(since))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream_events(self) -> None:
+                subscriber = server._add(SseSubscriber(server.max_pending))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+
+                try:
+                    # lets a client know it is subscribed before the first restock
+                    self._write(b": connected\n\n")
+                    last_event_id = self.headers.get("Last-Event-ID", "")
+                    last_id = int(last_event_id) if last_event_id.isdigit() else 0
+                    if last_id > server.stream.last_id:
+                        # not an id from this stream, resuming after it would skip everything
+                        last_id = 0
+                    if last_id:
+                        last_id = self._write_events(server.stream.since(last_id), last_id)
+
+                    while True:
+                        events = subscriber.next_batch(server.keepalive_seconds)
+                        if subscriber.closed.is_set():
+                            break
+                        if events:
+                            last_id = self._write_events(events, last_id)
+                        else:
+                            self._write(b": keepalive\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._remove(subscriber)
+
+            def _write_events(self, events: EventBatch, last_id: int) -> int:
+                """Write the events after last_id, a replayed event can also be in the queue"""
+                events = [event for event in events if event.id > last_id]
+                if not events:
+                    return last_id
+                chunks = [
+                    f"id: {event.id}\nevent: restock\ndata: {json.dumps(event.to_json())}\n\n"
+                    for event in events
+                ]
+                self._write("".join(chunks).encode("utf-8"))
+                PUSH_EVENTS.inc(len(events), channel=SseSubscriber.channel, outcome="sent")
+                return events[-1].id
+
+            def _write(self, data: bytes) -> None:
+                self.wfile.write(data)
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "PushServer":
+        self.stream.subscribe(self.publish)
+        if self.server is not None:
+            threading.Thread(
+                target=self.server.serve_forever, name="PushServer", daemon=True
+            ).start()
+        return self
+
+    def stop(self) -> None:
+        self.stream.unsubscribe(self.publish)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,286 @@
+"""
+asyncio runtime for the inventory monitor. Downloads are non-blocking, database work runs on
+a dedicated executor thread and alerts are delivered by a pool of workers, so downloading,
+client evaluation and alert delivery can overlap in a single process.
+
+Downloads stream through aiohttp, which is in the base requirements. Without it they fall back
+to the blocking client on a worker thread.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import time
+import typing as T
+
+from firebase.firebase_client import FirebaseClient
+from headers import HEADERS
+from inventory_monitor import STAGE_SECONDS, InventoryMonitor
+from util import log, wait
+
+try:
+    import aiohttp
+except ImportError:  # fall back to the blocking client on a worker thread
+    aiohttp = None
+
+
+class AsyncInventoryMonitor(InventoryMonitor):
+    MAX_CONCURRENT_DELIVERIES = 8
+    DOWNLOAD_CHUNK_SIZE = 8192
+    DOWNLOAD_TIMEOUT = 30.0
+    SHUTDOWN_TIMEOUT = 30.0
+
+    def __init__(self, *args: T.Any, **kwargs: T.Any) -> None:
+        super().__init__(*args, **kwargs)
+
+        # sqlite (and the monitor's own state) is only ever touched from this one thread
+        self.db_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="MonitorDb"
+        )
+
+        self.loop: T.Optional[asyncio.AbstractEventLoop] = None
+        self.alert_queue: T.Optional[asyncio.Queue] = None
+        self.firebase_event: T.Optional[asyncio.Event] = None
+        self.stop_event: T.Optional[asyncio.Event] = None
+        self.http_session: T.Any = None
+
+    async def _run_db(self, func: T.Callable[..., T.Any], *args: T.Any) -> T.Any:
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, func, *args)
+
+    async def _fetch(self, download_url: str) -> str:
+        """The primary source's fetch, streaming remote exports through aiohttp when it's there"""
+        source = self.inventory_source
+        if self.http_session is None or os.path.isfile(download_url):
+            return await asyncio.to_thread(source.fetch, download_url)
+
+        timeout = aiohttp.ClientTimeout(total=self.DOWNLOAD_TIMEOUT)
+        async with self.http_session.get(
+            download_url, headers=HEADERS, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            with open(source.csv_file, "wb") as outfile:
+                async for chunk in response.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                    outfile.write(chunk)
+        return source.csv_file
+
+    async def update_inventory_async(
+        self, download_url: str = "", now: T.Optional[float] = None, skip_db_add: bool = False
+    ) -> T.Optional[T.List[T.Tuple[str, str, int]]]:
+        self._start_cycle_summary()
+        await self._run_db(self._rotate_inventory)
+
+        now = now or time.time()
+        download_url = download_url or self.inventory_source.url
+
+        if not os.path.isfile(download_url) and not self._is_time_to_check_inventory(now):
+            log.print_normal_arrow("Not time to check inventory")
+            await self._run_db(self.inventory_buffers.restore)
+            return None
+
+        log.print_bold(f"Downloading inventory from {download_url}...")
+        try:
+            with STAGE_SECONDS.time(stage="download"):
+                csv_file = await self._fetch(download_url)
+        except Exception as e:  # pylint: disable=broad-except
+            log.print_fail(f"Error downloading inventory: {e}")
+            await self._run_db(self.inventory_buffers.restore)
+            return None
+
+        return await self._run_db(self._load_inventory, csv_file, now, skip_db_add)
+
+    def _dispatch_alerts(self) -> None:
+        """Hand alerts to the delivery workers instead of sending them on the db thread"""
+        if self.loop is None or self.alert_queue is None:
+            super()._dispatch_alerts()
+            return
+
+        alerts = self.alert_coalescer.drain()
+        if not alerts:
+            return
+
+        log.print_bold(f"Queueing {len(alerts)} alerts for delivery")
+        for alert in alerts:
+            self.loop.call_soon_threadsafe(
+                self.alert_queue.put_nowait, (alert, self._format_alert(alert))
+            )
+
+    def _on_firebase_change(self) -> None:
+        if self.loop is None or self.firebase_event is None:
+            super()._on_firebase_change()
+            return
+        self.loop.call_soon_threadsafe(self.firebase_event.set)
+
+    async def _deliver_alerts(self) -> None:
+        while True:
+            alert, message = await self.alert_queue.get()
+            try:
+                await asyncio.to_thread(self._deliver_alert, alert, message)
+            except Exception as e:  # pylint: disable=broad-except
+                log.print_fail(f"Failed to deliver alert to {alert.address}: {e}")
+            finally:
+                self.alert_queue.task_done()
+
+    async def _wait_for_stop(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.stop_event.is_set()
+
+    def _profiled_check_inventory(self, new_items: T.List[T.Tuple[str, str, int]]) -> None:
+        # cProfile only sees the thread it runs on, and the cycle's work runs on the db thread
+        with self.profiler.cycle():
+            self._check_inventory(new_items)
+
+    async def _inventory_loop(self) -> None:
+        while True:
+            with STAGE_SECONDS.time(stage="cycle"):
+                new_items = await self.update_inventory_async()
+
+                # nothing was downloaded so there is nothing new to alert on
+                if new_items is not None:
+                    await self._run_db(self._profiled_check_inventory, new_items)
+
+            if await self._wait_for_stop(self._time_till_inventory_check()):
+                return
+
+    async def _firebase_loop(self) -> None:
+        interval = self.TIME_BETWEEN_FIREBASE_CHECKS[self.mode]
+        while True:
+            self.firebase_event.clear()
+            await self._run_db(self._run_firebase_task)
+
+            try:
+                await asyncio.wait_for(self.firebase_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sources_loop(self) -> None:
+        while True:
+            # fetching doesn't touch the db, so keep it off the db thread
+            updated = await asyncio.to_thread(self.source_manager.poll_due)
+            for name in updated:
+                await self._run_db(self._check_source, name)
+            if await self._wait_for_stop(self.source_manager.time_till_next_poll()):
+                return
+
+    async def _periodic(self, func: T.Callable[[], None], interval: float) -> None:
+        while True:
+            await self._run_db(func)
+            if await self._wait_for_stop(interval):
+                return
+
+    def _start(self) -> T.List[asyncio.Task]:
+        self.loop = asyncio.get_running_loop()
+        self.alert_queue = asyncio.Queue()
+        self.firebase_event = asyncio.Event()
+        self.stop_event = asyncio.Event()
+        self.http_session = aiohttp.ClientSession() if aiohttp is not None else None
+
+        return [
+            asyncio.create_task(self._deliver_alerts())
+            for _ in range(self.MAX_CONCURRENT_DELIVERIES)
+        ]
+
+    async def _shutdown(
+        self, tasks: T.List[asyncio.Task], workers: T.List[asyncio.Task], close: bool = False
+    ) -> None:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # cancelling doesn't interrupt work already running on the db thread, wait for it
+        await self._run_db(lambda: None)
+
+        # let alerts that were already generated go out before stopping the workers
+        try:
+            await asyncio.wait_for(self.alert_queue.join(), timeout=self.SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.print_fail(f"Dropping {self.alert_queue.qsize()} undelivered alerts")
+
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+        self.loop = None
+        self.alert_queue = None
+        self.firebase_event = None
+
+        # a single pass keeps them for the next one
+        if close:
+            self.close()
+
+    async def run_async(self) -> None:
+        """Run until stop() is called, the task is cancelled or one of the loops fails"""
+        workers = self._start()
+
+        tasks = [asyncio.create_task(self._inventory_loop())]
+        if self.source_manager.next_poll:
+            tasks.append(asyncio.create_task(self._sources_loop()))
+        if self.metrics_writer is not None:
+            tasks.append(
+                asyncio.create_task(
+                    self._periodic(self.metrics_writer.write, self.TIME_BETWEEN_METRICS_WRITES)
+                )
+            )
+        if self.firebase_client:
+            tasks.append(asyncio.create_task(self._firebase_loop()))
+            tasks.append(
+                asyncio.create_task(
+                    self._periodic(
+                        self.firebase_client.health_ping, FirebaseClient.HEALTH_PING_TIME
+                    )
+                )
+            )
+        tasks.append(
+            asyncio.create_task(
+                self._periodic(self._release_queued_sms, self.TIME_BETWEEN_SMS_QUEUE_CHECKS)
+            )
+        )
+
+        stop_task = asyncio.create_task(self.stop_event.wait())
+        try:
+            done, _ = await asyncio.wait([stop_task, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is stop_task:
+                    continue
+                exception = task.exception()
+                if exception is not None:
+                    raise exception
+        finally:
+            log.print_warn("Shutting down monitor...")
+            stop_task.cancel()
+            await self._shutdown(tasks, workers, close=True)
+
+    def stop(self) -> None:
+        """Stop the monitor, safe to call from any thread"""
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    async def run_once_async(self) -> None:
+        workers = self._start()
+        try:
+            if self.firebase_client:
+                await self._run_db(self.firebase_client.health_ping)
+
+            new_items = await self.update_inventory_async()
+            await self._run_db(self._check_inventory, new_items)
+        finally:
+            await self._shutdown([], workers)
+
+    def run(self) -> None:
+        """Synchronous compatibility wrapper, runs a single monitor pass"""
+        asyncio.run(self.run_once_async())
+
+        wait.wait(self.WAIT_TIME)
+
+    def close(self) -> None:
+        super().close()
+        self.db_executor.shutdown()
+
+    def run_forever(self) -> None:
+        asyncio.run(self.run_async())
@@ -0,0 +1,103 @@
+"""
+Benchmark sharded client evaluation against a synthetic inventory snapshot for a range of
+worker counts.
+"""
+
+import argparse
+import datetime
+import json
+import random
+import time
+import typing as T
+
+import pandas as pd
+
+from client_evaluation import ClientRecord, ShardedEvaluator
+from restock_events import diff_stock, find_restocks
+from util import log
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--clients", type=int, default=5000, help="Number of clients")
+    parser.add_argument("--items-per-client", type=int, default=200, help="Items per client")
+    parser.add_argument("--catalog-size", type=int, default=10000, help="Number of items in stock")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per worker count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-output", type=str, default="", help="Write results to file")
+    return parser.parse_args()
+
+
+def make_inventory(catalog: T.List[str], rng: random.Random) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "nc_code": catalog,
+            "brand_name": [f"Brand {nc_code}" for nc_code in catalog],
+            "total_available": [rng.choice([0, 0, 0, rng.randint(1, 200)]) for _ in catalog],
+        }
+    )
+
+
+def stock(inventory: pd.DataFrame) -> T.Dict[str, int]:
+    return dict(zip(inventory["nc_code"], inventory["total_available"]))
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+    rng = random.Random(args.seed)
+
+    catalog = [f"{index:05d}" for index in range(args.catalog_size)]
+    last_inventory = make_inventory(catalog, rng)
+    new_inventory = make_inventory(catalog, rng)
+    items_per_client = min(args.items_per_client, len(catalog))
+    clients = [
+        ClientRecord(f"client{index:06d}", tuple(rng.sample(catalog, items_per_client)), 0, 0)
+        for index in range(args.clients)
+    ]
+    now = datetime.datetime.utcnow()
+    brand_names = dict(zip(new_inventory["nc_code"], new_inventory["brand_name"]))
+    events = find_restocks(
+        diff_stock(stock(last_inventory), stock(new_inventory)),
+        brand_names.get,
+        lambda nc_codes: {},
+        "nc_abc",
+        now,
+    )
+    restocks = {event.nc_code: event for event in events}
+
+    log.print_bright(f"Evaluating {args.clients} clients x {items_per_client} items")
+    log.print_bold(f"{'workers':<10}{'seconds':>10}{'speedup':>10}{'alerts':>10}")
+
+    results: T.Dict[int, float] = {}
+    for workers in args.workers:
+        evaluator = ShardedEvaluator(workers)
+        try:
+            path = evaluator.write_snapshot(new_inventory, "nc_code")
+            # the first run pays for starting the pool
+            result = evaluator.evaluate(path, clients, restocks, now)
+
+            timings = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                result = evaluator.evaluate(path, clients, restocks, now)
+                timings.append(time.perf_counter() - start)
+        finally:
+            evaluator.close()
+
+        results[workers] = min(timings)
+        speedup = results[args.workers[0]] / results[workers]
+        log.print_normal(
+            f"{workers:<10}{results[workers]:>10.3f}{speedup:>10.2f}{len(result.alerts):>10}"
+        )
+
+    if args.json_output:
+        with open(args.json_output, "w") as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
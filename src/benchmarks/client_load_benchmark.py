@@ -0,0 +1,81 @@
+"""
+Benchmark loading every client with its items from the local database, comparing the
+per-client ORM load and marshmallow dump against the records built from Core rows.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import typing as T
+
+from benchmarks.synthetic_data import make_catalog, make_clients, populate_database
+from database.client import ClientDb
+from database.connect import close_engine, init_database
+from database.models.client import ClientSchema
+from util import log
+
+BENCHMARK_DB = "client_load_benchmark.db"
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--clients", type=int, default=1000, help="Number of clients")
+    parser.add_argument("--items-per-client", type=int, default=50, help="Items per client")
+    parser.add_argument("--catalog-size", type=int, default=10000, help="Number of items")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per loader")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-output", type=str, default="", help="Write results to file")
+    return parser.parse_args()
+
+
+def load_schemas() -> T.Dict[str, T.Dict[str, T.Any]]:
+    schemas = {}
+    for name in ClientDb.get_client_names():
+        with ClientDb.client(name) as client:
+            if client is not None:
+                schemas[name] = ClientSchema().dump(client)
+    return schemas
+
+
+def time_loader(loader: T.Callable[[], T.Dict], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        loader()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+
+    catalog = make_catalog(args.catalog_size, args.seed)
+    clients = make_clients(args.clients, catalog, args.items_per_client, args.seed)
+
+    results: T.Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        init_database(temp_dir, BENCHMARK_DB, force=True)
+        try:
+            populate_database(clients, catalog)
+            log.print_bright(f"Loading {args.clients} clients x {args.items_per_client} items")
+            results["schema_dump"] = time_loader(load_schemas, args.repeats)
+            results["records"] = time_loader(ClientDb.get_clients, args.repeats)
+        finally:
+            close_engine(BENCHMARK_DB)
+
+    log.print_bold(f"{'loader':<16}{'seconds':>10}{'speedup':>10}")
+    for loader, seconds in results.items():
+        speedup = results["schema_dump"] / seconds
+        log.print_normal(f"{loader:<16}{seconds:>10.3f}{speedup:>10.2f}")
+
+    if args.json_output:
+        with open(args.json_output, "w") as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Benchmark the firebase sync path (snapshot reconciliation and item write back)
+against the in-memory firestore backend and a temporary sqlite database.
+"""
+
+import argparse
+import contextlib
+import copy
+import json
+import os
+import random
+import tempfile
+import time
+import typing as T
+
+from database.client import ClientDb
+from database.connect import ManagedSession, close_engine, init_database
+from database.models.client import Client, PhoneNumber, TrackingItem
+from database.models.item import Item
+from database.models.item_association import ItemAssociationTable
+from firebase import defs
+from firebase.firebase_client import FirebaseClient
+from firebase.write_back import MAX_WRITES_PER_BATCH
+from test.memory_firestore import MemoryFirestore
+from util import log
+
+BENCHMARK_DB = "firebase_sync_benchmark.db"
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--clients", type=int, default=1000, help="Number of clients")
+    parser.add_argument("--items-per-client", type=int, default=200, help="Items per client")
+    parser.add_argument("--catalog-size", type=int, default=5000, help="Number of items in stock")
+    parser.add_argument("--restocked-items", type=int, default=50, help="Items changed per cycle")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated rpc latency (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-output", type=str, default="", help="Write results to file")
+    parser.add_argument("--show-logs", action="store_true", help="Don't silence sync logs")
+    return parser.parse_args()
+
+
+class SyncBenchmark:
+    def __init__(
+        self,
+        num_clients: int,
+        items_per_client: int,
+        catalog_size: int,
+        latency: float = 0.0,
+        seed: int = 0,
+        show_logs: bool = False,
+    ) -> None:
+        self.num_clients = num_clients
+        self.items_per_client = min(items_per_client, catalog_size)
+        self.catalog = [f"{index:05d}" for index in range(catalog_size)]
+        self.random = random.Random(seed)
+        self.show_logs = show_logs
+
+        self.backend = MemoryFirestore(latency=latency)
+        self.firebase_client: T.Optional[FirebaseClient] = None
+        self.results: T.Dict[str, T.Dict[str, float]] = {}
+
+        self.client_items: T.Dict[str, T.List[str]] = {
+            f"client{index:05d}": self.random.sample(self.catalog, self.items_per_client)
+            for index in range(num_clients)
+        }
+
+    @contextlib.contextmanager
+    def _quiet(self) -> T.Iterator[None]:
+        if self.show_logs:
+            yield
+            return
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> T.Iterator[None]:
+        stats_before = copy.copy(self.backend.stats)
+        start = time.perf_counter()
+        with self._quiet():
+            yield
+        elapsed = time.perf_counter() - start
+
+        result = {"seconds": elapsed}
+        for key, value in self.backend.stats.items():
+            result[key] = value - stats_before.get(key, 0)
+        self.results[name] = result
+
+    def populate(self) -> None:
+        item_rows = [
+            {"id": nc_code, "brand_name": f"Brand {nc_code}", "total_available": 0}
+            for nc_code in self.catalog
+        ]
+
+        client_rows = []
+        phone_rows = []
+        association_rows = []
+        tracking_rows = []
+        for index, (client, nc_codes) in enumerate(self.client_items.items()):
+            client_rows.append({"id": client, "email": f"{client}@example.com", "has_paid": True})
+            phone_rows.append({"client_id": client, "number": f"+1555{index:07d}"})
+            for nc_code in nc_codes:
+                association_rows.append({"client_id": client, "item_id": nc_code})
+                tracking_rows.append({"client_id": client, "nc_code": nc_code})
+
+        with ManagedSession() as db:
+            db.execute(Item.__table__.insert(), item_rows)
+            db.execute(Client.__table__.insert(), client_rows)
+            db.execute(PhoneNumber.__table__.insert(), phone_rows)
+            db.execute(ItemAssociationTable.insert(), association_rows)
+            db.execute(TrackingItem.__table__.insert(), tracking_rows)
+
+        clients_ref = self.backend.collection("clients")
+        batch = self.backend.batch()
+        for index, (client, nc_codes) in enumerate(self.client_items.items()):
+            doc = copy.deepcopy(defs.NULL_CLIENT)
+            doc["preferences"]["notifications"]["email"]["email"] = f"{client}@example.com"
+            doc["preferences"]["notifications"]["sms"]["phoneNumbers"] = {"0": f"555{index:07d}"}
+            doc["accounting"]["hasPaid"] = True
+            doc["inventory"]["items"] = {
+                nc_code: {
+                    "name": f"Brand {nc_code}",
+                    "available": 0,
+                    "action": defs.Actions.TRACKING.value,
+                }
+                for nc_code in nc_codes
+            }
+            batch.set(clients_ref.document(client), doc)
+            if len(batch) == MAX_WRITES_PER_BATCH:
+                batch.commit()
+                batch = self.backend.batch()
+        batch.commit()
+
+    def _reconcile(self) -> None:
+        # a reconcile may write back to firestore and trigger follow up changes
+        for _ in range(3):
+            self.backend.flush(timeout=600.0)
+            self.firebase_client.check_and_maybe_handle_firebase_db_updates()
+
+    def run(self, restocked_items: int) -> T.Dict[str, T.Dict[str, float]]:
+        with self.stage("populate"):
+            self.populate()
+
+        with self.stage("initial_sync"):
+            self.firebase_client = FirebaseClient("", backend=self.backend)
+            self._reconcile()
+
+        with self.stage("single_client_edit"):
+            client = next(iter(self.client_items.keys()))
+            nc_code = self.client_items[client][0]
+            self.backend.collection("clients").document(client).update(
+                {
+                    f"inventory.items.`{nc_code}`.action": defs.Actions.NOT_TRACKING.value,
+                    "inventory.inventoryChange": 5,
+                }
+            )
+            self._reconcile()
+
+        with self.stage("watcher_check"):
+            self.firebase_client.check_watchers()
+            self._reconcile()
+
+        with self.stage("resubscribe"):
+            self.firebase_client.update_watchers()
+            self._reconcile()
+
+        for nc_code in self.random.sample(self.catalog, min(restocked_items, len(self.catalog))):
+            ClientDb.add_or_update_item(nc_code, total_available=self.random.randint(1, 100))
+
+        with self.stage("write_back"):
+            self.firebase_client.sync_items_to_firebase()
+
+        with self.stage("write_back_echo"):
+            self._reconcile()
+
+        with self.stage("write_back_no_changes"):
+            self.firebase_client.sync_items_to_firebase()
+
+        return self.results
+
+
+def print_results(results: T.Dict[str, T.Dict[str, float]]) -> None:
+    log.print_bold(f"{'stage':<24}{'seconds':>10}{'reads':>10}{'listen':>10}{'writes':>10}")
+    for name, result in results.items():
+        log.print_normal(
+            f"{name:<24}{result['seconds']:>10.3f}"
+            f"{result.get('reads', 0):>10}"
+            f"{result.get('listen_reads', 0):>10}"
+            f"{result.get('writes', 0):>10}"
+        )
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        init_database(temp_dir, BENCHMARK_DB, force=True)
+        try:
+            benchmark = SyncBenchmark(
+                num_clients=args.clients,
+                items_per_client=args.items_per_client,
+                catalog_size=args.catalog_size,
+                latency=args.latency,
+                seed=args.seed,
+                show_logs=args.show_logs,
+            )
+            log.print_bright(
+                f"Benchmarking firebase sync with {args.clients} clients x "
+                f"{benchmark.items_per_client} items"
+            )
+            results = benchmark.run(args.restocked_items)
+        finally:
+            close_engine(BENCHMARK_DB)
+
+    print_results(results)
+
+    if args.json_output:
+        with open(args.json_output, "w") as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
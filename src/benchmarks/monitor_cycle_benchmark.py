@@ -0,0 +1,318 @@
+"""
+Benchmark full monitor cycles (update_inventory + _check_inventory) over a grid of catalog
+size x client count x churn rate. Exports are read from local files, with a temporary
+sqlite database, stub SMS and email, and the in-memory firestore backend.
+
+Time and peak RSS are reported per stage and compared against a stored baseline. The
+committed baselines/monitor_cycle.json is a reference run of the default grid on a single core
+machine, timings depend on the hardware so run with --save-baseline to compare against your own.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import typing as T
+
+from benchmarks.synthetic_data import (
+    InventoryGenerator,
+    make_catalog,
+    make_clients,
+    populate_database,
+    populate_firestore,
+)
+from database.connect import close_engine, init_database
+from inventory_monitor import STAGE_SECONDS, InventoryMonitor
+from test.memory_firestore import MemoryFirestore
+from test.twilio_stub import TwilioUtilStub
+from util import log
+
+BENCHMARK_DB = "monitor_cycle_benchmark.db"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "monitor_cycle.json")
+# differences below these are noise however large they are relative to the baseline
+MIN_SECONDS_DELTA = 0.05
+MIN_RSS_DELTA_MB = 16.0
+
+StageResults = T.Dict[str, T.Dict[str, float]]
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--churn", type=float, nargs="+", default=[0.01, 0.05])
+    parser.add_argument("--items-per-client", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=3, help="Timed cycles after the first load")
+    parser.add_argument("--no-firestore", action="store_true", help="Skip the firestore sync")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store these results as the new baseline"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed fractional slowdown or growth"
+    )
+    parser.add_argument("--json-output", type=str, default="", help="Write results to file")
+    parser.add_argument("--show-logs", action="store_true", help="Don't silence monitor logs")
+    return parser.parse_args()
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as infile:
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak for the whole process, the best we can do without procfs
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class RssSampler:
+    """Samples resident memory on a background thread so peaks inside a stage are caught"""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples: T.List[T.Tuple[float, int]] = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="RssSampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            self.samples.append((time.perf_counter(), current_rss()))
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: T.Any) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+    def peak(self, start: float, end: float) -> int:
+        peak = max((rss for when, rss in self.samples if start <= when <= end), default=0)
+        return peak or current_rss()
+
+
+class StageRecorder:
+    """Records when each monitor stage ran by listening in on the stage histogram"""
+
+    def __init__(self) -> None:
+        self.windows: T.List[T.Tuple[str, float, float]] = []
+
+    @contextlib.contextmanager
+    def record(self) -> T.Iterator[None]:
+        observe = STAGE_SECONDS.observe
+
+        def recording_observe(value: float, **labels: str) -> None:
+            end = time.perf_counter()
+            self.windows.append((labels.get("stage", ""), end - value, end))
+            observe(value, **labels)
+
+        STAGE_SECONDS.observe = recording_observe  # type: ignore
+        try:
+            yield
+        finally:
+            del STAGE_SECONDS.observe
+
+    def results(self, sampler: RssSampler, cycles: int) -> StageResults:
+        """Mean seconds and max peak RSS per stage"""
+        results: StageResults = {}
+        for stage, start, end in self.windows:
+            result = results.setdefault(stage, {"seconds": 0.0, "peak_rss_mb": 0.0})
+            result["seconds"] += (end - start) / cycles
+            peak_mb = sampler.peak(start, end) / 1024 / 1024
+            result["peak_rss_mb"] = max(result["peak_rss_mb"], peak_mb)
+        self.windows = []
+        return results
+
+
+class CycleBenchmark:
+    def __init__(
+        self,
+        catalog_size: int,
+        num_clients: int,
+        churn: float,
+        items_per_client: int,
+        use_firestore: bool = True,
+        seed: int = 0,
+        show_logs: bool = False,
+    ) -> None:
+        self.catalog_size = catalog_size
+        self.num_clients = num_clients
+        self.churn = churn
+        self.items_per_client = items_per_client
+        self.use_firestore = use_firestore
+        self.seed = seed
+        self.show_logs = show_logs
+
+    @property
+    def name(self) -> str:
+        return f"catalog={self.catalog_size},clients={self.num_clients},churn={self.churn}"
+
+    @contextlib.contextmanager
+    def _quiet(self) -> T.Iterator[None]:
+        if self.show_logs:
+            yield
+            return
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+            log.flush()
+
+    def _cycle(self, monitor: InventoryMonitor, csv_file: str) -> None:
+        start = time.perf_counter()
+        new_items = monitor.update_inventory(csv_file)
+        if new_items is not None:
+            monitor._check_inventory(new_items)  # pylint: disable=protected-access
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="cycle")
+
+    def run(self, cycles: int) -> StageResults:
+        catalog = make_catalog(self.catalog_size, self.seed)
+        generator = InventoryGenerator(
+            catalog, seed=self.seed, restock_rate=self.churn, depletion_rate=self.churn
+        )
+        clients = make_clients(self.num_clients, catalog, self.items_per_client, self.seed)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_files = []
+            for index, available in enumerate(generator.snapshots(cycles + 1)):
+                csv_files.append(os.path.join(temp_dir, f"inventory_{index}.csv"))
+                generator.write_csv(csv_files[-1], available)
+
+            init_database(temp_dir, BENCHMARK_DB, force=True)
+            try:
+                return self._run_cycles(temp_dir, csv_files, catalog, clients)
+            finally:
+                close_engine(BENCHMARK_DB)
+
+    def _run_cycles(
+        self, temp_dir: str, csv_files: T.List[str], catalog: T.List, clients: T.List
+    ) -> StageResults:
+        backend = MemoryFirestore() if self.use_firestore else None
+        populate_database(clients, catalog)
+        if backend is not None:
+            populate_firestore(backend, clients, catalog)
+
+        recorder = StageRecorder()
+        results: StageResults = {}
+        with self._quiet(), RssSampler() as sampler, recorder.record():
+            monitor = InventoryMonitor(
+                twilio_util=TwilioUtilStub(),
+                admin_email=None,
+                log_dir=temp_dir,
+                credentials_file="",
+                inventory_csv_file=os.path.join(temp_dir, "inventory.csv"),
+                use_local_db=backend is None,
+                firestore_backend=backend,
+            )
+            if backend is not None:
+                backend.flush(timeout=600.0)
+
+            # the first load adds every item to the database, which steady state cycles don't
+            self._cycle(monitor, csv_files[0])
+            for stage, result in recorder.results(sampler, 1).items():
+                results[f"initial_{stage}"] = result
+
+            for csv_file in csv_files[1:]:
+                self._cycle(monitor, csv_file)
+            results.update(recorder.results(sampler, len(csv_files) - 1))
+
+            if monitor.firebase_client is not None:
+                monitor.firebase_client.clients_watcher.unsubscribe()
+
+        return results
+
+
+def find_regressions(
+    results: T.Dict[str, StageResults], baseline: T.Dict[str, StageResults], tolerance: float
+) -> T.List[str]:
+    regressions = []
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            expected = baseline.get(case, {}).get(stage)
+            if not expected:
+                continue
+            for key, min_delta in (
+                ("seconds", MIN_SECONDS_DELTA),
+                ("peak_rss_mb", MIN_RSS_DELTA_MB),
+            ):
+                value, limit = result[key], expected[key] * (1 + tolerance)
+                if value > limit and value - expected[key] > min_delta:
+                    regressions.append(
+                        f"{case} {stage} {key}: {value:.3f} vs baseline {expected[key]:.3f}"
+                    )
+    return regressions
+
+
+def print_results(results: T.Dict[str, StageResults]) -> None:
+    for case, stages in results.items():
+        log.print_bright(case)
+        log.print_bold(f"{'stage':<28}{'seconds':>10}{'peak MB':>10}")
+        for stage, result in sorted(stages.items()):
+            log.print_normal(f"{stage:<28}{result['seconds']:>10.3f}{result['peak_rss_mb']:>10.1f}")
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+
+    results: T.Dict[str, StageResults] = {}
+    for catalog_size, num_clients, churn in itertools.product(
+        args.catalog_sizes, args.clients, args.churn
+    ):
+        benchmark = CycleBenchmark(
+            catalog_size,
+            num_clients,
+            churn,
+            args.items_per_client,
+            use_firestore=not args.no_firestore,
+            seed=args.seed,
+            show_logs=args.show_logs,
+        )
+        log.print_normal_arrow(f"Running {benchmark.name}")
+        results[benchmark.name] = benchmark.run(args.cycles)
+
+    print_results(results)
+
+    if args.json_output:
+        with open(args.json_output, "w") as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline, "r") as infile:
+                baseline = json.load(infile)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as outfile:
+            json.dump(baseline, outfile, indent=4, sort_keys=True)
+        log.print_ok(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.isfile(args.baseline):
+        log.print_warn(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        return
+
+    with open(args.baseline, "r") as infile:
+        baseline = json.load(infile)
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        log.print_fail(f"Regression: {regression}")
+    if regressions:
+        log.flush()
+        sys.exit(1)
+    log.print_ok("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
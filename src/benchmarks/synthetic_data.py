@@ -0,0 +1,378 @@
+"""
+Generate synthetic NC ABC inventory exports and client populations for load testing.
+
+Everything is derived from a seed, so the same arguments always produce the same files.
+Snapshots follow each other with a configurable amount of churn: out of stock items get
+restocked and in stock items sell down or out between downloads.
+"""
+
+import argparse
+import copy
+import csv
+import itertools
+import json
+import os
+import random
+import typing as T
+
+from database.connect import ManagedSession
+from database.models.client import Client, PhoneNumber, TrackingItem
+from database.models.item import Item
+from database.models.item_association import ItemAssociationTable
+from firebase import defs
+from firebase.backend import FirestoreBackend
+from firebase.write_back import MAX_WRITES_PER_BATCH
+from util import log
+from util.file_util import make_sure_path_exists
+
+# the column set of the real export, which also ends every line with a trailing comma
+INVENTORY_COLUMNS = [
+    "NC Code",
+    "Brand Name",
+    "Total Available",
+    "Size",
+    "Cases Per Pallet",
+    "Supplier",
+    "Supplier Allotment",
+    "Broker Name",
+]
+
+BRANDS = ["Blanton's", "Weller", "Eagle Rare", "Old Forester", "Four Roses", "Stagg", "Booker's"]
+STYLES = ["Single Barrel", "Small Batch", "Bottled in Bond", "Cask Strength", "Rye", "Reserve"]
+SIZES = [".05L", ".375L", ".75L", "1.00L", "1.75L"]
+SUPPLIERS = ["Sazerac Co.", "Brown - Forman", "Pernod Ricard USA", "Beam Suntory", "Diageo"]
+BROKERS = ["Rick Henry", "Donavan Campbell", "Jack Wooten", "Mike Yates"]
+TIME_ZONES = ["America/New_York", "America/Chicago", "America/Denver", "America/Los_Angeles"]
+
+
+class CatalogItem(T.NamedTuple):
+    nc_code: str
+    brand_name: str
+    size: str
+    cases_per_pallet: int
+    supplier: str
+    supplier_allotment: int
+    broker_name: str
+
+
+class ClientSpec(T.NamedTuple):
+    id: str
+    email: str
+    phone_numbers: T.List[str]
+    items: T.List[str]
+    tracked_items: T.List[str]
+    threshold_inventory: int
+    min_hours_since_out_of_stock: int
+    alert_range_enabled: bool
+    alert_time_range_start: int
+    alert_time_range_end: int
+    alert_time_zone: str
+    update_on_new_data: bool
+    has_paid: bool
+
+
+def make_catalog(size: int, seed: int = 0) -> T.List[CatalogItem]:
+    rng = random.Random(seed)
+    catalog = []
+    for index in range(size):
+        age = rng.choice(["", f" {rng.randint(4, 23)}Y"])
+        cases_per_pallet = rng.choice([36, 56, 64, 104, 204])
+        catalog.append(
+            CatalogItem(
+                nc_code=f"{index:05d}",
+                brand_name=f"{rng.choice(BRANDS)} {rng.choice(STYLES)}{age} #{index}",
+                size=rng.choice(SIZES),
+                cases_per_pallet=cases_per_pallet,
+                supplier=rng.choice(SUPPLIERS),
+                supplier_allotment=cases_per_pallet * rng.randint(1, 4),
+                broker_name=rng.choice(BROKERS),
+            )
+        )
+    return catalog
+
+
+class InventoryGenerator:
+    """
+    A sequence of inventory snapshots over a fixed catalog. Each step restocks
+    `restock_rate` of the out of stock items and depletes `depletion_rate` of the in stock
+    ones, half of those selling out completely.
+    """
+
+    def __init__(
+        self,
+        catalog: T.List[CatalogItem],
+        seed: int = 0,
+        in_stock_fraction: float = 0.3,
+        restock_rate: float = 0.01,
+        depletion_rate: float = 0.01,
+        max_available: int = 300,
+    ) -> None:
+        self.catalog = catalog
+        self.rng = random.Random(seed)
+        self.restock_rate = restock_rate
+        self.depletion_rate = depletion_rate
+        self.max_available = max_available
+        self.available: T.Dict[str, int] = {
+            item.nc_code: (
+                self.rng.randint(1, max_available) if self.rng.random() < in_stock_fraction else 0
+            )
+            for item in catalog
+        }
+        self.steps = 0
+
+    def step(self) -> T.Dict[str, int]:
+        """Advance to the next snapshot, returning the items that changed"""
+        in_stock = [code for code, available in self.available.items() if available > 0]
+        out_of_stock = [code for code, available in self.available.items() if available == 0]
+
+        changes: T.Dict[str, int] = {}
+        for code in self._pick(out_of_stock, self.restock_rate):
+            changes[code] = self.rng.randint(1, self.max_available)
+        for code in self._pick(in_stock, self.depletion_rate):
+            if self.rng.random() < 0.5:
+                changes[code] = 0
+            else:
+                changes[code] = self.rng.randint(0, self.available[code] - 1)
+
+        self.available.update(changes)
+        self.steps += 1
+        return changes
+
+    def _pick(self, codes: T.List[str], rate: float) -> T.List[str]:
+        count = min(len(codes), int(round(len(codes) * rate)))
+        return self.rng.sample(codes, count)
+
+    def snapshots(self, count: int) -> T.Iterator[T.Dict[str, int]]:
+        """The current inventory followed by `count - 1` steps of churn"""
+        for index in range(count):
+            if index:
+                self.step()
+            yield dict(self.available)
+
+    def write_csv(self, path: str, available: T.Optional[T.Dict[str, int]] = None) -> None:
+        write_inventory_csv(path, self.catalog, available or self.available)
+
+
+def write_inventory_csv(
+    path: str, catalog: T.List[CatalogItem], available: T.Dict[str, int]
+) -> None:
+    """Write an export the way the NC ABC site does, quoted with ="code" and trailing commas"""
+    with open(path, "w", newline="") as outfile:
+        writer = csv.writer(outfile, quoting=csv.QUOTE_ALL, lineterminator=",\n")
+        writer.writerow(INVENTORY_COLUMNS)
+        for item in catalog:
+            row = [
+                item.brand_name,
+                available.get(item.nc_code, 0),
+                item.size,
+                item.cases_per_pallet,
+                item.supplier,
+                item.supplier_allotment,
+                item.broker_name,
+            ]
+            # the code is written as an excel formula so leading zeros survive
+            outfile.write(f'="{item.nc_code}",')
+            writer.writerow(row)
+
+
+def make_clients(
+    num_clients: int,
+    catalog: T.List[CatalogItem],
+    items_per_client: int = 50,
+    seed: int = 0,
+    tracked_fraction: float = 0.9,
+    paid_fraction: float = 0.8,
+) -> T.List[ClientSpec]:
+    """
+    Clients pick items with a skew towards the popular end of the catalog, so a few items
+    are tracked by most clients the way allocated bottles are.
+    """
+    rng = random.Random(seed)
+    codes = [item.nc_code for item in catalog]
+    popularity = list(range(len(codes)))
+    rng.shuffle(popularity)
+    # cumulative, so each draw is a bisect instead of a pass over the catalog
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in popularity))
+    items_per_client = min(items_per_client, len(codes))
+
+    clients = []
+    for index in range(num_clients):
+        items: T.Set[str] = set()
+        while len(items) < items_per_client:
+            items.update(
+                rng.choices(codes, cum_weights=cum_weights, k=items_per_client - len(items))
+            )
+        items_list = sorted(items)
+
+        start = rng.randrange(6 * 60, 12 * 60, 15)
+        clients.append(
+            ClientSpec(
+                id=f"client{index:06d}@example.com",
+                email=f"client{index:06d}@example.com",
+                phone_numbers=[f"+1555{index:07d}"],
+                items=items_list,
+                tracked_items=[code for code in items_list if rng.random() < tracked_fraction],
+                threshold_inventory=rng.choice([1, 1, 1, 2, 5, 10]),
+                min_hours_since_out_of_stock=rng.choice([0, 0, 0, 12, 24, 72]),
+                alert_range_enabled=rng.random() < 0.5,
+                alert_time_range_start=start,
+                alert_time_range_end=start + rng.randrange(4 * 60, 14 * 60, 15),
+                alert_time_zone=rng.choice(TIME_ZONES),
+                update_on_new_data=rng.random() < 0.7,
+                has_paid=rng.random() < paid_fraction,
+            )
+        )
+    return clients
+
+
+def populate_database(
+    clients: T.List[ClientSpec],
+    catalog: T.List[CatalogItem],
+    available: T.Optional[T.Dict[str, int]] = None,
+) -> None:
+    """Bulk insert the catalog and clients into the current database"""
+    available = available or {}
+    item_rows = [
+        {
+            "id": item.nc_code,
+            "brand_name": item.brand_name,
+            "total_available": available.get(item.nc_code, 0),
+            "size": item.size,
+            "cases_per_pallet": item.cases_per_pallet,
+            "supplier": item.supplier,
+            "supplier_allotment": item.supplier_allotment,
+            "broker_name": item.broker_name,
+        }
+        for item in catalog
+    ]
+
+    client_rows = []
+    phone_rows = []
+    association_rows = []
+    tracking_rows = []
+    for client in clients:
+        client_rows.append(
+            {
+                "id": client.id,
+                "email": client.email,
+                "threshold_inventory": client.threshold_inventory,
+                "min_hours_since_out_of_stock": client.min_hours_since_out_of_stock,
+                "alert_range_enabled": client.alert_range_enabled,
+                "alert_time_range_start": client.alert_time_range_start,
+                "alert_time_range_end": client.alert_time_range_end,
+                "alert_time_zone": client.alert_time_zone,
+                "update_on_new_data": client.update_on_new_data,
+                "has_paid": client.has_paid,
+            }
+        )
+        phone_rows.extend({"client_id": client.id, "number": n} for n in client.phone_numbers)
+        association_rows.extend({"client_id": client.id, "item_id": c} for c in client.items)
+        tracking_rows.extend({"client_id": client.id, "nc_code": c} for c in client.tracked_items)
+
+    with ManagedSession() as db:
+        for table, rows in (
+            (Item.__table__, item_rows),
+            (Client.__table__, client_rows),
+            (PhoneNumber.__table__, phone_rows),
+            (ItemAssociationTable, association_rows),
+            (TrackingItem.__table__, tracking_rows),
+        ):
+            if rows:
+                db.execute(table.insert(), rows)
+
+
+def client_document(
+    client: ClientSpec, brand_names: T.Dict[str, str], available: T.Dict[str, int]
+) -> defs.Client:
+    """The firestore document the web app would have written for a client"""
+    doc = copy.deepcopy(defs.NULL_CLIENT)
+    doc["accounting"]["hasPaid"] = client.has_paid
+    doc["inventory"]["inventoryChange"] = client.threshold_inventory
+    doc["inventory"]["min_hours_since_out_of_stock"] = client.min_hours_since_out_of_stock
+    tracked = set(client.tracked_items)
+    doc["inventory"]["items"] = {
+        nc_code: {
+            "name": brand_names.get(nc_code, ""),
+            "available": available.get(nc_code, 0),
+            "action": (
+                defs.Actions.TRACKING.value
+                if nc_code in tracked
+                else defs.Actions.NOT_TRACKING.value
+            ),
+        }
+        for nc_code in client.items
+    }
+
+    preferences = doc["preferences"]
+    preferences["updateOnNewData"] = client.update_on_new_data
+    preferences["notifications"]["email"]["email"] = client.email
+    sms = preferences["notifications"]["sms"]
+    sms["phoneNumbers"] = {str(i): number for i, number in enumerate(client.phone_numbers)}
+    sms["alertWindowEnabled"] = client.alert_range_enabled
+    sms["alertTimeRange"] = [client.alert_time_range_start, client.alert_time_range_end]
+    sms["alertTimeZone"]["value"] = client.alert_time_zone
+    return doc
+
+
+def populate_firestore(
+    backend: FirestoreBackend,
+    clients: T.List[ClientSpec],
+    catalog: T.List[CatalogItem],
+    available: T.Optional[T.Dict[str, int]] = None,
+) -> None:
+    """Write a client document per client, matching what populate_database inserts"""
+    available = available or {}
+    brand_names = {item.nc_code: item.brand_name for item in catalog}
+    clients_ref = backend.collection("clients")
+    batch = backend.batch()
+    for client in clients:
+        batch.set(clients_ref.document(client.id), client_document(client, brand_names, available))
+        if len(batch) == MAX_WRITES_PER_BATCH:
+            batch.commit()
+            batch = backend.batch()
+    batch.commit()
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--catalog-size", type=int, default=10000, help="Items in the export")
+    parser.add_argument("--snapshots", type=int, default=10, help="Exports to write")
+    parser.add_argument("--in-stock-fraction", type=float, default=0.3)
+    parser.add_argument("--restock-rate", type=float, default=0.01, help="Per snapshot")
+    parser.add_argument("--depletion-rate", type=float, default=0.01, help="Per snapshot")
+    parser.add_argument("--clients", type=int, default=1000, help="Clients to generate")
+    parser.add_argument("--items-per-client", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+    make_sure_path_exists(args.output_dir)
+
+    catalog = make_catalog(args.catalog_size, args.seed)
+    generator = InventoryGenerator(
+        catalog,
+        seed=args.seed,
+        in_stock_fraction=args.in_stock_fraction,
+        restock_rate=args.restock_rate,
+        depletion_rate=args.depletion_rate,
+    )
+    for index, available in enumerate(generator.snapshots(args.snapshots)):
+        path = os.path.join(args.output_dir, f"inventory_{index:04d}.csv")
+        generator.write_csv(path, available)
+    log.print_ok(f"Wrote {args.snapshots} exports of {len(catalog)} items to {args.output_dir}")
+
+    clients = make_clients(args.clients, catalog, args.items_per_client, args.seed)
+    clients_file = os.path.join(args.output_dir, "clients.json")
+    with open(clients_file, "w") as outfile:
+        json.dump([client._asdict() for client in clients], outfile)
+    log.print_ok(f"Wrote {len(clients)} clients to {clients_file}")
+
+
+if __name__ == "__main__":
+    main()
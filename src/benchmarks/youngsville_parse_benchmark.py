@@ -0,0 +1,96 @@
+"""
+Benchmark the store item list parsers on a generated ItemList.aspx page.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import typing as T
+
+from util import log
+from youngsville_parser import available_parsers, get_parser
+
+ROW_TEMPLATE = (
+    '<tr class="item-row"><td><div class="c-img"><img src="/img/{code}.jpg"/></div></td>'
+    '<td><div class="c-cd">{code}</div></td>'
+    '<td><div class="c-nm">{name} [{available} available] <span class="sz">750ml</span></div>'
+    "</td></tr>\n"
+)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("--rows", type=int, default=10000, help="Items on the page")
+    # the first parser listed is the baseline for the speedup column
+    parser.add_argument("--parsers", type=str, nargs="+", default=available_parsers()[::-1])
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per parser")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fixture", type=str, default="", help="Page to parse, generated if it doesn't exist"
+    )
+    parser.add_argument("--json-output", type=str, default="", help="Write results to file")
+    return parser.parse_args()
+
+
+def make_item_list_page(rows: int, seed: int = 0, first_code: int = 0, footer: str = "") -> str:
+    rng = random.Random(seed)
+    body = "".join(
+        ROW_TEMPLATE.format(
+            code=f"{first_code + index:05d}",
+            name=f"Brand {rng.randint(0, 99999)} Bourbon Whiskey",
+            available=rng.choice([0, 0, rng.randint(1, 200)]),
+        )
+        for index in range(rows)
+    )
+    return (
+        "<html><head><title>Item List</title></head><body><form><table>\n"
+        "<tr><th></th><th>Code</th><th>Item</th></tr>\n"
+        f"{body}</table>{footer}</form></body></html>"
+    )
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+
+    fixture = args.fixture or os.path.join(tempfile.gettempdir(), f"item_list_{args.rows}.html")
+    if not os.path.isfile(fixture):
+        log.print_normal(f"Writing {args.rows} row fixture to {fixture}")
+        with open(fixture, "w") as outfile:
+            outfile.write(make_item_list_page(args.rows, args.seed))
+
+    with open(fixture, "r") as infile:
+        html_content = infile.read()
+
+    log.print_bright(f"Parsing {len(html_content) / 1e6:.1f}MB page from {fixture}")
+    log.print_bold(f"{'parser':<12}{'seconds':>10}{'rows':>10}{'speedup':>10}")
+
+    results: T.Dict[str, float] = {}
+    baseline = None
+    for name in args.parsers:
+        parser = get_parser(name)
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            inventory = parser.parse(html_content)
+            timings.append(time.perf_counter() - start)
+
+        results[name] = min(timings)
+        baseline = baseline or results[name]
+        log.print_normal(
+            f"{name:<12}{results[name]:>10.3f}{len(inventory):>10}"
+            f"{baseline / results[name]:>10.2f}"
+        )
+
+    if args.json_output:
+        with open(args.json_output, "w") as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
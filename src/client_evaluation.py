@@ -0,0 +1,264 @@
+"""
+Sharded client evaluation. The inventory is written once per cycle to a memory mapped
+snapshot file, clients are partitioned by a stable hash of their id across a process pool
+and each worker returns alert intents. Alerts are a filter of the cycle's restock events by
+each client's tracked items, the snapshot is only used to find the tracked items that are
+missing or out of stock. The parent keeps ownership of the database writes and alert
+dispatch.
+
+This module is imported by the pool workers, so it sticks to numpy and the standard library.
+"""
+
+import concurrent.futures
+import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import typing as T
+import zlib
+
+import numpy as np
+
+if T.TYPE_CHECKING:
+    from restock_events import RestockEvent
+
+SNAPSHOT_FIELDS = [
+    ("available", "i8"),
+    ("present", "?"),
+]
+
+# snapshots mapped by this process, keyed by path
+_SNAPSHOTS: T.Dict[str, np.ndarray] = {}
+
+
+class ClientRecord(T.NamedTuple):
+    id: str
+    tracked_nc_codes: T.Tuple[str, ...]
+    threshold_inventory: int
+    min_hours_since_out_of_stock: int
+
+    @classmethod
+    def from_schema(cls, client: T.Dict[str, T.Any]) -> "ClientRecord":
+        tracked = {t["nc_code"] for t in client["tracked_items"]}
+        return cls(
+            id=client["id"],
+            tracked_nc_codes=tuple(i["id"] for i in client["items"] if i["id"] in tracked),
+            threshold_inventory=client["threshold_inventory"] or 0,
+            min_hours_since_out_of_stock=client["min_hours_since_out_of_stock"] or 0,
+        )
+
+
+class AlertIntent(T.NamedTuple):
+    client_id: str
+    # (nc_code, total_available) for every item that should be alerted on
+    items: T.Tuple[T.Tuple[str, int], ...]
+
+
+class EvaluationResult(T.NamedTuple):
+    alerts: T.List[AlertIntent]
+    # tracked items that are no longer in the inventory
+    missing_nc_codes: T.Set[str]
+    # tracked items that are in the inventory with nothing available
+    out_of_stock_nc_codes: T.Set[str]
+
+    @classmethod
+    def empty(cls) -> "EvaluationResult":
+        return cls([], set(), set())
+
+    def merge(self, other: "EvaluationResult") -> None:
+        self.alerts.extend(other.alerts)
+        self.missing_nc_codes.update(other.missing_nc_codes)
+        self.out_of_stock_nc_codes.update(other.out_of_stock_nc_codes)
+
+
+def restock_skip_reason(
+    event: "RestockEvent", client: ClientRecord, now: datetime.datetime
+) -> T.Optional[str]:
+    """Why a client isn't alerted on the restock of an item they track, None if they are"""
+    if event.delta < client.threshold_inventory:
+        return f"{event.nc_code} is below inventory threshold of {client.threshold_inventory}"
+
+    if client.min_hours_since_out_of_stock != 0:
+        hours_out_of_stock = event.hours_out_of_stock(now)
+        if (
+            hours_out_of_stock is not None
+            and hours_out_of_stock <= client.min_hours_since_out_of_stock
+        ):
+            return (
+                f"{event.nc_code} was out of stock for {hours_out_of_stock:.1f}h, inside of the "
+                f"{client.min_hours_since_out_of_stock}h out of stock window"
+            )
+
+    return None
+
+
+def restock_alerts(
+    restocks: T.Mapping[str, "RestockEvent"], client: ClientRecord, now: datetime.datetime
+) -> T.Tuple[T.Tuple[str, int], ...]:
+    """(nc_code, total_available) for the restocked items the client should be alerted on"""
+    alerts = []
+    for nc_code in client.tracked_nc_codes:
+        event = restocks.get(nc_code)
+        if event is not None and restock_skip_reason(event, client, now) is None:
+            alerts.append((nc_code, event.available))
+    return tuple(alerts)
+
+
+def write_snapshot(path: str, inventory: T.Any, code_key: str) -> int:
+    """Write the inventory as a sorted structured array that workers can memory map"""
+    if inventory is None or inventory.empty:
+        nc_codes: T.List[str] = []
+        available: T.List[int] = []
+    else:
+        inventory = inventory.drop_duplicates(subset=code_key, keep="first").sort_values(code_key)
+        nc_codes = inventory[code_key].astype(str).tolist()
+        available = inventory["total_available"].astype("int64").tolist()
+
+    width = max([len(nc_code) for nc_code in nc_codes] + [1])
+    dtype = np.dtype([("nc_code", f"U{width}")] + SNAPSHOT_FIELDS)
+
+    snapshot = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(len(nc_codes),))
+    if nc_codes:
+        snapshot["nc_code"] = nc_codes
+        snapshot["available"] = available
+        snapshot["present"] = True
+
+    snapshot.flush()
+    del snapshot
+    return len(nc_codes)
+
+
+def load_snapshot(path: str) -> np.ndarray:
+    snapshot = _SNAPSHOTS.get(path)
+    if snapshot is None:
+        # each cycle writes a new file, so only the latest one is worth keeping mapped
+        _SNAPSHOTS.clear()
+        snapshot = np.load(path, mmap_mode="r")
+        _SNAPSHOTS[path] = snapshot
+    return snapshot
+
+
+def evaluate_clients(
+    snapshot: np.ndarray,
+    clients: T.Iterable[ClientRecord],
+    restocks: T.Mapping[str, "RestockEvent"],
+    now: datetime.datetime,
+) -> EvaluationResult:
+    """
+    Batched equivalent of InventoryMonitor.check_client_inventory: find the tracked items
+    that are missing from or out of stock in the inventory, and alert on the restocks
+    that pass restock_skip_reason.
+    """
+    result = EvaluationResult.empty()
+    nc_codes = snapshot["nc_code"]
+
+    for client in clients:
+        if not client.tracked_nc_codes:
+            continue
+
+        items = restock_alerts(restocks, client, now)
+        if items:
+            result.alerts.append(AlertIntent(client.id, items))
+
+        if len(nc_codes) == 0:
+            result.missing_nc_codes.update(client.tracked_nc_codes)
+            continue
+
+        wanted = np.asarray(client.tracked_nc_codes, dtype=nc_codes.dtype)
+        positions = np.minimum(np.searchsorted(nc_codes, wanted), len(nc_codes) - 1)
+        rows = snapshot[positions]
+        present = (rows["nc_code"] == wanted) & rows["present"]
+
+        result.missing_nc_codes.update(wanted[~present].tolist())
+        result.out_of_stock_nc_codes.update(wanted[present & (rows["available"] == 0)].tolist())
+
+    return result
+
+
+def evaluate_shard(
+    snapshot_path: str,
+    clients: T.List[ClientRecord],
+    restocks: T.Mapping[str, "RestockEvent"],
+    now: datetime.datetime,
+) -> EvaluationResult:
+    return evaluate_clients(load_snapshot(snapshot_path), clients, restocks, now)
+
+
+def shard_for(client_id: str, num_shards: int) -> int:
+    # stable across processes and runs, unlike hash()
+    return zlib.crc32(client_id.encode("utf-8")) % num_shards
+
+
+def shard_clients(
+    clients: T.Iterable[ClientRecord], num_shards: int
+) -> T.List[T.List[ClientRecord]]:
+    shards: T.List[T.List[ClientRecord]] = [[] for _ in range(num_shards)]
+    for client in clients:
+        shards[shard_for(client.id, num_shards)].append(client)
+    return shards
+
+
+class ShardedEvaluator:
+    # below this many clients per worker the pool overhead outweighs the parallelism
+    MIN_CLIENTS_PER_SHARD = 64
+
+    def __init__(self, num_workers: int, min_clients_per_shard: int = MIN_CLIENTS_PER_SHARD):
+        self.num_workers = max(1, num_workers)
+        self.min_clients_per_shard = min_clients_per_shard
+        self.snapshot_dir = tempfile.mkdtemp(prefix="inventory_snapshot_")
+        self.generation = 0
+        self.pool: T.Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self.pool is None:
+            # the parent runs firestore listener threads, which don't survive a fork
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.pool
+
+    def write_snapshot(self, inventory: T.Any, code_key: str) -> str:
+        previous_path = self._snapshot_path()
+        self.generation += 1
+        path = self._snapshot_path()
+        write_snapshot(path, inventory, code_key)
+
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+        return path
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.snapshot_dir, f"inventory_{self.generation}.npy")
+
+    def evaluate(
+        self,
+        snapshot_path: str,
+        clients: T.List[ClientRecord],
+        restocks: T.Mapping[str, "RestockEvent"],
+        now: datetime.datetime,
+    ) -> EvaluationResult:
+        num_shards = min(self.num_workers, len(clients) // self.min_clients_per_shard)
+        if num_shards <= 1:
+            return evaluate_shard(snapshot_path, clients, restocks, now)
+
+        pool = self._get_pool()
+        # the events are few, each worker gets its own copy with its shard
+        restocks = dict(restocks)
+        futures = [
+            pool.submit(evaluate_shard, snapshot_path, shard, restocks, now)
+            for shard in shard_clients(clients, num_shards)
+            if shard
+        ]
+
+        result = EvaluationResult.empty()
+        for future in futures:
+            result.merge(future.result())
+        return result
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        _SNAPSHOTS.clear()
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
@@ -4,16 +4,27 @@ import typing as T
 from contextlib import contextmanager
 
 import dotenv
+from sqlalchemy import select
 from sqlalchemy.sql import func
 
 from database.connect import ManagedSession
-from database.models.client import Client, PhoneNumber, TrackingItem
-from database.models.item import Item, ItemSchema
+from database.models.client import Client, PhoneNumber, SourceSubscription, TrackingItem
+from database.models.item import Item
+from database.models.item_association import ItemAssociationTable
+from database.records import ClientRow, ItemRow, PhoneNumberRow, SubscriptionRow, TrackingItemRow
 from util import log
 
 dotenv.load_dotenv(".env")
 DEFAULT_DB = os.environ.get("DEFAULT_DB", "client.db")
 
+# keep the IN (...) clause under sqlite's bound parameter limit
+MAX_QUERY_PARAMS = 500
+
+
+class ItemStock(T.NamedTuple):
+    brand_name: T.Optional[str]
+    total_available: T.Optional[int]
+
 
 class ClientDb:
     @staticmethod
@@ -70,6 +81,44 @@ class ClientDb:
             clients = [c.id for c in clients_db]
         return clients
 
+    @staticmethod
+    def get_clients() -> T.Dict[str, ClientRow]:
+        """Every client with its phone numbers, items, tracked items and subscriptions"""
+        with ManagedSession() as db:
+            clients = {
+                row.id: ClientRow(
+                    *row, phone_numbers=[], items=[], tracked_items=[], subscriptions=[]
+                )
+                for row in db.execute(select(Client.__table__))
+            }
+
+            for model, record, attribute in (
+                (PhoneNumber, PhoneNumberRow, "phone_numbers"),
+                (TrackingItem, TrackingItemRow, "tracked_items"),
+                (SourceSubscription, SubscriptionRow, "subscriptions"),
+            ):
+                for row in db.execute(select(model.__table__)):
+                    client = clients.get(row.client_id)
+                    if client is not None:
+                        getattr(client, attribute).append(record(*row))
+
+            # items are shared between clients, so each one is only built once
+            items: T.Dict[str, ItemRow] = {}
+            rows = db.execute(
+                select(ItemAssociationTable.c.client_id, Item.__table__).join_from(
+                    ItemAssociationTable, Item.__table__, ItemAssociationTable.c.item_id == Item.id
+                )
+            )
+            for client_id, *item in rows:
+                client = clients.get(client_id)
+                if client is None:
+                    continue
+                if item[0] not in items:
+                    items[item[0]] = ItemRow(*item)
+                client.items.append(items[item[0]])
+
+        return clients
+
     @staticmethod
     def add_track_item(name: str, nc_code: str, do_track: bool = True) -> None:
         with ManagedSession() as db:
@@ -132,6 +181,7 @@ class ClientDb:
                 return
 
             db.query(TrackingItem).filter(TrackingItem.client_id == client.id).delete()
+            db.query(SourceSubscription).filter(SourceSubscription.client_id == client.id).delete()
             db.query(Client).filter(Client.id == name).delete()
 
     @staticmethod
@@ -255,7 +305,95 @@ class ClientDb:
         ClientDb.add_track_item(client, nc_code, True)
 
     @staticmethod
-    def all_items() -> T.Dict[str, ItemSchema]:
+    def all_items() -> T.Dict[str, ItemRow]:
+        with ManagedSession() as db:
+            return {row.id: ItemRow(*row) for row in db.execute(select(Item.__table__))}
+
+    @staticmethod
+    def get_item_stock(nc_codes: T.Iterable[str]) -> T.Dict[str, ItemStock]:
+        nc_codes = list(nc_codes)
+        stock = {}
+        with ManagedSession() as db:
+            for start in range(0, len(nc_codes), MAX_QUERY_PARAMS):
+                rows = (
+                    db.query(Item.id, Item.brand_name, Item.total_available)
+                    .filter(Item.id.in_(nc_codes[start : start + MAX_QUERY_PARAMS]))
+                    .all()
+                )
+                for nc_code, brand_name, total_available in rows:
+                    stock[nc_code] = ItemStock(brand_name, total_available)
+        return stock
+
+    @staticmethod
+    def get_out_of_stock_times(
+        nc_codes: T.Iterable[str],
+    ) -> T.Dict[str, T.Optional[datetime.datetime]]:
+        nc_codes = list(nc_codes)
+        out_of_stock_times = {}
+        with ManagedSession() as db:
+            for start in range(0, len(nc_codes), MAX_QUERY_PARAMS):
+                rows = (
+                    db.query(Item.id, Item.out_of_stock_time)
+                    .filter(Item.id.in_(nc_codes[start : start + MAX_QUERY_PARAMS]))
+                    .all()
+                )
+                for nc_code, out_of_stock_time in rows:
+                    out_of_stock_times[nc_code] = out_of_stock_time
+        return out_of_stock_times
+
+    @staticmethod
+    def set_last_updated(clients: T.Iterable[str], last_updated: datetime.datetime) -> None:
+        clients = list(clients)
+        with ManagedSession() as db:
+            for start in range(0, len(clients), MAX_QUERY_PARAMS):
+                db.query(Client).filter(
+                    Client.id.in_(clients[start : start + MAX_QUERY_PARAMS])
+                ).update({Client.last_updated: last_updated}, synchronize_session=False)
+
+    @staticmethod
+    def subscribe_to_source(name: str, source: str) -> None:
+        with ManagedSession() as db:
+            client = db.query(Client).filter(Client.id == name).first()
+            if client is None:
+                return
+            subscription = (
+                db.query(SourceSubscription)
+                .filter(SourceSubscription.client_id == name)
+                .filter(SourceSubscription.source == source)
+                .first()
+            )
+            if subscription is None:
+                log.print_ok_arrow(f"Subscribed {name} to {source}")
+                db.add(SourceSubscription(client_id=name, source=source))
+
+    @staticmethod
+    def set_source_subscriptions(name: str, sources: T.Iterable[str]) -> None:
+        """Subscribe the client to exactly these sources"""
+        sources = set(sources)
+        with ManagedSession() as db:
+            subscribed = {
+                s.source
+                for s in db.query(SourceSubscription).filter(SourceSubscription.client_id == name)
+            }
+        for source in sorted(sources - subscribed):
+            ClientDb.subscribe_to_source(name, source)
+        for source in sorted(subscribed - sources):
+            log.print_ok_arrow(f"Unsubscribed {name} from {source}")
+            ClientDb.unsubscribe_from_source(name, source)
+
+    @staticmethod
+    def unsubscribe_from_source(name: str, source: str) -> None:
         with ManagedSession() as db:
-            items = db.query(Item).all()
-            return {i.id: ItemSchema().dump(i) for i in items}
+            db.query(SourceSubscription).filter(SourceSubscription.client_id == name).filter(
+                SourceSubscription.source == source
+            ).delete()
+
+    @staticmethod
+    def get_source_subscribers(source: str) -> T.List[str]:
+        with ManagedSession() as db:
+            rows = (
+                db.query(SourceSubscription.client_id)
+                .filter(SourceSubscription.source == source)
+                .all()
+            )
+            return [client_id for (client_id,) in rows]
@@ -10,6 +10,7 @@ from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.scoping import ScopedSession
 from sqlalchemy_utils import database_exists
 
+from util import metrics
 from util.file_util import make_sure_path_exists
 
 ENGINE: T.Dict[str, Engine] = {}
@@ -17,6 +18,8 @@ THREAD_SAFE_SESSION_FACTORY: T.Dict[str, ScopedSession] = {}
 
 Base = declarative_base(name="Base")
 
+DB_COMMITS = metrics.REGISTRY.counter("inventory_monitor_db_commits_total", "Database commits")
+
 
 def get_table_name(base_name: str, verbose: bool = False) -> str:
     if verbose:
@@ -94,6 +97,7 @@ def ManagedSession(  # pylint: disable=invalid-name
         yield session
         session.commit()
         session.flush()
+        DB_COMMITS.inc()
     except Exception:
         session.rollback()
         # When an exception occurs, handle session session cleaning,
@@ -46,6 +46,19 @@ def get_credentials_file() -> str:
     return os.path.join(top_dir, credentials_file)
 
 
+def build_inventory_items(
+    inventory: T.Iterable[T.Tuple[str, str, int]],
+) -> T.Dict[str, T.Dict[str, T.Any]]:
+    db_data: T.Dict[str, T.Dict[str, T.Any]] = {"inventory": {"items": {}}}
+    for nc_code, brand_name, inventory_available in inventory:
+        db_data["inventory"]["items"][nc_code] = {
+            "name": brand_name,
+            "available": inventory_available,
+            "action": Actions.TRACKING.value,
+        }
+    return db_data
+
+
 def main() -> None:
     args: argparse.Namespace = parse_args()
 
@@ -76,14 +89,7 @@ def main() -> None:
 
     log.print_bright(f"Adding {len(inventory)} inventory to firebase...")
 
-    db_data = {"inventory": {"items": {}}}
-    for item in track(inventory, description="Inventory", total=len(inventory)):
-        nc_code, brand_name, inventory_available = item
-        db_data["inventory"]["items"][nc_code] = {
-            "name": brand_name,
-            "available": inventory_available,
-            "action": Actions.TRACKING.value,
-        }
+    db_data = build_inventory_items(track(inventory, description="Inventory", total=len(inventory)))
     monitor.firebase_client.add_items_to_firebase(args.client, db_data)
 
 
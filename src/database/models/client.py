@@ -45,6 +45,16 @@ class TrackingItemSchema(Schema):  # type: ignore
         return TrackingItem(**data)
 
 
+class SourceSubscription(Base):
+    __tablename__ = "SourceSubscription"
+
+    id = Column(types.Integer, primary_key=True)
+    client_id = Column(types.String(80), ForeignKey("Client.id"))
+    source = Column(types.String(80), nullable=False)
+
+    __table_args__ = (UniqueConstraint("client_id", "source", name="_client_source_uc"),)
+
+
 class Client(Base):
     __tablename__ = "Client"
 
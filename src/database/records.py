@@ -0,0 +1,115 @@
+"""
+Plain records for the rows the monitor reads every cycle. They are built straight from
+SQLAlchemy Core rows, skipping the ORM and marshmallow, and support the same
+record["field"] lookups as the schema dumps they replace. The schemas are still used where
+data crosses an API boundary.
+"""
+
+import datetime
+import typing as T
+
+from database.models.client import Client, PhoneNumber, SourceSubscription, TrackingItem
+from database.models.item import Item
+
+
+def _column_names(model: T.Any) -> T.Tuple[str, ...]:
+    return tuple(column.name for column in model.__table__.columns)
+
+
+class Record:
+    __slots__: T.Tuple[str, ...] = ()
+
+    def __init__(self, *args: T.Any, **kwargs: T.Any) -> None:
+        values = dict(zip(self.__slots__, args), **kwargs)
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __getitem__(self, name: str) -> T.Any:
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name: str, default: T.Any = None) -> T.Any:
+        return getattr(self, name, default)
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+# the slots come from the tables, the annotations mirror them for type checkers and
+# records_test checks that the two agree
+
+
+class ItemRow(Record):
+    __slots__ = _column_names(Item)
+
+    id: str
+    brand_name: T.Optional[str]
+    total_available: T.Optional[int]
+    size: T.Optional[str]
+    cases_per_pallet: T.Optional[int]
+    supplier: T.Optional[str]
+    supplier_allotment: T.Optional[int]
+    broker_name: T.Optional[str]
+    out_of_stock_time: T.Optional[datetime.datetime]
+    created_at: T.Optional[datetime.datetime]
+
+
+class PhoneNumberRow(Record):
+    __slots__ = _column_names(PhoneNumber)
+
+    id: int
+    client_id: str
+    number: str
+
+
+class TrackingItemRow(Record):
+    __slots__ = _column_names(TrackingItem)
+
+    id: int
+    client_id: str
+    nc_code: str
+
+
+class SubscriptionRow(Record):
+    __slots__ = _column_names(SourceSubscription)
+
+    id: int
+    client_id: str
+    source: str
+
+
+class ClientRow(Record):
+    __slots__ = _column_names(Client) + ("phone_numbers", "items", "tracked_items", "subscriptions")
+
+    id: str
+    email: str
+    email_alerts: T.Optional[bool]
+    update_on_new_data: T.Optional[bool]
+    enable_new_data_sms_alert: T.Optional[bool]
+    enable_new_data_email_alert: T.Optional[bool]
+    alert_time_range_start: T.Optional[int]
+    alert_time_range_end: T.Optional[int]
+    alert_time_zone: T.Optional[str]
+    alert_range_enabled: T.Optional[bool]
+    phone_alerts: T.Optional[bool]
+    threshold_inventory: T.Optional[int]
+    last_updated: T.Optional[datetime.datetime]
+    updates_sent: T.Optional[int]
+    plan: T.Optional[str]
+    next_billing_date: T.Optional[datetime.datetime]
+    next_billing_amount: T.Optional[float]
+    has_paid: T.Optional[bool]
+    min_hours_since_out_of_stock: T.Optional[int]
+    created_at: T.Optional[datetime.datetime]
+    phone_numbers: T.List[PhoneNumberRow]
+    items: T.List[ItemRow]
+    tracked_items: T.List[TrackingItemRow]
+    subscriptions: T.List[SubscriptionRow]
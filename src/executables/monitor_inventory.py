@@ -4,16 +4,20 @@ Monitor the inventory of the store
 
 import argparse
 import os
+import sys
 import typing as T
 
 import dotenv
 
+from alerts.push import PushServer
 from database.client import DEFAULT_DB
 from database.connect import init_database
 from database.models.client import Client
 from inventory_monitor import InventoryMonitor
+from inventory_sources.base import InventorySource
 from util import log
 from util.email import Email
+from util.metrics import MetricsServer
 from util.twilio_util import TwilioUtil
 
 
@@ -33,6 +37,19 @@ def parse_args() -> argparse.Namespace:
         default="INFO",
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
     )
+    parser.add_argument(
+        "--log-format",
+        type=str,
+        default="text",
+        choices=["text", "json"],
+        help="Write the log file as text lines or as JSON lines",
+    )
+    parser.add_argument(
+        "--item-log-sample-every",
+        type=int,
+        default=1,
+        help="Only log every Nth per-item line in a cycle",
+    )
     parser.add_argument("--use-local-db", action="store_true", help="Use local database")
     parser.add_argument(
         "--dry-run",
@@ -56,7 +73,19 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--log-rotate",
         action="store_true",
-        help="Rotate the logs and tar them up",
+        help="Rotate the log file in compressed segments, compressing old logs in the background",
+    )
+    parser.add_argument(
+        "--log-max-mb", type=float, default=50.0, help="Start a new log segment at this size"
+    )
+    parser.add_argument(
+        "--log-rotate-hours", type=float, default=24.0, help="Start a new log segment this often"
+    )
+    parser.add_argument(
+        "--log-retention-mb",
+        type=float,
+        default=1024.0,
+        help="Delete the oldest compressed segments past this total size",
     )
     parser.add_argument(
         "--enable-alarm",
@@ -64,6 +93,50 @@ def parse_args() -> argparse.Namespace:
         help="Enable sms alerts when crashes occur",
     )
 
+    parser.add_argument(
+        "--evaluation-workers",
+        type=int,
+        default=0,
+        help="Evaluate clients across this many processes (0 evaluates them in process)",
+    )
+    parser.add_argument(
+        "--use-asyncio",
+        action="store_true",
+        help="Run the monitor on the asyncio runtime",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve prometheus metrics on this local port (0 disables it)",
+    )
+    parser.add_argument(
+        "--enable-metrics-file",
+        action="store_true",
+        help="Periodically append the metrics to a rolling file in the log dir",
+    )
+
+    parser.add_argument(
+        "--push-port",
+        type=int,
+        default=0,
+        help="Push restock events as server-sent events on this local port (0 disables it)",
+    )
+    parser.add_argument(
+        "--webhook-url",
+        action="append",
+        default=[],
+        help="POST restock events to this url, signed with RESTOCK_WEBHOOK_SECRET. Repeatable",
+    )
+
+    parser.add_argument(
+        "--youngsville-poll-interval",
+        type=int,
+        default=0,
+        help="Also poll the Youngsville ABC store this often in seconds (0 disables it)",
+    )
+
     parser.add_argument(
         "--allowlist-clients",
         type=str,
@@ -99,19 +172,47 @@ def get_credentials_file() -> str:
     return os.path.join(top_dir, "config", credentials_file)
 
 
+def get_sources(args: argparse.Namespace) -> T.List[InventorySource]:
+    sources: T.List[InventorySource] = []
+    if args.youngsville_poll_interval > 0:
+        from inventory_sources.youngsville import YoungsvilleSource
+
+        sources.append(
+            YoungsvilleSource(
+                username=os.environ.get("YOUNGSVILLE_ABC_USERNAME", ""),
+                password=os.environ.get("YOUNGSVILLE_ABC_PASSWORD", ""),
+                poll_interval=args.youngsville_poll_interval,
+                cookie_file=os.path.join(args.log_dir, "youngsville_cookies.json"),
+            )
+        )
+    return sources
+
+
 def main() -> None:
     args: argparse.Namespace = parse_args()
 
     dotenv.load_dotenv(".env")
 
+    webhook_secret = os.environ.get("RESTOCK_WEBHOOK_SECRET", "")
+    if args.webhook_url and not webhook_secret:
+        log.print_fail("--webhook-url needs RESTOCK_WEBHOOK_SECRET to sign the requests")
+        sys.exit(1)
+
     PIDFILE = os.environ.get("BOT_PIDFILE", "monitor_inventory.pid")
 
     with open(PIDFILE, "w") as outfile:
         outfile.write(str(os.getpid()))
 
-    if args.log_rotate:
-        log.tar_logs(args.log_dir, "monitor_inventory", remove_after=True)
-    log.setup_log(args.log_level, args.log_dir, "db_convert")
+    log.setup_log(
+        args.log_level,
+        args.log_dir,
+        "db_convert",
+        json_format=args.log_format == "json",
+        rotate=args.log_rotate,
+        max_bytes=int(args.log_max_mb * 1024 * 1024),
+        rotate_seconds=args.log_rotate_hours * 60 * 60,
+        max_total_bytes=int(args.log_retention_mb * 1024 * 1024),
+    )
 
     init_database(args.log_dir, DEFAULT_DB, args.force_update)
 
@@ -125,7 +226,13 @@ def main() -> None:
 
     email_accounts = get_email_accounts()
 
-    monitor: InventoryMonitor = InventoryMonitor(
+    monitor_class = InventoryMonitor
+    if args.use_asyncio:
+        # aiohttp is only needed on the asyncio runtime
+        from async_inventory_monitor import AsyncInventoryMonitor
+
+        monitor_class = AsyncInventoryMonitor
+    monitor: InventoryMonitor = monitor_class(
         twilio_util=twilio_util,
         admin_email=email_accounts[0],
         log_dir=args.log_dir,
@@ -135,27 +242,45 @@ def main() -> None:
         enable_inventory_delta_file=args.enable_diff_log,
         dry_run=args.dry_run,
         verbose=args.verbose,
+        evaluation_workers=args.evaluation_workers,
+        sources=get_sources(args),
+        item_log_sample_every=args.item_log_sample_every,
+        metrics_file=(
+            os.path.join(args.log_dir, "metrics.jsonl") if args.enable_metrics_file else ""
+        ),
     )
 
+    if args.metrics_port:
+        metrics_server = MetricsServer(args.metrics_port).start()
+        log.print_ok(f"Serving metrics on http://127.0.0.1:{metrics_server.port}/metrics")
+
+    if args.push_port or args.webhook_url:
+        push_server = PushServer(monitor.restock_events, args.push_port or None).start()
+        for url in args.webhook_url:
+            push_server.add_webhook(url, webhook_secret)
+        if args.push_port:
+            log.print_ok(f"Pushing restock events on http://127.0.0.1:{push_server.port}/events")
+
     monitor.init()
 
-    while True:
-        try:
-            monitor.run()
-        except KeyboardInterrupt:
-            os.remove(path=PIDFILE)
-            break
-        except Exception as e:
-            os.remove(path=PIDFILE)
-            log.print_fail(f"Exception: {e}")
-            alarm_emoji = "\U0001F6A8"
-            message = f"{alarm_emoji} Admin Inventory Alert\n\n"
-            message += "Inventory alert bot has crashed!\n"
-            message += "Please restart the backend server\n"
-            log.print_fail(f"{message}")
-            if args.enable_alarm:
-                twilio_util.send_sms(os.environ.get("ADMIN_PHONE", ""), message)
-            raise e
+    if monitor.profiler.install_signal_handler():
+        log.print_normal(f"Send SIGUSR1 to {os.getpid()} to profile the next inventory cycles")
+
+    try:
+        monitor.run_forever()
+    except KeyboardInterrupt:
+        os.remove(path=PIDFILE)
+    except Exception as e:
+        os.remove(path=PIDFILE)
+        log.print_fail(f"Exception: {e}")
+        alarm_emoji = "\U0001f6a8"
+        message = f"{alarm_emoji} Admin Inventory Alert\n\n"
+        message += "Inventory alert bot has crashed!\n"
+        message += "Please restart the backend server\n"
+        log.print_fail(f"{message}")
+        if args.enable_alarm:
+            twilio_util.send_sms(os.environ.get("ADMIN_PHONE", ""), message)
+        raise e
 
 
 if __name__ == "__main__":
@@ -4,6 +4,9 @@ under the "admin.health_monitor.reset" field path
 for a boolean value of True. If the value is True,
 then the script will reset the server by killing
 any outstanding bot processes and restarting them.
+
+With --no-firestore it only restarts the bot when its
+process dies, without loading the firestore client.
 """
 
 import argparse
@@ -14,9 +17,11 @@ import typing as T
 
 import dotenv
 
-from firebase.firebase_admin import FirebaseAdmin
 from util import log, wait
 
+if T.TYPE_CHECKING:
+    from firebase.firebase_admin import FirebaseAdmin
+
 dotenv.load_dotenv(".env")
 
 TIME_BETWEEN_CHECKS = 5
@@ -62,6 +67,15 @@ def reset_server() -> None:
     log.print_ok_arrow("Server reset complete.")
 
 
+def connect_firebase() -> "FirebaseAdmin":
+    from firebase.firebase_admin import FirebaseAdmin
+
+    credentials_file = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    creds_path = os.path.join(root_dir, "config", credentials_file)
+    return FirebaseAdmin(credentials_file=creds_path)
+
+
 def main() -> None:
     dotenv.load_dotenv(".env")
 
@@ -69,20 +83,23 @@ def main() -> None:
 
     log_dir = log.get_logging_dir("inventory_manager")
     parser.add_argument("--log-dir", default=log_dir)
+    parser.add_argument(
+        "--no-firestore",
+        action="store_true",
+        help="Only restart the bot when its process dies, ignoring the firestore reset flag",
+    )
+    args = parser.parse_args()
 
     pidfile = os.environ.get("RESET_PIDFILE", "reset_server.pid")
 
     with open(pidfile, "w") as outfile:
         outfile.write(str(os.getpid()))
 
-    credentials_file = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
-    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    creds_path = os.path.join(root_dir, "config", credentials_file)
-    firebase_server: FirebaseAdmin = FirebaseAdmin(credentials_file=creds_path)
+    firebase_server = None if args.no_firestore else connect_firebase()
 
     try:
         while True:
-            if firebase_server.is_reset:
+            if firebase_server is not None and firebase_server.is_reset:
                 log.print_bright("Reset signal detected.")
                 reset_server()
                 firebase_server.set_reset(reset=False)
@@ -90,7 +107,8 @@ def main() -> None:
             elif is_process_killed():
                 reset_server()
                 log.print_ok_arrow("Bot reset complete.")
-            firebase_server.refresh()
+            if firebase_server is not None:
+                firebase_server.refresh()
             wait.wait(TIME_BETWEEN_CHECKS)
     except KeyboardInterrupt:
         log.print_fail_arrow("Keyboard interrupt detected.")
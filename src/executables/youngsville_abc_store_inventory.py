@@ -11,9 +11,10 @@ def main() -> None:
     password = os.getenv("YOUNGSVILLE_ABC_PASSWORD")
     username = os.getenv("YOUNGSVILLE_ABC_USERNAME")
 
-    inventory = YoungsvilleAbcInventory(username, password)
+    cookie_file = os.getenv("YOUNGSVILLE_ABC_COOKIE_FILE", "youngsville_cookies.json")
+    inventory = YoungsvilleAbcInventory(username, password, cookie_file=cookie_file)
 
-    inventory.login()
+    # logs in only if the saved session has expired
     df = inventory.inventory_to_dataframe()
     print(df)
 
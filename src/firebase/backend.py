@@ -0,0 +1,63 @@
+"""
+Pluggable firestore backends. FirebaseClient and FirebaseAdmin only talk to firestore
+through this interface so that an in-memory implementation can stand in for the real
+service in tests and benchmarks.
+"""
+
+import abc
+import typing as T
+
+
+class FirestoreBackend(abc.ABC):
+    """
+    The subset of the firestore client api used by this project: collection and document
+    references (get/set/update/delete/list_documents/on_snapshot) plus batched writes and
+    transactions.
+    """
+
+    @abc.abstractmethod
+    def collection(self, name: str) -> T.Any:
+        pass
+
+    @abc.abstractmethod
+    def batch(self) -> T.Any:
+        pass
+
+    @abc.abstractmethod
+    def run_transaction(self, func: T.Callable[[T.Any], T.Any]) -> T.Any:
+        """
+        Call func(transaction) and commit its writes atomically with its reads, which are made
+        with reference.get(transaction=transaction). func may be retried on contention.
+        """
+
+    @property
+    @abc.abstractmethod
+    def server_timestamp(self) -> T.Any:
+        """Sentinel value that is replaced by the server time when written"""
+
+
+class FirebaseAdminBackend(FirestoreBackend):
+    def __init__(self, credentials_file: str) -> None:
+        # the admin sdk pulls in grpc and google cloud, so it is only loaded once it is used
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            auth = credentials.Certificate(credentials_file)
+            firebase_admin.initialize_app(auth)
+
+        self.firestore = firestore
+        self.client = firestore.client()
+
+    def collection(self, name: str) -> T.Any:
+        return self.client.collection(name)
+
+    def batch(self) -> T.Any:
+        return self.client.batch()
+
+    def run_transaction(self, func: T.Callable[[T.Any], T.Any]) -> T.Any:
+        return self.firestore.transactional(func)(self.client.transaction())
+
+    @property
+    def server_timestamp(self) -> T.Any:
+        return self.firestore.SERVER_TIMESTAMP
@@ -50,6 +50,8 @@ class Preferences(T.TypedDict):
     enableNewDataEmailAlerts: bool
     enableNewDataSmsAlerts: bool
     notifications: Notifications
+    # the secondary inventory sources, like a local store, the client wants alerts from
+    sources: T.List[str]
 
 
 class Accounting(T.TypedDict):
@@ -77,6 +79,7 @@ NULL_CLIENT = Client(
         enableNewDataEmailAlerts=True,
         enableNewDataSmsAlerts=False,
         updateOnNewData=False,
+        sources=[],
         notifications=Notifications(
             email=Email(email="", updatesEnabled=False),
             sms=Sms(
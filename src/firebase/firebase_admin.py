@@ -1,30 +1,25 @@
-import time
 import typing as T
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud.firestore_v1.base_document import DocumentSnapshot
-from google.cloud.firestore_v1.collection import CollectionReference
-from google.cloud.firestore_v1.watch import DocumentChange
-
+from firebase.backend import FirebaseAdminBackend, FirestoreBackend
+from firebase.watcher import WatcherSupervisor
 from util import log
 
+if T.TYPE_CHECKING:
+    from google.cloud.firestore_v1.base_document import DocumentSnapshot
+    from google.cloud.firestore_v1.collection import CollectionReference
+    from google.cloud.firestore_v1.watch import DocumentChange
 
-class FirebaseAdmin:
-    TIME_BETWEEN_WATCHER_UPDATE = 60 * 45
 
-    def __init__(self, credentials_file: str):
+class FirebaseAdmin:
+    def __init__(self, credentials_file: str, backend: T.Optional[FirestoreBackend] = None):
         self.credentials_file = credentials_file
         self._is_reset = False
-        self.time_between_watcher_update = None
-
-        if not firebase_admin._apps:
-            auth = credentials.Certificate(credentials_file)
-            firebase_admin.initialize_app(auth)
 
-        self.db = firestore.client()
-        self.admin_ref: CollectionReference = self.db.collection("admin")
-        self.admin_watcher = self.admin_ref.on_snapshot(self._collection_snapshot_handler)
+        self.db: FirestoreBackend = backend or FirebaseAdminBackend(credentials_file)
+        self.admin_ref: "CollectionReference" = self.db.collection("admin")
+        self.admin_watcher = WatcherSupervisor(
+            "admin", self.admin_ref, self._collection_snapshot_handler
+        )
 
     def set_reset(self, reset: bool = False) -> None:
         self.admin_ref.document("health_monitor").set({"reset": reset}, merge=["reset"])
@@ -34,20 +29,8 @@ class FirebaseAdmin:
         return doc.to_dict().get("reset", False)
 
     def refresh(self) -> None:
-        now = time.time()
-        if (
-            self.time_between_watcher_update
-            and now - self.time_between_watcher_update < self.TIME_BETWEEN_WATCHER_UPDATE
-        ):
-            return
-
-        self.time_between_watcher_update = now
-
-        log.print_ok(f"\nUpdating watcher...")
-        if self.admin_watcher:
-            self.admin_watcher.unsubscribe()
-
-        self.admin_watcher = self.admin_ref.on_snapshot(self._collection_snapshot_handler)
+        if self.admin_watcher.check():
+            log.print_ok(f"\nUpdated watcher...")
 
     @property
     def is_reset(self) -> bool:
@@ -59,8 +42,8 @@ class FirebaseAdmin:
 
     def _collection_snapshot_handler(
         self,
-        collection_snapshot: T.List[DocumentSnapshot],
-        changed_docs: T.List[DocumentChange],
+        collection_snapshot: T.List["DocumentSnapshot"],
+        changed_docs: T.List["DocumentChange"],
         read_time: T.Any,
     ) -> None:
         if len(collection_snapshot) == 0:
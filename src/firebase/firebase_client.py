@@ -6,22 +6,23 @@ import threading
 import time
 import typing as T
 
-import deepdiff
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud.firestore_v1.base_document import DocumentSnapshot
-from google.cloud.firestore_v1.collection import CollectionReference
-from google.cloud.firestore_v1.document import DocumentReference
-from google.cloud.firestore_v1.watch import DocumentChange
 from sqlalchemy.sql import func
 
 from database.client import ClientDb
-from database.models.client import ClientSchema
 from database.models.item import Item
 from firebase import defs
+from firebase.backend import FirebaseAdminBackend, FirestoreBackend
+from firebase.watcher import WatcherSupervisor
+from firebase.write_back import FirestoreWriteBack, apply_field_updates
 from util import log
 from util.dict_util import check_dict_keys_recursive, patch_missing_keys_recursive, safe_get
 
+if T.TYPE_CHECKING:
+    from google.cloud.firestore_v1.base_document import DocumentSnapshot
+    from google.cloud.firestore_v1.collection import CollectionReference
+    from google.cloud.firestore_v1.document import DocumentReference
+    from google.cloud.firestore_v1.watch import DocumentChange
+
 
 class Changes(enum.Enum):
     ADDED = 1
@@ -33,22 +34,40 @@ class FirebaseClient:
     TIME_FORMAT = "%Y_%m_%d%H_%M_%S_%f"
     HEALTH_PING_TIME = 60 * 30
 
-    def __init__(self, credentials_file: str, verbose: bool = False) -> None:
-        if not firebase_admin._apps:
-            auth = credentials.Certificate(credentials_file)
-            firebase_admin.initialize_app(auth)
-        self.db = firestore.client()
+    def __init__(
+        self,
+        credentials_file: str,
+        verbose: bool = False,
+        backend: T.Optional[FirestoreBackend] = None,
+    ) -> None:
+        self.db: FirestoreBackend = backend or FirebaseAdminBackend(credentials_file)
         self.verbose = verbose
 
-        self.clients_ref: CollectionReference = self.db.collection("clients")
-        self.admin_ref: CollectionReference = self.db.collection("admin")
+        self.clients_ref: "CollectionReference" = self.db.collection("clients")
+        self.admin_ref: "CollectionReference" = self.db.collection("admin")
 
-        self.clients_watcher = self.clients_ref.on_snapshot(self._collection_snapshot_handler)
+        self.write_back = FirestoreWriteBack(self.db, self.clients_ref, verbose=verbose)
 
-        self.db_cache: defs.Client = {}
+        self.db_cache: T.Dict[str, defs.Client] = {}
+        self.dirty_clients: T.Set[str] = set()
+        # last seen update time per document so a resubscribe can skip unchanged documents
+        self.update_times: T.Dict[str, T.Any] = {}
 
         self.callback_done = threading.Event()
         self.db_cache_lock = threading.Lock()
+        self.change_listeners: T.List[T.Callable[[], None]] = []
+        self.profile_listeners: T.List[T.Callable[[int], None]] = []
+
+        self.clients_watcher = WatcherSupervisor(
+            "clients",
+            self.clients_ref,
+            self._collection_snapshot_handler,
+            on_initial_snapshot=self._prune_missing_clients,
+        )
+        # requests made through the health_monitor doc, e.g. to profile some cycles
+        self.admin_watcher = WatcherSupervisor(
+            "admin", self.admin_ref, self._admin_snapshot_handler
+        )
 
         self.last_health_ping = None
 
@@ -57,11 +76,15 @@ class FirebaseClient:
         with self.db_cache_lock:
             if name in self.db_cache:
                 del self.db_cache[name]
+            self.dirty_clients.discard(name)
+            self.update_times.pop(name, None)
         log.print_warn(f"Deleting client {name} from database")
 
     def _maybe_upload_db_cache_to_firestore(
         self, client: str, old_db_client: defs.Client, db_client: defs.Client
     ) -> None:
+        import deepdiff
+
         diff = deepdiff.DeepDiff(
             old_db_client,
             db_client,
@@ -78,70 +101,119 @@ class FirebaseClient:
 
         self.clients_ref.document(client).set(client_dict_firestore)
 
+        # cache what we wrote so the watcher echo of our own write isn't treated as an edit
+        with self.db_cache_lock:
+            self.db_cache[client] = client_dict_firestore
+
+    @staticmethod
+    def _get_contact_info(db_client: defs.Client) -> T.Tuple[str, T.List[str]]:
+        email = safe_get(db_client, "preferences.notifications.email.email".split("."), "")
+
+        # legacy database value
+        phone_number_val = safe_get(
+            db_client, "preferences.notifications.sms.phoneNumber".split("."), ""
+        )
+        phone_numbers_dict = safe_get(
+            db_client, "preferences.notifications.sms.phoneNumbers".split("."), {}
+        )
+
+        phone_numbers_to_parse = list(phone_numbers_dict.values())
+        if not phone_numbers_to_parse and phone_number_val:
+            phone_numbers_to_parse = [phone_number_val]
+
+        phone_numbers = []
+        for phone_number in phone_numbers_to_parse:
+            # remove any leading us country code and any parenthesis or brackets from phone num
+            sanitized_phone_number = "".join([c for c in phone_number if c.isdigit()])
+
+            if not sanitized_phone_number:
+                continue
+
+            if sanitized_phone_number.startswith("1") and len(sanitized_phone_number) == 11:
+                sanitized_phone_number = sanitized_phone_number[1:]
+
+            sanitized_phone_number = "+1" + sanitized_phone_number
+
+            phone_numbers.append(sanitized_phone_number)
+
+        return email, phone_numbers
+
     def _collection_snapshot_handler(
         self,
-        collection_snapshot: T.List[DocumentSnapshot],
-        changed_docs: T.List[DocumentChange],
+        collection_snapshot: T.List["DocumentSnapshot"],
+        changed_docs: T.List["DocumentChange"],
         read_time: T.Any,
     ) -> None:
-        log.print_warn(f"Received collection snapshot for {len(collection_snapshot)} documents")
-
-        with self.db_cache_lock:
-            self.db_cache = {}
-            for doc in collection_snapshot:
-                self.db_cache[doc.id] = doc.to_dict()
-
-        for client in self.db_cache.keys():
-            if client not in self.db_cache:
-                self._delete_client(client)
+        """
+        Apply only the changed documents to the cache and mark them dirty so that the
+        next reconciliation pass touches just the clients that were edited.
+        """
+        log.print_warn(
+            f"Received {len(changed_docs)} changes in snapshot of {len(collection_snapshot)} documents"
+        )
 
         for change in changed_docs:
             doc_id = change.document.id
-            email = safe_get(
-                self.db_cache[doc_id], "preferences.notifications.email.email".split("."), ""
-            )
-            phone_numbers_dict = safe_get(
-                self.db_cache[doc_id],
-                "preferences.notifications.sms.phoneNumbers".split("."),
-                {},
-            )
-            # legacy database value
-            phone_number_val = safe_get(
-                self.db_cache[client], "preferences.notifications.sms.phoneNumber".split("."), ""
-            )
-
-            phone_numbers_to_parse = list(phone_numbers_dict.values())
-            if not phone_numbers_to_parse and phone_number_val:
-                phone_numbers_to_parse = [phone_number_val]
 
-            phone_numbers = []
-            for index, phone_number in enumerate(phone_numbers_to_parse):
-                # remove any leading us country code and any parenthesis or brackets from phone num
-                sanitized_phone_number = "".join([c for c in phone_number if c.isdigit()])
+            if change.type.name == Changes.REMOVED.name:
+                log.print_ok_blue(f"Removed document: {doc_id}")
+                self._delete_client(doc_id)
+                continue
 
-                if not sanitized_phone_number:
+            update_time = getattr(change.document, "update_time", None)
+            with self.db_cache_lock:
+                # a resubscribe resends every document, skip the ones we have already seen
+                if (
+                    update_time is not None
+                    and doc_id in self.db_cache
+                    and self.update_times.get(doc_id) == update_time
+                ):
                     continue
 
-                if sanitized_phone_number.startswith("1") and len(sanitized_phone_number) == 11:
-                    sanitized_phone_number = sanitized_phone_number[1:]
-
-                sanitized_phone_number = "+1" + sanitized_phone_number
+            db_client = change.document.to_dict() or {}
 
-                phone_numbers.append(sanitized_phone_number)
+            with self.db_cache_lock:
+                self.update_times[doc_id] = update_time
+                if self.db_cache.get(doc_id) == db_client:
+                    continue
+                self.db_cache[doc_id] = db_client
+                self.dirty_clients.add(doc_id)
 
             if change.type.name == Changes.ADDED.name:
                 log.print_ok_blue(f"Added document: {doc_id}")
-
-                ClientDb.add_client(doc_id, email, phone_numbers)
             elif change.type.name == Changes.MODIFIED.name:
                 log.print_ok_blue(f"Modified document: {doc_id}")
-                ClientDb.add_client(doc_id, email, phone_numbers)
-            elif change.type.name == Changes.REMOVED.name:
-                log.print_ok_blue(f"Removed document: {doc_id}")
-                self._delete_client(doc_id)
-                continue
 
-        self.callback_done.set()
+            email, phone_numbers = self._get_contact_info(db_client)
+            ClientDb.add_client(doc_id, email, phone_numbers)
+
+        if self.dirty_clients:
+            self.callback_done.set()
+            for listener in self.change_listeners:
+                listener()
+
+    def add_change_listener(self, listener: T.Callable[[], None]) -> None:
+        """Called from the watcher thread whenever there are client changes to reconcile"""
+        self.change_listeners.append(listener)
+
+    def add_profile_listener(self, listener: T.Callable[[int], None]) -> None:
+        """Called from the watcher thread with the cycles to profile when they are requested"""
+        self.profile_listeners.append(listener)
+
+    def _admin_snapshot_handler(
+        self,
+        collection_snapshot: T.List["DocumentSnapshot"],
+        changed_docs: T.List["DocumentChange"],
+        read_time: T.Any,
+    ) -> None:
+        health_docs = [doc for doc in collection_snapshot if doc.id == "health_monitor"]
+        if not health_docs or not (health_docs[0].to_dict() or {}).get("profile_cycles"):
+            return
+
+        cycles = self.take_profile_request()
+        if cycles > 0:
+            for listener in self.profile_listeners:
+                listener(cycles)
 
     def _handle_firebase_update(self, client: str, db_client: defs.Client) -> None:
         log.print_normal(f"Checking to see if we need to update {client} databases...")
@@ -157,48 +229,26 @@ class FirebaseClient:
             log.print_warn(f"Missing keys in client {client}:\n{missing_keys}")
             patch_missing_keys_recursive(defs.NULL_CLIENT, db_client)
 
-        email = safe_get(old_db_client, "preferences.notifications.email.email".split("."), "")
-
-        # legacy database value
-        phone_number_val = safe_get(
-            old_db_client, "preferences.notifications.sms.phoneNumber".split("."), ""
-        )
-        phone_numbers_dict = safe_get(
-            old_db_client, "preferences.notifications.sms.phoneNumbers".split("."), {}
-        )
-
-        phone_numbers_to_parse = list(phone_numbers_dict.values())
-        if not phone_numbers_to_parse and phone_number_val:
-            phone_numbers_to_parse = [phone_number_val]
-
-        phone_numbers = []
-        for index, phone_number in enumerate(phone_numbers_to_parse):
-            # remove any leading us country code and any parenthesis or brackets from phone num
-            sanitized_phone_number = "".join([c for c in phone_number if c.isdigit()])
-
-            if not sanitized_phone_number:
-                continue
-
-            if sanitized_phone_number.startswith("1") and len(sanitized_phone_number) == 11:
-                sanitized_phone_number = sanitized_phone_number[1:]
-
-            sanitized_phone_number = "+1" + sanitized_phone_number
-
-            phone_numbers.append(sanitized_phone_number)
+        email, phone_numbers = self._get_contact_info(old_db_client)
 
         with ClientDb.client(client) as db:
             if not db:
                 self._maybe_upload_db_cache_to_firestore(client, old_db_client, db_client)
                 return
 
-            client_schema = ClientSchema().dump(db)
+            client_items_list = {i.id for i in db.items}
+            client_tracking_list = {t.nc_code for t in db.tracked_items}
 
-        items_schema = ClientDb.all_items()
-        client_items_list = [i["id"] for i in client_schema["items"]]
-        client_tracking_list = [t["nc_code"] for t in client_schema["tracked_items"]]
+        firebase_items = safe_get(db_client, "inventory.items".split("."), {})
+        items_stock = ClientDb.get_item_stock(firebase_items.keys())
 
-        for nc_code, info in safe_get(db_client, "inventory.items".split(".")).items():
+        for nc_code, info in firebase_items.items():
             is_tracking_in_firebase = info.get("action", "") == defs.Actions.TRACKING.value
+
+            # the item has to exist before it can be associated with the client
+            if nc_code not in items_stock:
+                ClientDb.add_or_update_item(nc_code)
+
             if nc_code in client_items_list:
                 is_tracking_in_db = nc_code in client_tracking_list
                 if is_tracking_in_db != is_tracking_in_firebase:
@@ -210,15 +260,11 @@ class FirebaseClient:
                 ClientDb.add_item_to_client(client, nc_code)
                 ClientDb.add_track_item(client, nc_code, is_tracking_in_firebase)
 
-            if nc_code not in items_schema:
-                ClientDb.add_or_update_item(nc_code)
-            else:
-                db_client["inventory"]["items"][nc_code]["name"] = items_schema[nc_code][
-                    "brand_name"
-                ]
-                db_client["inventory"]["items"][nc_code]["available"] = items_schema[nc_code][
-                    "total_available"
-                ]
+            if nc_code in items_stock:
+                db_client["inventory"]["items"][nc_code]["name"] = items_stock[nc_code].brand_name
+                db_client["inventory"]["items"][nc_code]["available"] = items_stock[
+                    nc_code
+                ].total_available
 
         with ClientDb.client(client) as db:
             db.email = email
@@ -263,6 +309,9 @@ class FirebaseClient:
             tracked_nc_codes = [i.nc_code for i in db.tracked_items]
 
         ClientDb.add_phone_numbers(client, phone_numbers)
+        ClientDb.set_source_subscriptions(
+            client, safe_get(db_client, "preferences.sources".split("."), [])
+        )
 
         for nc_code in nc_codes:
             if nc_code not in db_client["inventory"]["items"]:
@@ -276,12 +325,27 @@ class FirebaseClient:
 
         self._maybe_upload_db_cache_to_firestore(client, old_db_client, db_client)
 
+    def _prune_missing_clients(self, collection_snapshot: T.List["DocumentSnapshot"]) -> None:
+        """
+        A fresh subscription only reports the documents that exist, so anything deleted
+        while we were disconnected has to be dropped by comparing against the cache.
+        """
+        doc_ids = {doc.id for doc in collection_snapshot}
+        with self.db_cache_lock:
+            missing_clients = [client for client in self.db_cache if client not in doc_ids]
+
+        for client in missing_clients:
+            log.print_ok_blue(f"Removed document while disconnected: {client}")
+            self._delete_client(client)
+
+    def check_watchers(self) -> None:
+        """Resubscribe only if the snapshot stream has failed or gone silent"""
+        self.clients_watcher.check()
+        self.admin_watcher.check()
+
     def update_watchers(self) -> None:
         log.print_warn(f"Updating watcher...")
-        if self.clients_watcher:
-            self.clients_watcher.unsubscribe()
-
-        self.clients_watcher = self.clients_ref.on_snapshot(self._collection_snapshot_handler)
+        self.clients_watcher.reconnect()
 
     def update_from_firebase(self) -> None:
         """
@@ -292,36 +356,63 @@ class FirebaseClient:
         log.print_warn(f"Updating from firebase database instead of cache")
         with self.db_cache_lock:
             self.db_cache = {}
+            self.update_times = {}
             for doc in self.clients_ref.list_documents():
-                self.db_cache[doc.id] = doc.get().to_dict()
-
-        for client in self.db_cache.keys():
-            if client not in self.db_cache:
-                self._delete_client(client)
+                snapshot = doc.get()
+                self.db_cache[doc.id] = snapshot.to_dict()
+                self.update_times[doc.id] = getattr(snapshot, "update_time", None)
+            self.dirty_clients = set(self.db_cache.keys())
 
         self.callback_done.set()
 
-    def check_and_maybe_update_to_firebase(self, client: str, item_code: str) -> None:
-        items = safe_get(self.db_cache, f"{client}.inventoryitems".split("."))
-        if not items:
+    def sync_items_to_firebase(self) -> None:
+        """
+        Write item names and availability from the local database back to firebase.
+        Only fields that differ from the cached client documents are sent.
+        """
+        with self.db_cache_lock:
+            db_clients = list(self.db_cache.items())
+
+        nc_codes: T.Set[str] = set()
+        for _, db_client in db_clients:
+            nc_codes.update(safe_get(db_client, "inventory.items".split("."), {}).keys())
+
+        if not nc_codes:
             return
 
-        db_client = copy.deepcopy(self.db_cache[client])
+        items = ClientDb.get_item_stock(nc_codes)
 
-        for nc_code, info in db_client["inventory"]["items"].items():
-            with ClientDb.item(nc_code) as item:
-                if item and item.id == nc_code and item.brand_name and item.total_available:
-                    db_client["inventory"]["items"][nc_code]["name"] = item.brand_name
-                    db_client["inventory"]["items"][nc_code]["available"] = item.total_available
+        for client, db_client in db_clients:
+            updates = self.write_back.compute_item_updates(db_client, items)
+            if not updates:
+                continue
 
-        self._maybe_upload_db_cache_to_firestore(client, self.db_cache[client], db_client)
+            self.write_back.stage(client, updates)
+
+            # reflect the write in the cache so we don't resend it before the watcher catches up
+            with self.db_cache_lock:
+                if client in self.db_cache:
+                    apply_field_updates(self.db_cache[client], updates)
+
+        self.write_back.commit()
 
     def check_and_maybe_handle_firebase_db_updates(self) -> None:
-        if self.callback_done.is_set():
-            self.callback_done.clear()
-            log.print_bright("Handling firebase database updates")
-            for client, info in self.db_cache.items():
-                self._handle_firebase_update(client, info)
+        if not self.callback_done.is_set():
+            return
+
+        self.callback_done.clear()
+
+        with self.db_cache_lock:
+            dirty_clients = {
+                client: self.db_cache[client]
+                for client in self.dirty_clients
+                if client in self.db_cache
+            }
+            self.dirty_clients = set()
+
+        log.print_bright(f"Handling firebase database updates for {len(dirty_clients)} clients")
+        for client, info in dirty_clients.items():
+            self._handle_firebase_update(client, info)
 
     def health_ping(self) -> None:
         if self.last_health_ping and time.time() - self.last_health_ping < self.HEALTH_PING_TIME:
@@ -331,12 +422,30 @@ class FirebaseClient:
 
         log.print_ok_arrow("Health ping")
         self.admin_ref.document("health_monitor").set(
-            {"heartbeat": firestore.SERVER_TIMESTAMP}, merge=["heartbeat"]
+            {"heartbeat": self.db.server_timestamp}, merge=["heartbeat"]
         )
 
+    def take_profile_request(self) -> int:
+        """Cycles to profile requested through the health_monitor doc, cleared once read"""
+        doc_ref: "DocumentReference" = self.admin_ref.document("health_monitor")
+
+        def take(transaction: T.Any) -> int:
+            snapshot = doc_ref.get(["profile_cycles"], transaction=transaction)
+            cycles = int((snapshot.to_dict() or {}).get("profile_cycles") or 0)
+            if cycles > 0:
+                # acknowledge the request so it isn't picked up again after a restart, in the
+                # transaction so a request written in between isn't cleared unseen
+                transaction.update(doc_ref, {"profile_cycles": 0})
+            return cycles
+
+        cycles = self.db.run_transaction(take)
+        if cycles > 0:
+            log.print_bright(f"Profiling requested for {cycles} cycles")
+        return cycles
+
     def add_items_to_firebase(self, client: str, items_dict: defs.Client) -> None:
         log.print_warn(f"Adding items to firebase")
-        doc_ref: DocumentReference = self.clients_ref.document(client)
+        doc_ref: "DocumentReference" = self.clients_ref.document(client)
         current_items_dict = doc_ref.get(["inventory.items"]).to_dict()
         log.print_bold(f"Items before: {len(current_items_dict['inventory']['items'].keys())}")
         doc_ref.set(items_dict, merge=["inventory.items"])
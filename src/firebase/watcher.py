@@ -0,0 +1,147 @@
+"""
+Supervise a firestore snapshot listener and only re-subscribe when the stream is unhealthy.
+
+Every re-subscribe makes firestore resend (and bill) the full collection snapshot, so rather
+than tearing the listener down on a timer we track when it last delivered a snapshot and
+whether the underlying stream has terminated, and reconnect only then.
+"""
+
+import functools
+import threading
+import time
+import typing as T
+
+from util import log
+
+SnapshotCallback = T.Callable[[T.List[T.Any], T.List[T.Any], T.Any], None]
+
+
+class WatcherSupervisor:
+    # firestore only pushes when something changes, so silence alone is a weak signal. this is
+    # a backstop for streams that die without reporting it
+    MAX_SILENCE = 60 * 60 * 6
+
+    def __init__(
+        self,
+        name: str,
+        query: T.Any,
+        callback: SnapshotCallback,
+        on_initial_snapshot: T.Optional[T.Callable[[T.List[T.Any]], None]] = None,
+        max_silence: T.Optional[float] = MAX_SILENCE,
+    ) -> None:
+        self.name = name
+        self.query = query
+        self.callback = callback
+        self.on_initial_snapshot = on_initial_snapshot
+        self.max_silence = max_silence
+
+        self.watch: T.Any = None
+        self.error: T.Optional[BaseException] = None
+        self.last_event_time: T.Optional[float] = None
+        self.last_read_time: T.Any = None
+        self.subscribe_time: T.Optional[float] = None
+        self.reconnects = 0
+        # bumped whenever the watch is replaced or closed, so that the callbacks of an old
+        # watch (closing one completes its rpc) can't mark the current one as failed
+        self.generation = 0
+
+        self._awaiting_initial_snapshot = False
+        self._lock = threading.Lock()
+
+        self.subscribe()
+
+    def subscribe(self) -> None:
+        with self._lock:
+            self.generation += 1
+            generation = self.generation
+            self.error = None
+            self.subscribe_time = time.time()
+            self._awaiting_initial_snapshot = True
+            self.watch = self.query.on_snapshot(functools.partial(self._on_snapshot, generation))
+
+        # the real firestore watch retries transient errors itself and only completes its
+        # rpc once it has given up on the stream
+        rpc = getattr(self.watch, "_rpc", None)
+        if rpc is not None and hasattr(rpc, "add_done_callback"):
+            rpc.add_done_callback(functools.partial(self._on_rpc_done, generation))
+
+    def unsubscribe(self) -> None:
+        with self._lock:
+            self.generation += 1
+            watch, self.watch = self.watch, None
+        if watch is not None:
+            watch.unsubscribe()
+
+    def reconnect(self) -> None:
+        log.print_warn(f"Reconnecting {self.name} watcher...")
+        self.unsubscribe()
+        self.reconnects += 1
+        self.subscribe()
+
+    def _on_rpc_done(self, generation: int, future: T.Any) -> None:
+        if generation != self.generation:
+            # a watch we closed or replaced
+            return
+
+        exception = None
+        try:
+            exception = future.exception() if hasattr(future, "exception") else None
+        except Exception as err:  # pylint: disable=broad-except
+            exception = err
+        self.error = exception or ConnectionError(f"{self.name} watcher stream closed")
+        log.print_fail(f"{self.name} watcher stream terminated: {self.error}")
+
+    def _on_snapshot(
+        self, generation: int, docs: T.List[T.Any], changes: T.List[T.Any], read_time: T.Any
+    ) -> None:
+        if generation != self.generation:
+            return
+
+        try:
+            with self._lock:
+                initial_snapshot = self._awaiting_initial_snapshot
+                self._awaiting_initial_snapshot = False
+
+            if initial_snapshot and self.on_initial_snapshot is not None:
+                self.on_initial_snapshot(docs)
+
+            self.callback(docs, changes, read_time)
+        except Exception as err:
+            # let the stream die so the next check resubscribes and redelivers the changes
+            self.error = err
+            raise
+
+        self.last_event_time = time.time()
+        self.last_read_time = read_time
+
+    def unhealthy_reason(self) -> T.Optional[str]:
+        watch = self.watch
+        if watch is None:
+            return "not subscribed"
+        if self.error is not None:
+            return f"stream error: {self.error}"
+        if getattr(watch, "error", None) is not None:
+            return f"stream error: {watch.error}"
+        if not getattr(watch, "is_active", True) or getattr(watch, "_closed", False):
+            return "stream closed"
+
+        if self.max_silence:
+            last_activity = self.last_event_time or self.subscribe_time or 0.0
+            if time.time() - last_activity > self.max_silence:
+                return f"no events for {int(time.time() - last_activity)} seconds"
+
+        return None
+
+    @property
+    def is_healthy(self) -> bool:
+        return self.unhealthy_reason() is None
+
+    def check(self) -> bool:
+        """Reconnect if the stream is unhealthy, returns whether we reconnected"""
+        reason = self.unhealthy_reason()
+        if reason is None:
+            return False
+
+        log.print_warn(f"{self.name} watcher is unhealthy ({reason})")
+        self.reconnect()
+        return True
@@ -0,0 +1,138 @@
+"""
+Delta-only write back of item names and availability from the local database into the
+client documents in firestore. Changed fields are sent as field path updates and grouped
+into batched commits instead of re-setting every client document.
+"""
+
+import re
+import typing as T
+
+from database.client import ItemStock
+from firebase import defs
+from util import log
+from util.dict_util import safe_get
+
+# firestore rejects batches with more than 500 writes
+MAX_WRITES_PER_BATCH = 500
+
+_SIMPLE_FIELD_NAME = re.compile(r"^[_a-zA-Z][_a-zA-Z0-9]*$")
+_BACKTICK = "`"
+
+
+def render_field_path(field_names: T.Iterable[str]) -> str:
+    """Join field names into a firestore field path, quoting any non-identifier names
+    (e.g. nc codes such as 00009) with backticks"""
+    result = []
+    for field_name in field_names:
+        if _SIMPLE_FIELD_NAME.match(field_name):
+            result.append(field_name)
+        else:
+            escaped = field_name.replace("\\", "\\\\").replace(_BACKTICK, "\\" + _BACKTICK)
+            result.append(_BACKTICK + escaped + _BACKTICK)
+    return ".".join(result)
+
+
+def split_field_path(path: str) -> T.List[str]:
+    """Inverse of render_field_path"""
+    field_names = []
+    current = ""
+    in_quotes = False
+    index = 0
+    while index < len(path):
+        char = path[index]
+        if in_quotes and char == "\\" and index + 1 < len(path):
+            current += path[index + 1]
+            index += 2
+            continue
+        if char == _BACKTICK:
+            in_quotes = not in_quotes
+        elif char == "." and not in_quotes:
+            field_names.append(current)
+            current = ""
+        else:
+            current += char
+        index += 1
+    field_names.append(current)
+    return field_names
+
+
+def apply_field_updates(document: T.Dict[str, T.Any], updates: T.Dict[str, T.Any]) -> None:
+    """Apply a dict of field path updates to a nested document in place"""
+    for path, value in updates.items():
+        field_names = split_field_path(path)
+        node = document
+        for field_name in field_names[:-1]:
+            if not isinstance(node.get(field_name), dict):
+                node[field_name] = {}
+            node = node[field_name]
+        node[field_names[-1]] = value
+
+
+def item_field_path(nc_code: str, field: str) -> str:
+    return render_field_path(["inventory", "items", nc_code, field])
+
+
+class FirestoreWriteBack:
+    """
+    Stages per-client field updates during a cycle and commits them in batches. Each
+    staged client document counts as a single write in the batch regardless of how many
+    fields changed in it.
+    """
+
+    def __init__(
+        self,
+        db: T.Any,
+        collection_ref: T.Any,
+        max_writes_per_batch: int = MAX_WRITES_PER_BATCH,
+        verbose: bool = False,
+    ) -> None:
+        self.db = db
+        self.collection_ref = collection_ref
+        self.max_writes_per_batch = min(max_writes_per_batch, MAX_WRITES_PER_BATCH)
+        self.verbose = verbose
+        self._pending: T.Dict[str, T.Dict[str, T.Any]] = {}
+
+    @property
+    def pending(self) -> T.Dict[str, T.Dict[str, T.Any]]:
+        return self._pending
+
+    @staticmethod
+    def compute_item_updates(
+        db_client: defs.Client, items: T.Dict[str, ItemStock]
+    ) -> T.Dict[str, T.Any]:
+        updates: T.Dict[str, T.Any] = {}
+        for nc_code, info in safe_get(db_client, ["inventory", "items"], {}).items():
+            item = items.get(nc_code)
+            if item is None:
+                continue
+            if item.brand_name and info.get("name") != item.brand_name:
+                updates[item_field_path(nc_code, "name")] = item.brand_name
+            if item.total_available is not None and info.get("available") != item.total_available:
+                updates[item_field_path(nc_code, "available")] = item.total_available
+        return updates
+
+    def stage(self, client: str, updates: T.Dict[str, T.Any]) -> None:
+        if not updates:
+            return
+        self._pending.setdefault(client, {}).update(updates)
+
+    def commit(self) -> int:
+        """Commit all staged updates, returns the number of batches committed"""
+        if not self._pending:
+            return 0
+
+        clients = list(self._pending.items())
+        self._pending = {}
+
+        num_batches = 0
+        for start in range(0, len(clients), self.max_writes_per_batch):
+            batch = self.db.batch()
+            for client, updates in clients[start : start + self.max_writes_per_batch]:
+                if self.verbose:
+                    log.print_normal(f"Updating {len(updates)} fields for {client} in firebase")
+                batch.update(self.collection_ref.document(client), updates)
+            batch.commit()
+            num_batches += 1
+
+        log.print_normal(f"Wrote {len(clients)} client updates in {num_batches} batches")
+        return num_batches
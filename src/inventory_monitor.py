@@ -1,60 +1,100 @@
+import collections
+import contextlib
 import datetime
-import gc
 import json
 import os
 import shutil
-import tempfile
 import time
 import typing as T
 
-import deepdiff
 import pandas as pd
 from sqlalchemy.exc import IntegrityError
 
+from alerts.coalescer import (
+    INVENTORY_ALERT_HEADER,
+    NEW_ITEM_ALERT_HEADER,
+    STOCK_EMOJI,
+    AlertCoalescer,
+    AlertItem,
+    Channel,
+    CoalescedAlert,
+    format_alert_items,
+    format_alert_message,
+)
+from client_evaluation import ClientRecord, ShardedEvaluator, restock_alerts, restock_skip_reason
 from database.client import ClientDb
-from database.models.client import ClientSchema
+from database.records import ClientRow
+from firebase.backend import FirestoreBackend
 from firebase.firebase_client import FirebaseClient
-from headers import HEADERS
-from util import email, log, wait, web2_client
+from inventory_sources import nc_abc
+from inventory_sources.base import InventorySnapshot, InventorySource
+from inventory_sources.manager import InventorySourceManager
+from inventory_sources.nc_abc import (
+    INVENTORY_CODE_KEY,
+    RAW_INVENTORY_CODE_KEY,
+    NcAbcSource,
+    clean_inventory_csv,
+)
+from restock_events import RestockEvent, RestockEventStream, StockChange, diff_stock, find_restocks
+from snapshot_buffers import SnapshotBuffers
+from util import email, log, metrics, wait
 from util.file_util import make_sure_path_exists
 from util.format import get_pretty_seconds
+from util.profiler import CycleProfiler
+from util.scheduler import Scheduler
 from util.twilio_util import TwilioUtil
 
-STOCK_EMOJI = "\U0001F943"
-
-
-def _sanitize_column_name(name: str) -> str:
-    # Convert to lowercase
-    sanitized_name = name.lower()
-
-    # Replace spaces with underscores
-    sanitized_name = sanitized_name.replace(" ", "_")
-
-    # Remove special characters (anything that's not alphanumeric or underscore)
-    sanitized_name = "".join(char for char in sanitized_name if char.isalnum() or char == "_")
-
-    return sanitized_name
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "inventory_monitor_stage_seconds", "Time spent in each stage of a monitor cycle", ["stage"]
+)
+ROWS_PROCESSED = metrics.REGISTRY.counter(
+    "inventory_monitor_rows_processed_total", "Inventory rows loaded", ["source"]
+)
+ALERTS_SENT = metrics.REGISTRY.counter(
+    "inventory_monitor_alerts_sent_total", "Alerts handed to SMS or email", ["channel"]
+)
+RESTOCK_EVENTS = metrics.REGISTRY.counter(
+    "inventory_monitor_restock_events_total", "Items that came back in stock", ["source"]
+)
+SNAPSHOTS_REJECTED = metrics.REGISTRY.counter(
+    "inventory_monitor_snapshots_rejected_total", "Inventory downloads rejected", ["reason"]
+)
+CLIENTS = metrics.REGISTRY.gauge("inventory_monitor_clients", "Clients being monitored")
+TRACKED_ITEMS = metrics.REGISTRY.gauge(
+    "inventory_monitor_tracked_items", "Items tracked across all clients"
+)
+SNAPSHOT_BYTES = metrics.REGISTRY.gauge(
+    "inventory_monitor_snapshot_bytes", "Bytes allocated for the inventory buffers", ["buffer"]
+)
 
 
 class InventoryMonitor:
-    DOWNLOAD_URL = "https://abc2.nc.gov/StoresBoards/ExportData"
+    DOWNLOAD_URL = nc_abc.DOWNLOAD_URL
+    SOURCE_NAME = "nc_abc"
+    # timed by the tasks that run in between inventory cycles, and by the cycle as a whole
+    BACKGROUND_STAGES = ("cycle", "firestore_watch", "source_poll")
     DOWNLOAD_KEY = ""
 
     TIME_BETWEEN_INVENTORY_CHECKS = {
         "prod": 60 * 5,
         "test": 30,
     }
-    TIME_BETWEEN_FIREBASE_QUERIES = {
-        "prod": 60 * 15,
+    # firestore changes trigger a reconcile immediately, this is only a backstop
+    TIME_BETWEEN_FIREBASE_CHECKS = {
+        "prod": 60 * 5,
         "test": 60,
     }
+    TIME_BETWEEN_SMS_QUEUE_CHECKS = 60
+    TIME_BETWEEN_METRICS_WRITES = 60
     WAIT_TIME = 30
-    RAW_INVENTORY_CODE_KEY = "NC Code"
-    INVENTORY_CODE_KEY = _sanitize_column_name(RAW_INVENTORY_CODE_KEY)
-    MAX_DELTA_IN_INVENTORY_COUNT = 2
-    MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE = 10
+    RAW_INVENTORY_CODE_KEY = RAW_INVENTORY_CODE_KEY
+    INVENTORY_CODE_KEY = INVENTORY_CODE_KEY
+    MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE = nc_abc.MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE
     MAX_CHARS_PER_MESSAGE = 1600
     MAX_ITEMS_PER_MESSAGE = 20
+    # per cycle caps on the repetitive lines, the cycle summary has the totals
+    MAX_CLIENT_LOG_LINES = 200
+    MAX_ITEM_LOG_LINES = 1000
 
     def __init__(
         self,
@@ -70,8 +110,12 @@ class InventoryMonitor:
         enable_inventory_delta_file: bool = False,
         dry_run: bool = False,
         verbose: bool = False,
+        firestore_backend: T.Optional[FirestoreBackend] = None,
+        evaluation_workers: int = 0,
+        sources: T.Optional[T.List[InventorySource]] = None,
+        metrics_file: str = "",
+        item_log_sample_every: int = 1,
     ) -> None:
-        self.download_url = self.DOWNLOAD_URL
         self.twilio_util: T.Optional[TwilioUtil] = twilio_util
         self.email: T.Optional[email.Email] = admin_email
         self.csv_file = inventory_csv_file or os.path.join(log_dir, "inventory.csv")
@@ -81,36 +125,72 @@ class InventoryMonitor:
         self.dry_run = dry_run
         self.verbose = verbose
 
+        self.client_lines = log.LineSampler(self.MAX_CLIENT_LOG_LINES)
+        self.item_lines = log.LineSampler(self.MAX_ITEM_LOG_LINES, item_log_sample_every)
+        self.cycle_stats: T.Counter[str] = collections.Counter()
+        self.stage_seconds_at_cycle_start: T.Dict[str, float] = {}
+
         self.mode = "prod" if not dry_run else "test"
 
         self.time_between_inventory_checks = (
             time_between_inventory_checks or self.TIME_BETWEEN_INVENTORY_CHECKS[self.mode]
         )
 
-        self.clients: T.Dict[str, ClientSchema] = {}
+        self.clients: T.Dict[str, ClientRow] = {}
         self.db = None
 
-        self.last_inventory: T.Optional[pd.core.frame.DataFrame] = None
-        self.new_inventory: T.Optional[pd.core.frame.DataFrame] = None
+        # the current and previous inventory, reusing the same arrays every cycle
+        self.inventory_buffers = SnapshotBuffers(self.INVENTORY_CODE_KEY)
+        # what changed in the last inventory update, clients are evaluated against these
+        self.inventory_changes: T.Dict[str, StockChange] = {}
+        self.restocks: T.Dict[str, RestockEvent] = {}
+        self.restock_events = RestockEventStream()
 
         self.skip_alerts = False
 
-        self.web = web2_client.Web2Client()
+        self.alert_coalescer = AlertCoalescer()
+        self.coalesce_alerts = False
 
         self.last_inventory_update_time: T.Optional[float] = None
-        self.last_query_firebase_time: T.Optional[float] = None
-        self.last_valid_inventory_download_size = 0
-        self.inventory_downloads_without_change = 0
-        self.last_inventory_download_size = 0
+        # the feed the inventory cycle runs on, the other sources only alert their subscribers
+        self.inventory_source = NcAbcSource(
+            self.time_between_inventory_checks,
+            self.DOWNLOAD_URL,
+            name=self.SOURCE_NAME,
+            max_consecutive_rejections=self.MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE,
+        )
+        self.inventory_validator = self.inventory_source.anomaly_validator
 
         self.enable_inventory_delta_file = enable_inventory_delta_file
 
         self.firebase_client: FirebaseClient = (
-            FirebaseClient(credentials_file, verbose) if not use_local_db else None
+            FirebaseClient(credentials_file, verbose, backend=firestore_backend)
+            if not use_local_db
+            else None
         )
 
         self.allowlist_clients = allowlist_clients
 
+        # evaluate clients in a process pool rather than one at a time in this process
+        self.sharded_evaluator: T.Optional[ShardedEvaluator] = (
+            ShardedEvaluator(evaluation_workers) if evaluation_workers > 0 else None
+        )
+
+        # additional store feeds, alerting only the clients subscribed to them
+        self.source_manager = InventorySourceManager(sources or [], primary=self.inventory_source)
+
+        self.metrics_writer: T.Optional[metrics.MetricsFileWriter] = (
+            metrics.MetricsFileWriter(metrics_file) if metrics_file else None
+        )
+
+        # armed by SIGUSR1 or the admin doc, otherwise a no-op
+        self.profiler = CycleProfiler(os.path.join(log_dir, "profiles"))
+
+        self.scheduler: T.Optional[Scheduler] = None
+        if self.firebase_client:
+            self.firebase_client.add_change_listener(self._on_firebase_change)
+            self.firebase_client.add_profile_listener(self.profiler.request)
+
     def init(self, csv_file: str = "") -> None:
         csv_file = csv_file or self.csv_file
 
@@ -125,26 +205,38 @@ class InventoryMonitor:
 
             # Check if the cleaned inventory is not None and not empty
             if cleaned_inventory is not None and not cleaned_inventory.empty:
-                self.new_inventory = cleaned_inventory
-
-                # Create a copy for last_inventory
-                self.last_inventory = self.new_inventory.copy()
+                self.inventory_buffers.current.fill(cleaned_inventory)
+                self.inventory_buffers.previous.copy_from(self.inventory_buffers.current)
             else:
                 log.format_fail_arrow(f"Failed to load or clean inventory from {csv_file}")
-                self.new_inventory = None
-                self.last_inventory = None
+                self.inventory_buffers.current.fill(None)
+                self.inventory_buffers.previous.fill(None)
 
-        if self.new_inventory is None:
+        if self.inventory_buffers.current.empty:
             log.format_fail_arrow("Inventory doesn't exist, skipping alerts")
             self.skip_alerts = True
 
     def _update_cache_from_local_db(self) -> None:
-        client_names = ClientDb.get_client_names()
-        log.print_ok(f"Found {len(client_names)} clients in local database")
-        for name in client_names:
-            with ClientDb.client(name) as client:
-                if client is not None:
-                    self.clients[name] = ClientSchema().dump(client)
+        self.clients = ClientDb.get_clients()
+        log.print_ok(f"Found {len(self.clients)} clients in local database")
+
+    @property
+    def new_inventory(self) -> T.Optional[pd.core.frame.DataFrame]:
+        current = self.inventory_buffers.current
+        return None if current.empty else current.frame()
+
+    @new_inventory.setter
+    def new_inventory(self, inventory: T.Optional[pd.core.frame.DataFrame]) -> None:
+        self.inventory_buffers.current.fill(inventory)
+
+    @property
+    def last_inventory(self) -> T.Optional[pd.core.frame.DataFrame]:
+        previous = self.inventory_buffers.previous
+        return None if previous.empty else previous.frame()
+
+    @last_inventory.setter
+    def last_inventory(self, inventory: T.Optional[pd.core.frame.DataFrame]) -> None:
+        self.inventory_buffers.previous.fill(inventory)
 
     def _is_time_to_check_inventory(self, now: float) -> bool:
         if self.last_inventory_update_time is None:
@@ -189,93 +281,46 @@ class InventoryMonitor:
         if self.firebase_client is None:
             return
 
-        update_from_firebase = False
-        if self.last_query_firebase_time is None:
-            update_from_firebase = True
-        else:
-            time_since_last_update = time.time() - self.last_query_firebase_time
-            update_from_firebase = (
-                time_since_last_update > self.TIME_BETWEEN_FIREBASE_QUERIES[self.mode]
-            )
-
-        if update_from_firebase:
-            self.last_query_firebase_time = time.time()
-            self.firebase_client.update_watchers()
-        else:
-            time_till_next_update = (
-                self.TIME_BETWEEN_FIREBASE_QUERIES[self.mode] - time_since_last_update
-            )
-            log.print_normal(
-                f"Next firebase manual refresh in {get_pretty_seconds(time_till_next_update)}"
-            )
-
-        for id, client in self.clients.items():
-            for item in client["items"]:
-                self.firebase_client.check_and_maybe_update_to_firebase(id, item["id"])
-
-        self.firebase_client.check_and_maybe_handle_firebase_db_updates()
-
-    def _check_outside_of_out_of_stock_window(
-        self,
-        client_time_out_of_stock_hours: int,
-        nc_code: int,
-        now: T.Optional[datetime.datetime] = None,
-    ) -> bool:
-        if client_time_out_of_stock_hours == 0:
-            return False
-
-        now = now or datetime.datetime.utcnow()
-
-        with ClientDb.item(nc_code) as db:
-            if db is None:
-                return False
-
-            out_of_stock_time = db.out_of_stock_time
+        with STAGE_SECONDS.time(stage="firestore_sync"):
+            self.firebase_client.check_watchers()
 
-        if out_of_stock_time is None:
-            return False
+            self.firebase_client.sync_items_to_firebase()
 
-        time_out_of_stock = now - out_of_stock_time
-        time_out_of_stock_hours = time_out_of_stock.total_seconds() / 3600
-
-        log.print_bright(
-            f"{nc_code} has been out of stock for {time_out_of_stock_hours}h {client_time_out_of_stock_hours}h"
-        )
-        if time_out_of_stock_hours <= client_time_out_of_stock_hours:
-            log.print_warn(
-                f"{nc_code} has not been out of stock long enough: {time_out_of_stock_hours}"
-            )
-            return True
-
-        return False
+            self.firebase_client.check_and_maybe_handle_firebase_db_updates()
 
     def check_client_untracked_new_inventory(
-        self, client: ClientSchema, new_items: T.List[T.Tuple[str, str, int]] = None
+        self, client: ClientRow, new_items: T.List[T.Tuple[str, str, int]] = None
     ) -> None:
         should_update_new_data = client["update_on_new_data"]
 
         if not should_update_new_data:
-            log.print_normal_arrow("Not checking new inventory because client has disabled it")
+            self.client_lines.print(
+                log.print_normal_arrow, "Not checking new inventory because client has disabled it"
+            )
             return
 
         if new_items is None:
-            log.print_normal_arrow("No new items to check")
+            self.client_lines.print(log.print_normal_arrow, "No new items to check")
             return
 
-        log.print_bright(f"Checking {len(new_items)} new items...")
+        self.client_lines.print(log.print_bright, f"Checking {len(new_items)} new items...")
 
         items_to_update = [i for i in new_items if i not in client["items"]]
         self._maybe_send_alerts(client, new_items, is_new_inventory=True)
 
     def check_client_inventory(
-        self, client: ClientSchema, now: T.Optional[datetime.datetime] = None
+        self, client: ClientRow, now: T.Optional[datetime.datetime] = None
     ) -> None:
-        if self.verbose:
-            log.print_bold(f"Checking {json.dumps(client, indent=4)}")
-
         if not client:
             return
 
+        if self.verbose:
+            self.client_lines.print(
+                log.print_bold,
+                f"Checking {client['id']}: {len(client['items'])} items, "
+                f"{len(client['tracked_items'])} tracked, threshold {client['threshold_inventory']}",
+            )
+
         now = now or datetime.datetime.utcnow()
 
         with ClientDb.client(client["id"]) as db:
@@ -292,84 +337,67 @@ class InventoryMonitor:
                     phone_number["number"], not client["alert_range_enabled"]
                 )
 
-        client_items = {i["id"]: i for i in client["items"]}
-        log.print_bright(f"Checking {len(client_items.keys())} items...")
+        client_items = [i["id"] for i in client["items"]]
+        record = ClientRecord.from_schema(client)
+        self.client_lines.print(log.print_bright, f"Checking {len(client_items)} items...")
+        item_lines = self.item_lines
+        stats = self.cycle_stats
+        items_tracking = {t["nc_code"] for t in client["tracked_items"]}
+        in_inventory = self.inventory_buffers.current.index()
 
-        for nc_code, item_schema in client_items.items():
+        for nc_code in client_items:
+            stats["items_checked"] += 1
             if self.verbose:
-                log.print_ok_arrow(f"Checking {nc_code}")
+                item_lines.print(log.print_ok_arrow, f"Checking {nc_code}")
 
-            items_tracking = [t["nc_code"] for t in client["tracked_items"]]
             if nc_code not in items_tracking:
-                log.print_normal_arrow(f"Skipping {nc_code} because it is not being tracked")
+                item_lines.print(
+                    log.print_normal_arrow, f"Skipping {nc_code} because it is not being tracked"
+                )
                 continue
 
-            item_df: pd.core.series.Series = self._get_item_from_inventory(
-                item_schema["id"], self.new_inventory
-            )
-
-            if item_df is None:
+            if nc_code not in in_inventory:
+                item_lines.print(log.print_warn, f"Did not find {nc_code} in inventory")
                 self._set_inventory_to_zero(nc_code)
                 continue
 
-            self._update_local_db_item(client["id"], item_df, now)
-
-            if item_df.total_available == 0:
-                if self.verbose:
-                    log.print_normal_arrow(f"{nc_code} is out of stock")
+            # an item can only have come back in stock if it changed
+            change = self.inventory_changes.get(nc_code)
+            if change is None:
                 continue
 
-            previous_item: pd.core.series.Series = self._get_item_from_inventory(
-                item_schema["id"], self.last_inventory
-            )
-
-            if previous_item is None:
-                log.print_fail(f"{nc_code} was not previously in inventory")
-                previous_available = 0
-            else:
-                previous_available = previous_item.total_available
-
-            delta = item_df.total_available - previous_available
-            if delta > 0:
-                delta_str = log.format_ok(f"+{delta}")
-            elif delta < 0:
-                delta_str = log.format_fail(f"{delta}")
-            else:
-                delta_str = log.format_normal(f"{delta}")
-
-            brand_name = item_df.brand_name
+            previous_available, available = change
+            delta = available - previous_available
+            stats["items_changed"] += 1
+            stats["units_added" if delta > 0 else "units_removed"] += abs(delta)
 
-            if self.verbose or delta != 0:
+            if item_lines.allow():
+                if delta > 0:
+                    delta_str = log.format_ok(f"+{delta}")
+                else:
+                    delta_str = log.format_fail(f"{delta}")
                 log.print_normal_arrow(
-                    f"{nc_code}: Previous inventory: {previous_available}, Current inventory: {item_df.total_available}"
-                )
-                log.print_ok_blue_arrow(
-                    f"{STOCK_EMOJI} {nc_code} {brand_name} change: {delta_str} units"
+                    f"{nc_code}: Previous inventory: {previous_available}, Current inventory: {available}"
                 )
+                log.print_ok_blue_arrow(f"{STOCK_EMOJI} {nc_code} change: {delta_str} units")
 
-            if previous_item is not None and previous_available != 0:
+            event = self.restocks.get(nc_code)
+            if event is None:
                 if self.verbose:
-                    log.print_normal_arrow(f"No alert, {nc_code} was previously in stock")
-                continue
-
-            inventory_threshold = client["threshold_inventory"]
-
-            if delta < inventory_threshold:
-                log.print_normal_arrow(
-                    f"{nc_code} is below inventory threshold of {inventory_threshold}"
-                )
+                    item_lines.print(
+                        log.print_normal_arrow, f"No alert, {nc_code} did not come back in stock"
+                    )
                 continue
 
-            if self._check_outside_of_out_of_stock_window(
-                client["min_hours_since_out_of_stock"], nc_code, now
-            ):
-                log.print_normal_arrow(f"{nc_code} is inside of out of stock window")
+            reason = restock_skip_reason(event, record, now)
+            if reason is not None:
+                item_lines.print(log.print_normal_arrow, reason)
                 continue
 
             if self.skip_alerts:
                 continue
 
-            items_to_update.append((nc_code, brand_name, item_df.total_available))
+            items_to_update.append((nc_code, event.brand_name, event.available))
 
         self._maybe_send_alerts(client, items_to_update)
 
@@ -379,47 +407,40 @@ class InventoryMonitor:
 
         return client_id in self.allowlist_clients
 
+    @contextlib.contextmanager
+    def _coalesced_alerts(self) -> T.Iterator[None]:
+        """
+        Hold alerts generated inside this block and send them once per destination
+        when it exits, so clients sharing a phone number or email get one message.
+        """
+        self.coalesce_alerts = True
+        try:
+            yield
+        finally:
+            self.coalesce_alerts = False
+            self._dispatch_alerts()
+
     def _maybe_send_alerts(
-        self, client: ClientSchema, items_to_update: T.List[T.Tuple], is_new_inventory: bool = False
+        self, client: ClientRow, items_to_update: T.List[T.Tuple], is_new_inventory: bool = False
     ) -> None:
-        message = "NC ABC Inventory Alert\n" if not is_new_inventory else "NC ABC New Item Alert\n"
-
-        new_data_email_alerts = not is_new_inventory or client["enable_new_data_email_alert"]
-        new_data_sms_alerts = not is_new_inventory or client["enable_new_data_sms_alert"]
-
-        for info in items_to_update:
-            nc_code, brand_name, total_available = info
-            message += (
-                f"{STOCK_EMOJI} {nc_code}: {brand_name} is now in stock with {total_available}\n\n"
-            )
-
-            with ClientDb.client(client["id"]) as db:
-                if db is None:
-                    break
-                db.updates_sent += 1
-
         if not items_to_update:
             if self.verbose:
                 log.print_normal_arrow("No items to update, not sending any alerts")
             return
 
+        with ClientDb.client(client["id"]) as db:
+            if db is not None:
+                db.updates_sent += len(items_to_update)
+
         if not client["has_paid"]:
             log.print_warn("Not sending alert, client has not paid")
             return
 
-        if (
-            len(items_to_update) > self.MAX_ITEMS_PER_MESSAGE
-            or len(message) > self.MAX_CHARS_PER_MESSAGE
-        ):
-            sms_message = (
-                f"NC ABC Inventory Alert\n{STOCK_EMOJI}\n\n{len(items_to_update)} new items in stock\n"
-                "Not texting full list since there were too many items updated at once.\n"
-                "Please check your email for the full list.\n\n"
-            )
-        else:
-            sms_message = message
-
-        log.print_ok(sms_message)
+        items = [AlertItem(*info) for info in items_to_update]
+        header = NEW_ITEM_ALERT_HEADER if is_new_inventory else INVENTORY_ALERT_HEADER
+        self.cycle_stats["clients_alerted"] += 1
+        self.cycle_stats["items_alerted"] += len(items)
+        self.client_lines.print(log.print_ok, format_alert_items(header, items))
 
         if self.dry_run:
             log.print_normal_arrow("Dry run, not sending SMS or email")
@@ -429,6 +450,9 @@ class InventoryMonitor:
             log.print_normal_arrow("Client is not allowed to send SMS")
             return
 
+        new_data_email_alerts = not is_new_inventory or client["enable_new_data_email_alert"]
+        new_data_sms_alerts = not is_new_inventory or client["enable_new_data_sms_alert"]
+
         if (
             client["phone_numbers"]
             and client["phone_alerts"]
@@ -436,20 +460,62 @@ class InventoryMonitor:
             and self.twilio_util
         ):
             for phone_number in client["phone_numbers"]:
-                self.twilio_util.send_sms_if_in_window(
-                    phone_number["number"],
-                    sms_message,
+                self.alert_coalescer.add(
+                    Channel.SMS, phone_number["number"], client["id"], items, is_new_inventory
                 )
 
         if client["email"] and client["email_alerts"] and new_data_email_alerts and self.email:
+            self.alert_coalescer.add(
+                Channel.EMAIL, client["email"], client["id"], items, is_new_inventory
+            )
+
+        if not self.coalesce_alerts:
+            self._dispatch_alerts()
+
+    def _format_alert(self, alert: CoalescedAlert) -> str:
+        message = format_alert_message(alert)
+
+        if len(alert.client_ids) > 1:
+            log.print_normal_arrow(
+                f"Merged alerts for {', '.join(alert.client_ids)} to {alert.address}"
+            )
+
+        if alert.channel == Channel.SMS and (
+            alert.num_items > self.MAX_ITEMS_PER_MESSAGE
+            or len(message) > self.MAX_CHARS_PER_MESSAGE
+        ):
+            message = (
+                f"NC ABC Inventory Alert\n{STOCK_EMOJI}\n\n{alert.num_items} new items in stock\n"
+                "Not texting full list since there were too many items updated at once.\n"
+                "Please check your email for the full list.\n\n"
+            )
+        return message
+
+    def _deliver_alert(self, alert: CoalescedAlert, message: str) -> None:
+        ALERTS_SENT.inc(channel=alert.channel.value)
+        if alert.channel == Channel.SMS and self.twilio_util:
+            self.twilio_util.send_sms_if_in_window(alert.address, message)
+        elif alert.channel == Channel.EMAIL and self.email:
             email.send_email(
                 emails=[self.email],
-                to_addresses=[client["email"]],
+                to_addresses=[alert.address],
                 subject=f"{STOCK_EMOJI} NC ABC Inventory Alert",
                 content=message,
                 verbose=True,
             )
 
+    def _dispatch_alerts(self) -> None:
+        alerts = self.alert_coalescer.drain()
+
+        if not alerts:
+            return
+
+        log.print_bold(f"Dispatching {len(alerts)} alerts")
+
+        with STAGE_SECONDS.time(stage="alert_dispatch"):
+            for alert in alerts:
+                self._deliver_alert(alert, self._format_alert(alert))
+
     def _df_to_real_json(self, dataframe: pd.core.frame.DataFrame) -> T.Dict[str, T.Any]:
         if dataframe is None:
             return {}
@@ -463,6 +529,8 @@ class InventoryMonitor:
         if not self.enable_inventory_delta_file:
             return
 
+        import deepdiff
+
         new_json = self._df_to_real_json(self.new_inventory)
         last_json = self._df_to_real_json(self.last_inventory)
 
@@ -487,119 +555,92 @@ class InventoryMonitor:
 
         log.print_normal(f"Changes in inventory:\n{diff_json}")
 
-    def _get_item_from_inventory(
-        self, nc_code: int, dataframe: pd.core.frame.DataFrame
-    ) -> T.Optional[pd.Series]:
-        if dataframe is None or dataframe.empty:
-            log.print_warn("No inventory loaded")
-            return None
-
-        inventory_codes = dataframe[self.INVENTORY_CODE_KEY]
-        matches: pd.core.frame.DataFrame = dataframe[inventory_codes == nc_code]
-
-        if matches.empty:
-            log.print_warn(f"Did not find {nc_code} in inventory")
-            return None
-        return matches.iloc[0]
-
     def _clean_inventory(self, csv_file: str) -> pd.core.frame.DataFrame:
-        chunk_size = 4096
-        processed_chunks = []
-
-        try:
-            with pd.read_csv(csv_file, chunksize=chunk_size) as reader:
-                for chunk in reader:
-                    # clean up the code column
-                    chunk[self.RAW_INVENTORY_CODE_KEY] = chunk[
-                        self.RAW_INVENTORY_CODE_KEY
-                    ].str.replace(r"=\"(.*)\"", r"\1", regex=True)
-                    # Sanitize column names
-                    chunk.columns = [_sanitize_column_name(col) for col in chunk.columns]
-
-                    processed_chunks.append(chunk)
-        except:
-            log.print_fail(f"Error parsing inventory file")
-            return None
-
-        dataframe = pd.concat(processed_chunks, ignore_index=True)
-        return dataframe
+        return clean_inventory_csv(csv_file)
 
-    def _is_inventory_valid(self, inventory: pd.core.frame.DataFrame) -> bool:
-        if len(inventory) == 0:
-            log.print_fail("No inventory found")
-            self.last_inventory_update_time = time.time()
-            return False
-
-        if self.last_inventory_download_size == len(inventory):
-            self.inventory_downloads_without_change += 1
-        else:
-            self.inventory_downloads_without_change = 0
-
-        override_delta_requirement = (
-            self.inventory_downloads_without_change > self.MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE
-        )
-
-        self.last_inventory_download_size = len(inventory)
+    def _is_inventory_valid(self, snapshot: InventorySnapshot) -> bool:
+        reason = self.inventory_source.validate(snapshot, None)
+        if not reason:
+            return True
 
-        change_in_inventory = self.last_valid_inventory_download_size - len(inventory)
-        if (
-            not override_delta_requirement
-            and change_in_inventory >= self.MAX_DELTA_IN_INVENTORY_COUNT
-        ):
-            log.print_warn(
-                f"Inventory size delta is too large: {change_in_inventory}. Not using inventory."
-            )
-            self.last_inventory_update_time = time.time()
-            return False
+        log.print_warn(f"Inventory rejected, {reason}. Not using inventory.")
+        if self.inventory_validator.last_reason is not None:
+            SNAPSHOTS_REJECTED.inc(reason=self.inventory_validator.last_reason.value)
+        self.last_inventory_update_time = time.time()
+        return False
 
-        self.last_valid_inventory_download_size = len(inventory)
-        self.inventory_downloads_without_change = 0
-        return True
+    def _rotate_inventory(self) -> None:
+        # nothing has changed until the next inventory is loaded
+        self.inventory_changes = {}
+        self.restocks = {}
+        if not self.inventory_buffers.current.empty:
+            self.inventory_buffers.rotate()
 
     def update_inventory(
         self,
-        download_url: str,
+        download_url: str = "",
         now: float = None,
         skip_db_add: bool = False,
     ) -> T.Optional[T.List[T.Tuple[str, str, int]]]:
-        if self.new_inventory is not None:
-            self.last_inventory = self.new_inventory
-            self.new_inventory = None
-            gc.collect()
+        """Fetch, parse and validate the primary source, download_url overrides its url"""
+        self._start_cycle_summary()
+        self._rotate_inventory()
 
         now = now or time.time()
+        download_url = download_url or self.inventory_source.url
 
-        with tempfile.NamedTemporaryFile(suffix=".csv") as csv_file:
-            if os.path.isfile(download_url):
-                log.print_bold(f"Downloading inventory from {download_url}...")
-                shutil.copyfile(download_url, csv_file.name)
-            elif self._is_time_to_check_inventory(now):
-                log.print_bold(f"Downloading inventory from {download_url}...")
-                try:
-                    self.web.url_download(
-                        download_url, csv_file.name, headers=HEADERS, timeout=30.0
-                    )
-                except Exception as e:
-                    log.print_fail(f"Error downloading inventory: {e}")
-            else:
-                log.print_normal_arrow("Not time to check inventory")
-                self.new_inventory = self.last_inventory
-                return None
+        if not os.path.isfile(download_url) and not self._is_time_to_check_inventory(now):
+            log.print_normal_arrow("Not time to check inventory")
+            self.inventory_buffers.restore()
+            return None
 
-            self.new_inventory = self._clean_inventory(csv_file.name)
+        log.print_bold(f"Downloading inventory from {download_url}...")
+        try:
+            with STAGE_SECONDS.time(stage="download"):
+                csv_file = self.inventory_source.fetch(download_url)
+        except Exception as e:  # pylint: disable=broad-except
+            log.print_fail(f"Error downloading inventory: {e}")
+            self.inventory_buffers.restore()
+            return None
 
-            if self.new_inventory is None or self.new_inventory.empty:
-                log.print_fail("Failed to download inventory")
-                self.new_inventory = self.last_inventory
-                return None
+        return self._load_inventory(csv_file, now, skip_db_add)
 
-            if not self._is_inventory_valid(self.new_inventory):
-                log.print_fail("Inventory is not valid, setting to last inventory")
-                self.new_inventory = self.last_inventory
-                return None
+    def _load_inventory(
+        self, csv_file: str, now: float, skip_db_add: bool = False
+    ) -> T.Optional[T.List[T.Tuple[str, str, int]]]:
+        """Validate a downloaded inventory file and update the items database from it"""
+        with STAGE_SECONDS.time(stage="parse"):
+            try:
+                snapshot = self.inventory_source.parse(csv_file)
+            except ValueError as e:
+                log.print_fail(f"Error parsing inventory: {e}")
+                snapshot = None
+
+        if snapshot is None or snapshot.empty:
+            log.print_fail("Failed to download inventory")
+            self.inventory_buffers.restore()
+            return None
+
+        with STAGE_SECONDS.time(stage="validate"):
+            is_valid = self._is_inventory_valid(snapshot)
+        if not is_valid:
+            log.print_fail("Inventory is not valid, setting to last inventory")
+            self.inventory_buffers.restore()
+            return None
+
+        current = self.inventory_buffers.current
+        current.fill(snapshot.inventory)
+        # the parsed frame is garbage from here on, let it go before the db writes
+        del snapshot
+        for buffer, nbytes in (
+            ("current", current.nbytes()),
+            ("previous", self.inventory_buffers.previous.nbytes()),
+        ):
+            SNAPSHOT_BYTES.set(nbytes, buffer=buffer)
 
-            log.print_ok_arrow(f"Downloaded {len(self.new_inventory)} items")
-            shutil.copy(csv_file.name, self.csv_file)
+        ROWS_PROCESSED.inc(len(current), source=self.SOURCE_NAME)
+        log.print_ok_arrow(f"Downloaded {len(current)} items")
+        shutil.copy(csv_file, self.csv_file)
 
         self._write_inventory_delta_file()
         self.last_inventory_update_time = now
@@ -607,7 +648,7 @@ class InventoryMonitor:
         now_datetime = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
 
         def generate_new_items():
-            for item in self.new_inventory.itertuples(index=False):
+            for item in current.rows():
                 try:
                     is_new = skip_db_add or self._update_local_db_item("", item, now_datetime)
                     if not is_new:
@@ -621,11 +662,42 @@ class InventoryMonitor:
                 brand_name = item.brand_name
                 yield (nc_code, brand_name, inventory_available)
 
-        new_items = list(generate_new_items())
+        with STAGE_SECONDS.time(stage="db_write"):
+            new_items = list(generate_new_items())
+
+        with STAGE_SECONDS.time(stage="diff"):
+            self._publish_inventory_changes(now_datetime)
 
         log.print_bold(f"Found {len(new_items) if new_items else 0} new items")
         return new_items
 
+    def _publish_inventory_changes(self, now: datetime.datetime) -> None:
+        """Diff the new inventory against the previous one and publish the restocks"""
+        current = self.inventory_buffers.current
+        previous = self.inventory_buffers.previous
+        self.inventory_changes = diff_stock(previous.stock(), current.stock())
+
+        # without a previous inventory every item in stock would look like a restock
+        if previous.empty or self.skip_alerts:
+            log.print_normal_arrow("No previous inventory, not publishing restocks")
+            return
+
+        events = find_restocks(
+            self.inventory_changes,
+            lambda nc_code: current.get(nc_code).brand_name,
+            ClientDb.get_out_of_stock_times,
+            self.SOURCE_NAME,
+            now,
+        )
+        events = self.restock_events.publish(events)
+        self.restocks = {event.nc_code: event for event in events}
+
+        RESTOCK_EVENTS.inc(len(events), source=self.SOURCE_NAME)
+        self.cycle_stats["restock_events"] += len(events)
+        log.print_bold(
+            f"{len(self.inventory_changes)} items changed, {len(events)} came back in stock"
+        )
+
     def _update_sms_time_window(self, name: str) -> None:
         with ClientDb.client(name) as db:
             if db is None:
@@ -651,22 +723,19 @@ class InventoryMonitor:
 
         if not self.clients:
             log.print_fail("No clients to check inventory for")
-            self.firebase_client.update_watchers()
-            self.last_query_firebase_time = time.time()
+            if self.firebase_client:
+                self.firebase_client.update_watchers()
             return
 
-        for name, client in self.clients.items():
-            log.print_bold(f"{'─' * 80}")
-            log.print_bold(f"Checking inventory for {name}...")
-            self._update_sms_time_window(name)
-            log.print_bold(f"Checking monitored inventory")
-            self.check_client_inventory(client)
-            log.print_ok_blue_arrow("...Done")
-            log.print_bold(f"Checking untracked new inventory")
-            self.check_client_untracked_new_inventory(client, new_items)
-            log.print_ok_blue_arrow("...Done")
+        CLIENTS.set(len(self.clients))
+        TRACKED_ITEMS.set(sum(len(c["tracked_items"]) for c in self.clients.values()))
 
-        log.print_bold(f"{'─' * 80}")
+        # includes dispatching the alerts, which is also timed on its own
+        with STAGE_SECONDS.time(stage="evaluate"):
+            if self.sharded_evaluator is not None:
+                self._check_clients_sharded(new_items)
+            else:
+                self._check_clients(new_items)
 
         for name, client in self.clients.items():
             self._update_sms_time_window(name)
@@ -676,12 +745,248 @@ class InventoryMonitor:
 
         self._check_and_see_if_firebase_should_be_updated()
         self.skip_alerts = False
+        self._log_cycle_summary()
+
+    @staticmethod
+    def _stage_seconds() -> T.Dict[str, float]:
+        return {stage: series["sum"] for stage, series in STAGE_SECONDS.to_json().items()}
+
+    def _start_cycle_summary(self) -> None:
+        self.stage_seconds_at_cycle_start = self._stage_seconds()
+
+    def _log_cycle_summary(self) -> None:
+        """One record per cycle with the counts and timings that the sampled lines leave out"""
+        timings = {
+            stage: round(total - self.stage_seconds_at_cycle_start.get(stage, 0.0), 3)
+            for stage, total in self._stage_seconds().items()
+            if stage not in self.BACKGROUND_STAGES
+        }
+
+        summary: T.Dict[str, T.Any] = {
+            "clients": len(self.clients),
+            "tracked_items": sum(len(c["tracked_items"]) for c in self.clients.values()),
+            "inventory_rows": len(self.inventory_buffers.current),
+            "snapshot_bytes": self.inventory_buffers.current.nbytes()
+            + self.inventory_buffers.previous.nbytes(),
+        }
+        summary.update(sorted(self.cycle_stats.items()))
+        summary["client_lines_dropped"] = self.client_lines.reset()
+        summary["item_lines_dropped"] = self.item_lines.reset()
+        summary["seconds"] = timings
+        self.cycle_stats.clear()
+
+        log.event("cycle_summary", **summary)
+        log.print_bright(
+            "Cycle summary: " + ", ".join(f"{k} {v}" for k, v in summary.items() if k != "seconds")
+        )
+
+    def _check_clients(self, new_items: T.List[T.Tuple[str, str, int]]) -> None:
+        with self._coalesced_alerts():
+            for name, client in self.clients.items():
+                self.client_lines.print(log.print_bold, f"{'─' * 80}")
+                self.client_lines.print(log.print_bold, f"Checking inventory for {name}...")
+                self._update_sms_time_window(name)
+                self.check_client_inventory(client)
+                self.check_client_untracked_new_inventory(client, new_items)
+
+            log.print_bold(f"{'─' * 80}")
+
+    def _check_clients_sharded(self, new_items: T.List[T.Tuple[str, str, int]]) -> None:
+        """
+        Evaluate tracked items for every client across the process pool, then apply the
+        database updates and send the alerts from this process. Alerts come from the cycle's
+        restock events, the same as check_client_inventory.
+        """
+        now = datetime.datetime.utcnow()
+
+        records = [ClientRecord.from_schema(client) for client in self.clients.values()]
+        snapshot_path = self.sharded_evaluator.write_snapshot(
+            self.new_inventory, self.INVENTORY_CODE_KEY
+        )
+        restocks = {} if self.skip_alerts else self.restocks
+        result = self.sharded_evaluator.evaluate(snapshot_path, records, restocks, now)
+        log.print_bold(
+            f"Evaluated {len(records)} clients across {self.sharded_evaluator.num_workers} "
+            f"workers, {len(result.alerts)} have alerts"
+        )
+
+        if self.last_inventory_update_time:
+            ClientDb.set_last_updated(
+                self.clients.keys(),
+                datetime.datetime.fromtimestamp(self.last_inventory_update_time),
+            )
+        for nc_code in result.missing_nc_codes:
+            self._set_inventory_to_zero(nc_code)
+        for nc_code in result.out_of_stock_nc_codes:
+            ClientDb.add_or_update_item(nc_code, out_of_stock_time=now)
+
+        alerts = {intent.client_id: intent for intent in result.alerts}
+
+        with self._coalesced_alerts():
+            for name, client in self.clients.items():
+                self._update_sms_time_window(name)
+                if self.twilio_util:
+                    for phone_number in client["phone_numbers"]:
+                        self.twilio_util.set_ignore_time_window(
+                            phone_number["number"], not client["alert_range_enabled"]
+                        )
+
+                intent = alerts.get(name)
+                if intent is not None:
+                    items_to_update = [
+                        (nc_code, restocks[nc_code].brand_name, available)
+                        for nc_code, available in intent.items
+                    ]
+                    self._maybe_send_alerts(client, items_to_update)
+
+                self.check_client_untracked_new_inventory(client, new_items)
+
+    def _check_source(self, name: str) -> None:
+        """Alert the clients subscribed to a secondary source on its latest snapshot"""
+        source = self.source_manager.sources[name]
+        if name not in self.source_manager.previous_snapshots:
+            log.print_normal_arrow(f"First {source.display_name} inventory, skipping alerts")
+            return
+
+        restocks = self._publish_source_changes(name)
+        if not restocks:
+            return
+
+        self._update_cache_from_local_db()
+        subscribers = [c for c in ClientDb.get_source_subscribers(name) if c in self.clients]
+        now = datetime.datetime.utcnow()
+
+        with self._coalesced_alerts():
+            for client_id in subscribers:
+                client = self.clients[client_id]
+                items = restock_alerts(restocks, ClientRecord.from_schema(client), now)
+                if not items:
+                    continue
+
+                self._update_sms_time_window(client_id)
+                items_to_update = [
+                    (nc_code, f"{restocks[nc_code].brand_name} ({source.display_name})", available)
+                    for nc_code, available in items
+                ]
+                self._maybe_send_alerts(client, items_to_update)
+
+    def _publish_source_changes(self, name: str) -> T.Dict[str, RestockEvent]:
+        snapshot = self.source_manager.snapshots[name]
+        out_of_stock_times = self.source_manager.out_of_stock_times[name]
+        events = find_restocks(
+            diff_stock(self.source_manager.previous_snapshots[name].stock(), snapshot.stock()),
+            snapshot.brand_names().get,
+            lambda nc_codes: {c: out_of_stock_times.get(c) for c in nc_codes},
+            name,
+            datetime.datetime.fromtimestamp(snapshot.fetched_at, datetime.timezone.utc),
+        )
+        events = self.restock_events.publish(events)
+        RESTOCK_EVENTS.inc(len(events), source=name)
+        self.cycle_stats["restock_events"] += len(events)
+        return {event.nc_code: event for event in events}
+
+    def _run_sources_task(self) -> float:
+        with STAGE_SECONDS.time(stage="source_poll"):
+            updated = self.source_manager.poll_due()
+        for name in updated:
+            self._check_source(name)
+        return self.source_manager.time_till_next_poll()
+
+    def _time_till_inventory_check(self, now: T.Optional[float] = None) -> float:
+        if self.last_inventory_update_time is None:
+            return self.WAIT_TIME
+
+        now = now or time.time()
+        time_till_next_update = self.time_between_inventory_checks - (
+            now - self.last_inventory_update_time
+        )
+        # failed downloads don't move the update time, so retry those at the old loop rate
+        return max(time_till_next_update + 1.0, self.WAIT_TIME)
+
+    def _run_inventory_task(self) -> float:
+        with self.profiler.cycle(), STAGE_SECONDS.time(stage="cycle"):
+            new_items = self.update_inventory()
+
+            # nothing was downloaded so there is nothing new to alert on
+            if new_items is not None:
+                self._check_inventory(new_items)
+
+        time_till_next_update = self._time_till_inventory_check()
+        log.print_normal(f"Time till inventory update: {get_pretty_seconds(time_till_next_update)}")
+        return time_till_next_update
+
+    def _run_firebase_task(self) -> None:
+        with STAGE_SECONDS.time(stage="firestore_watch"):
+            self.firebase_client.check_watchers()
+            self.firebase_client.check_and_maybe_handle_firebase_db_updates()
+
+    def _release_queued_sms(self) -> None:
+        if not self.twilio_util:
+            return
+
+        now = datetime.datetime.utcnow()
+        for phone_number, messages in list(self.twilio_util.message_queue.items()):
+            if messages:
+                self.twilio_util.check_sms_queue(phone_number, now)
+
+    def _on_firebase_change(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.trigger("firebase")
+
+    def build_scheduler(self) -> Scheduler:
+        scheduler = Scheduler()
+        if self.firebase_client:
+            scheduler.add_task(
+                "health_ping", self.firebase_client.health_ping, FirebaseClient.HEALTH_PING_TIME
+            )
+        scheduler.add_task(
+            "inventory", self._run_inventory_task, self.time_between_inventory_checks
+        )
+        if self.source_manager.next_poll:
+            # each source keeps its own interval, this task wakes up for whichever is due
+            scheduler.add_task("sources", self._run_sources_task, self.WAIT_TIME)
+        if self.firebase_client:
+            scheduler.add_task(
+                "firebase", self._run_firebase_task, self.TIME_BETWEEN_FIREBASE_CHECKS[self.mode]
+            )
+        scheduler.add_task(
+            "sms_queue",
+            self._release_queued_sms,
+            self.TIME_BETWEEN_SMS_QUEUE_CHECKS,
+            run_immediately=False,
+        )
+        if self.metrics_writer is not None:
+            scheduler.add_task(
+                "metrics",
+                self.metrics_writer.write,
+                self.TIME_BETWEEN_METRICS_WRITES,
+                run_immediately=False,
+            )
+        return scheduler
+
+    def run_forever(self) -> None:
+        """
+        Run each task only when its timer is due or an event (e.g. a firestore change)
+        triggers it, sleeping in between.
+        """
+        self.scheduler = self.build_scheduler()
+        try:
+            self.scheduler.run_forever()
+        finally:
+            self.scheduler = None
+            self.close()
+
+    def close(self) -> None:
+        """Stop the evaluation workers and the inventory sources and remove their temporary files"""
+        if self.sharded_evaluator is not None:
+            self.sharded_evaluator.close()
+        self.source_manager.close()
 
     def run(self) -> None:
         if self.firebase_client:
             self.firebase_client.health_ping()
 
-        new_items = self.update_inventory(self.download_url)
+        new_items = self.update_inventory()
 
         self._check_inventory(new_items)
 
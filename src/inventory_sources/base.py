@@ -0,0 +1,91 @@
+"""
+Common interface for inventory feeds. A source fetches its raw feed, parses it into an
+InventorySnapshot with the standard columns and runs its validators against the previous
+accepted snapshot before the snapshot is used for alerts.
+"""
+
+import abc
+import time
+import typing as T
+
+import pandas as pd
+
+NC_CODE = "nc_code"
+BRAND_NAME = "brand_name"
+TOTAL_AVAILABLE = "total_available"
+SNAPSHOT_COLUMNS = [NC_CODE, BRAND_NAME, TOTAL_AVAILABLE]
+
+
+class InventorySnapshot:
+    def __init__(
+        self, source: str, inventory: pd.core.frame.DataFrame, fetched_at: T.Optional[float] = None
+    ) -> None:
+        missing_columns = [c for c in SNAPSHOT_COLUMNS if c not in inventory.columns]
+        if missing_columns:
+            raise ValueError(f"{source} snapshot is missing columns: {missing_columns}")
+
+        self.source = source
+        self.inventory = inventory
+        self.fetched_at = fetched_at or time.time()
+
+    def __len__(self) -> int:
+        return len(self.inventory)
+
+    @property
+    def empty(self) -> bool:
+        return self.inventory.empty
+
+    def stock(self) -> T.Dict[str, int]:
+        inventory = self.inventory.drop_duplicates(NC_CODE)
+        return dict(zip(inventory[NC_CODE], inventory[TOTAL_AVAILABLE].astype(int)))
+
+    def brand_names(self) -> T.Dict[str, str]:
+        inventory = self.inventory.drop_duplicates(NC_CODE)
+        return dict(zip(inventory[NC_CODE], inventory[BRAND_NAME]))
+
+
+class SnapshotValidator(abc.ABC):
+    @abc.abstractmethod
+    def validate(
+        self, snapshot: InventorySnapshot, previous: T.Optional[InventorySnapshot]
+    ) -> T.Optional[str]:
+        """Return the reason the snapshot should be rejected, or None if it is usable"""
+
+
+class InventorySource(abc.ABC):
+    """
+    A store feed. Subclasses implement fetch and parse, the rest of the pipeline only
+    deals with snapshots.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        poll_interval: float,
+        display_name: str = "",
+        validators: T.Optional[T.List[SnapshotValidator]] = None,
+    ) -> None:
+        self.name = name
+        self.display_name = display_name or name
+        self.poll_interval = poll_interval
+        self.validators: T.List[SnapshotValidator] = validators or []
+
+    @abc.abstractmethod
+    def fetch(self) -> T.Any:
+        """Download the raw feed"""
+
+    @abc.abstractmethod
+    def parse(self, raw: T.Any) -> InventorySnapshot:
+        """Convert the raw feed into a snapshot with the standard columns"""
+
+    def validate(
+        self, snapshot: InventorySnapshot, previous: T.Optional[InventorySnapshot]
+    ) -> T.Optional[str]:
+        for validator in self.validators:
+            reason = validator.validate(snapshot, previous)
+            if reason:
+                return reason
+        return None
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,116 @@
+"""
+Polls a set of inventory sources, each on its own interval. Sources that are due are
+fetched concurrently, since the time is almost all spent waiting on the network, and
+each accepted snapshot replaces that source's current one. The primary source is registered
+alongside them but driven by the monitor's own inventory cycle.
+"""
+
+import concurrent.futures
+import datetime
+import time
+import typing as T
+
+from inventory_sources.base import InventorySnapshot, InventorySource
+from util import log, metrics
+
+ROWS_PROCESSED = metrics.REGISTRY.counter(
+    "inventory_monitor_rows_processed_total", "Inventory rows loaded", ["source"]
+)
+
+
+class InventorySourceManager:
+    def __init__(
+        self,
+        sources: T.List[InventorySource],
+        clock: T.Callable[[], float] = time.time,
+        primary: T.Optional[InventorySource] = None,
+    ) -> None:
+        all_sources = sources + [primary] if primary is not None else sources
+        all_names = [source.name for source in all_sources]
+        if len(set(all_names)) != len(all_names):
+            raise ValueError(f"Inventory source names must be unique: {all_names}")
+
+        self.sources: T.Dict[str, InventorySource] = {s.name: s for s in all_sources}
+        self.primary = primary
+        self.clock = clock
+
+        # only the secondary sources are polled here
+        names = [source.name for source in sources]
+
+        self.snapshots: T.Dict[str, InventorySnapshot] = {}
+        self.previous_snapshots: T.Dict[str, InventorySnapshot] = {}
+        # when each item was last seen going out of stock, per source
+        self.out_of_stock_times: T.Dict[str, T.Dict[str, datetime.datetime]] = {
+            name: {} for name in names
+        }
+        self.next_poll: T.Dict[str, float] = {name: 0.0 for name in names}
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(sources)), thread_name_prefix="InventorySource"
+        )
+
+    def time_till_next_poll(self, now: T.Optional[float] = None) -> float:
+        if not self.next_poll:
+            return float("inf")
+        now = now or self.clock()
+        return max(0.0, min(self.next_poll.values()) - now)
+
+    def _fetch_and_parse(self, source: InventorySource) -> InventorySnapshot:
+        return source.parse(source.fetch())
+
+    def poll_due(self) -> T.List[str]:
+        """Poll every source that is due and return the names of those with a new snapshot"""
+        now = self.clock()
+        due = [self.sources[name] for name, next_poll in self.next_poll.items() if next_poll <= now]
+        if not due:
+            return []
+
+        futures = {
+            source.name: self.executor.submit(self._fetch_and_parse, source) for source in due
+        }
+
+        updated = []
+        for source in due:
+            self.next_poll[source.name] = now + source.poll_interval
+            try:
+                snapshot = futures[source.name].result()
+            except Exception as e:  # pylint: disable=broad-except
+                log.print_fail(f"Error polling {source.display_name}: {e}")
+                continue
+
+            if self.accept(source, snapshot):
+                updated.append(source.name)
+
+        return updated
+
+    def accept(self, source: InventorySource, snapshot: InventorySnapshot) -> bool:
+        previous = self.snapshots.get(source.name)
+
+        reason = source.validate(snapshot, previous)
+        if reason:
+            log.print_warn(f"Not using {source.display_name} inventory: {reason}")
+            return False
+
+        ROWS_PROCESSED.inc(len(snapshot), source=source.name)
+        log.print_ok_arrow(f"Downloaded {len(snapshot)} items from {source.display_name}")
+
+        if previous is not None:
+            self._record_out_of_stock(source.name, previous, snapshot)
+            self.previous_snapshots[source.name] = previous
+        self.snapshots[source.name] = snapshot
+        return True
+
+    def _record_out_of_stock(
+        self, name: str, previous: InventorySnapshot, snapshot: InventorySnapshot
+    ) -> None:
+        now = datetime.datetime.fromtimestamp(snapshot.fetched_at, datetime.timezone.utc)
+        stock = snapshot.stock()
+        out_of_stock_times = self.out_of_stock_times[name]
+        for nc_code, available in previous.stock().items():
+            if available > 0 and stock.get(nc_code, 0) == 0:
+                out_of_stock_times[nc_code] = now
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for source in self.sources.values():
+            source.close()
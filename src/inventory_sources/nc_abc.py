@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import typing as T
+
+import pandas as pd
+
+from headers import HEADERS
+from inventory_sources.base import InventorySnapshot, InventorySource
+from inventory_sources.validators import AnomalyValidator, NotEmptyValidator
+from util import log, web2_client
+
+DOWNLOAD_URL = "https://abc2.nc.gov/StoresBoards/ExportData"
+# a rejected download is accepted after this many in a row, the store really did change
+MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE = 10
+
+RAW_INVENTORY_CODE_KEY = "NC Code"
+
+
+def sanitize_column_name(name: str) -> str:
+    # Convert to lowercase
+    sanitized_name = name.lower()
+
+    # Replace spaces with underscores
+    sanitized_name = sanitized_name.replace(" ", "_")
+
+    # Remove special characters (anything that's not alphanumeric or underscore)
+    sanitized_name = "".join(char for char in sanitized_name if char.isalnum() or char == "_")
+
+    return sanitized_name
+
+
+INVENTORY_CODE_KEY = sanitize_column_name(RAW_INVENTORY_CODE_KEY)
+
+
+def clean_inventory_csv(csv_file: str) -> T.Optional[pd.core.frame.DataFrame]:
+    chunk_size = 4096
+    processed_chunks = []
+
+    try:
+        with pd.read_csv(csv_file, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                # clean up the code column
+                chunk[RAW_INVENTORY_CODE_KEY] = chunk[RAW_INVENTORY_CODE_KEY].str.replace(
+                    r"=\"(.*)\"", r"\1", regex=True
+                )
+                # Sanitize column names
+                chunk.columns = [sanitize_column_name(col) for col in chunk.columns]
+
+                processed_chunks.append(chunk)
+    except:
+        log.print_fail(f"Error parsing inventory file")
+        return None
+
+    dataframe = pd.concat(processed_chunks, ignore_index=True)
+    return dataframe
+
+
+class NcAbcSource(InventorySource):
+    """
+    The NC ABC warehouse inventory export. It is the primary source: the monitor's inventory
+    cycle drives it on its own schedule rather than the source manager polling it.
+    """
+
+    DOWNLOAD_TIMEOUT = 30.0
+
+    def __init__(
+        self,
+        poll_interval: float,
+        url: str = DOWNLOAD_URL,
+        name: str = "nc_abc",
+        display_name: str = "NC ABC",
+        max_consecutive_rejections: int = MAX_INVENTORY_DOWNLOADS_WITHOUT_CHANGE,
+    ) -> None:
+        self.anomaly_validator = AnomalyValidator(
+            INVENTORY_CODE_KEY, max_consecutive_rejections=max_consecutive_rejections
+        )
+        super().__init__(
+            name, poll_interval, display_name, [NotEmptyValidator(), self.anomaly_validator]
+        )
+
+        # a url, or a path to an export on disk
+        self.url = url
+        self.web = web2_client.Web2Client()
+
+        # every fetch lands in the same file, which the source owns until it is closed
+        fd, self.csv_file = tempfile.mkstemp(prefix=f"{name}_", suffix=".csv")
+        os.close(fd)
+
+    def fetch(self, url: str = "") -> str:
+        """Download the export, or copy it if the url is a local file, and return its path"""
+        url = url or self.url
+        # the download client logs failures rather than raising, don't parse the last export
+        open(self.csv_file, "wb").close()
+        if os.path.isfile(url):
+            shutil.copyfile(url, self.csv_file)
+        else:
+            self.web.url_download(
+                url, self.csv_file, headers=HEADERS, timeout=self.DOWNLOAD_TIMEOUT
+            )
+        return self.csv_file
+
+    def parse(self, raw: str) -> InventorySnapshot:
+        inventory = clean_inventory_csv(raw)
+        if inventory is None:
+            raise ValueError(f"could not parse {raw}")
+        return InventorySnapshot(self.name, inventory)
+
+    def close(self) -> None:
+        if os.path.exists(self.csv_file):
+            os.remove(self.csv_file)
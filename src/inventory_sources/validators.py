@@ -0,0 +1,218 @@
+import collections
+import enum
+import typing as T
+
+import numpy as np
+import pandas as pd
+
+from inventory_sources.base import NC_CODE, TOTAL_AVAILABLE, InventorySnapshot, SnapshotValidator
+
+
+class NotEmptyValidator(SnapshotValidator):
+    def validate(
+        self, snapshot: InventorySnapshot, previous: T.Optional[InventorySnapshot]
+    ) -> T.Optional[str]:
+        if snapshot.empty:
+            return "no inventory found"
+        return None
+
+
+class RejectReason(enum.Enum):
+    MISSING_COLUMNS = "missing_columns"
+    NULL_RATE = "null_rate"
+    CODES_MISSING = "codes_missing"
+    TOTAL_UNITS = "total_units"
+    ZERO_STOCK_RATIO = "zero_stock_ratio"
+
+
+class SnapshotFingerprint(T.NamedTuple):
+    rows: int
+    # order independent hash of the set of codes
+    code_set_hash: int
+    total_units: int
+    zero_stock_ratio: float
+    null_rates: T.Dict[str, float]
+
+
+def code_hashes(inventory: pd.DataFrame, code_key: str = NC_CODE) -> np.ndarray:
+    """Sorted unique 64 bit hashes of the codes in an inventory"""
+    codes = inventory[code_key].dropna()
+    return np.unique(pd.util.hash_pandas_object(codes, index=False).to_numpy())
+
+
+def fingerprint(
+    inventory: pd.DataFrame,
+    code_key: str = NC_CODE,
+    units_key: str = TOTAL_AVAILABLE,
+    hashes: T.Optional[np.ndarray] = None,
+) -> SnapshotFingerprint:
+    hashes = code_hashes(inventory, code_key) if hashes is None else hashes
+    units = pd.to_numeric(inventory[units_key], errors="coerce")
+    rows = len(inventory)
+    return SnapshotFingerprint(
+        rows=rows,
+        code_set_hash=int(np.bitwise_xor.reduce(hashes)) if len(hashes) else 0,
+        total_units=int(units.sum()),
+        zero_stock_ratio=float((units == 0).sum() / rows) if rows else 0.0,
+        null_rates={name: float(rate) for name, rate in inventory.isna().mean().items()},
+    )
+
+
+def is_outlier(
+    value: float,
+    history: T.Sequence[float],
+    z_threshold: float,
+    min_change: float,
+    min_scale: float = 0.0,
+) -> bool:
+    """
+    Robust z-score test against the median and median absolute deviation of the history.
+    Changes smaller than min_change relative to the median are never outliers, and the
+    deviation is floored at min_scale so that a history that never moved doesn't make
+    every change an outlier.
+    """
+    median = float(np.median(history))
+    deviation = abs(value - median)
+    if deviation <= min_change * abs(median):
+        return False
+    scale = 1.4826 * float(np.median(np.abs(np.asarray(history) - median)))
+    return deviation > z_threshold * max(scale, min_scale)
+
+
+class AnomalyValidator(SnapshotValidator):
+    """
+    Fingerprint each snapshot (code set, total units, zero stock ratio, null rates) and
+    reject the ones that are outliers against the recently accepted snapshots, which catches
+    truncated or corrupted exports that keep the same length. Catalog changes that keep the
+    known codes are accepted however large they are. If the feed keeps getting rejected it is
+    accepted as the new normal.
+    """
+
+    def __init__(
+        self,
+        code_key: str = NC_CODE,
+        units_key: str = TOTAL_AVAILABLE,
+        max_consecutive_rejections: int = 10,
+        window: int = 48,
+        min_history: int = 5,
+        z_threshold: float = 6.0,
+        min_relative_change: float = 0.25,
+        min_missing_fraction: float = 0.02,
+        min_missing_scale: float = 0.01,
+        max_missing_fraction: float = 0.5,
+        max_null_rate_increase: float = 0.05,
+        max_zero_stock_change: float = 0.15,
+    ) -> None:
+        self.code_key = code_key
+        self.units_key = units_key
+        self.max_consecutive_rejections = max_consecutive_rejections
+        self.min_history = min_history
+        self.z_threshold = z_threshold
+        self.min_relative_change = min_relative_change
+        self.min_missing_fraction = min_missing_fraction
+        # a stable catalog has a missing history of all zeros, this keeps a few percent of
+        # products being discontinued from looking like a truncated export
+        self.min_missing_scale = min_missing_scale
+        self.max_missing_fraction = max_missing_fraction
+        self.max_null_rate_increase = max_null_rate_increase
+        self.max_zero_stock_change = max_zero_stock_change
+
+        self.history: T.Deque[SnapshotFingerprint] = collections.deque(maxlen=window)
+        # fraction of the previous codes that went missing, for every accepted snapshot
+        self.missing_history: T.Deque[float] = collections.deque(maxlen=window)
+        self.last_hashes: T.Optional[np.ndarray] = None
+        self.consecutive_rejections = 0
+        self.last_reason: T.Optional[RejectReason] = None
+
+    def validate(
+        self, snapshot: InventorySnapshot, previous: T.Optional[InventorySnapshot]
+    ) -> T.Optional[str]:
+        return self.check(snapshot.inventory)
+
+    def check(self, inventory: pd.DataFrame) -> T.Optional[str]:
+        """Return the reason code and details if the inventory is rejected"""
+        missing_columns = [c for c in (self.code_key, self.units_key) if c not in inventory]
+        if missing_columns:
+            self.last_reason = RejectReason.MISSING_COLUMNS
+            return f"{self.last_reason.value}: {missing_columns}"
+
+        hashes = code_hashes(inventory, self.code_key)
+        current = fingerprint(inventory, self.code_key, self.units_key, hashes)
+        missing = self._missing_fraction(current, hashes)
+
+        rejection = self._find_anomaly(current, missing)
+        if rejection is not None:
+            self.consecutive_rejections += 1
+            if self.consecutive_rejections <= self.max_consecutive_rejections:
+                self.last_reason, details = rejection
+                return f"{self.last_reason.value}: {details}"
+            # the feed has settled on something new, start over from it
+            self.history.clear()
+            self.missing_history.clear()
+            missing = None
+
+        self.history.append(current)
+        if missing is not None:
+            self.missing_history.append(missing)
+        self.last_hashes = hashes
+        self.consecutive_rejections = 0
+        self.last_reason = None
+        return None
+
+    def _missing_fraction(
+        self, current: SnapshotFingerprint, hashes: np.ndarray
+    ) -> T.Optional[float]:
+        if self.last_hashes is None or not len(self.last_hashes):
+            return None
+        if self.history and self.history[-1].code_set_hash == current.code_set_hash:
+            return 0.0
+        missing = ~np.isin(self.last_hashes, hashes, assume_unique=True)
+        return float(missing.sum() / len(self.last_hashes))
+
+    def _find_anomaly(
+        self, current: SnapshotFingerprint, missing: T.Optional[float]
+    ) -> T.Optional[T.Tuple[RejectReason, str]]:
+        if not self.history:
+            return None
+
+        for name, rate in current.null_rates.items():
+            baseline = max((f.null_rates.get(name, 0.0) for f in self.history), default=0.0)
+            if rate > baseline + self.max_null_rate_increase:
+                return RejectReason.NULL_RATE, f"{name} is {rate:.0%} null, was {baseline:.0%}"
+
+        if missing is not None:
+            if missing > self.max_missing_fraction:
+                return RejectReason.CODES_MISSING, f"{missing:.0%} of the previous codes missing"
+            if (
+                missing > self.min_missing_fraction
+                and len(self.missing_history) >= self.min_history
+                and is_outlier(
+                    missing,
+                    self.missing_history,
+                    self.z_threshold,
+                    0.0,
+                    self.min_missing_scale,
+                )
+            ):
+                return RejectReason.CODES_MISSING, f"{missing:.1%} of the previous codes missing"
+
+        if len(self.history) < self.min_history:
+            return None
+
+        # per row, so that a catalog growing or shrinking is not mistaken for corrupt values
+        units = [f.total_units / max(f.rows, 1) for f in self.history]
+        current_units = current.total_units / max(current.rows, 1)
+        if is_outlier(current_units, units, self.z_threshold, self.min_relative_change):
+            return (
+                RejectReason.TOTAL_UNITS,
+                f"{current_units:.1f} units per item, median {np.median(units):.1f}",
+            )
+
+        ratios = [f.zero_stock_ratio for f in self.history]
+        if abs(current.zero_stock_ratio - float(np.median(ratios))) > self.max_zero_stock_change:
+            if is_outlier(current.zero_stock_ratio, ratios, self.z_threshold, 0.0):
+                return (
+                    RejectReason.ZERO_STOCK_RATIO,
+                    f"{current.zero_stock_ratio:.0%} out of stock, median {np.median(ratios):.0%}",
+                )
+        return None
@@ -0,0 +1,41 @@
+import typing as T
+
+import pandas as pd
+
+from inventory_sources.base import InventorySnapshot, InventorySource, SnapshotValidator
+from inventory_sources.validators import NotEmptyValidator
+from youngsville_inventory import YoungsvilleAbcInventory
+
+
+class YoungsvilleSource(InventorySource):
+    """The Youngsville ABC store shelf inventory, scraped from shopncabc.com"""
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        poll_interval: float,
+        name: str = "youngsville_abc",
+        display_name: str = "Youngsville ABC",
+        validators: T.Optional[T.List[SnapshotValidator]] = None,
+        parser: str = "",
+        cookie_file: str = "",
+    ) -> None:
+        if validators is None:
+            validators = [NotEmptyValidator()]
+        super().__init__(name, poll_interval, display_name, validators)
+
+        # the session is kept between polls and only logs in again once it expires
+        self.scraper = YoungsvilleAbcInventory(username, password, parser, cookie_file)
+
+    def fetch(self) -> pd.core.frame.DataFrame:
+        # pages are parsed as they arrive, so this already returns the parsed inventory
+        return self.scraper.scrape_inventory()
+
+    def parse(self, raw: T.Union[str, pd.core.frame.DataFrame]) -> InventorySnapshot:
+        if isinstance(raw, str):
+            raw = self.scraper.parse_inventory_page(raw)
+        return InventorySnapshot(self.name, raw)
+
+    def close(self) -> None:
+        self.scraper.session.close()
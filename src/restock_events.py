@@ -0,0 +1,143 @@
+"""
+Restock events, produced once per inventory update from the diff of the previous and
+current snapshot. Anything interested in restocks (alerting, history, push delivery)
+subscribes to the stream instead of re-scanning the inventory itself.
+"""
+
+import collections
+import datetime
+import threading
+import time
+import typing as T
+
+from util import log
+
+# (previous, current) units available
+StockChange = T.Tuple[int, int]
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    # the database hands back naive utc times, the sources timezone aware ones
+    return value if value.tzinfo is not None else value.replace(tzinfo=datetime.timezone.utc)
+
+
+class RestockEvent(T.NamedTuple):
+    nc_code: str
+    brand_name: str
+    previous_available: int
+    available: int
+    # when the item was last seen out of stock, if it ever was
+    out_of_stock_time: T.Optional[datetime.datetime]
+    source: str
+    detected_at: datetime.datetime
+    # assigned by the stream when the event is published
+    id: int = 0
+
+    @property
+    def delta(self) -> int:
+        return self.available - self.previous_available
+
+    def hours_out_of_stock(self, now: datetime.datetime) -> T.Optional[float]:
+        if self.out_of_stock_time is None:
+            return None
+        return (_as_utc(now) - _as_utc(self.out_of_stock_time)).total_seconds() / 3600
+
+    def to_json(self) -> T.Dict[str, T.Any]:
+        data = self._asdict()
+        for key in ("out_of_stock_time", "detected_at"):
+            data[key] = data[key].isoformat() if data[key] is not None else None
+        return data
+
+
+def diff_stock(
+    previous: T.Mapping[str, int], current: T.Mapping[str, int]
+) -> T.Dict[str, StockChange]:
+    """Every code whose availability changed, a code that isn't listed counts as 0 available"""
+    changes = {
+        nc_code: (previous.get(nc_code, 0), available)
+        for nc_code, available in current.items()
+        if previous.get(nc_code, 0) != available
+    }
+    for nc_code, available in previous.items():
+        if available != 0 and nc_code not in current:
+            changes[nc_code] = (available, 0)
+    return changes
+
+
+def find_restocks(
+    changes: T.Mapping[str, StockChange],
+    brand_names: T.Callable[[str], str],
+    out_of_stock_times: T.Callable[[T.List[str]], T.Mapping[str, T.Optional[datetime.datetime]]],
+    source: str,
+    detected_at: datetime.datetime,
+) -> T.List[RestockEvent]:
+    """Events for the items that went from nothing available to something available"""
+    restocked = [
+        nc_code
+        for nc_code, (previous, available) in changes.items()
+        if previous == 0 and available > 0
+    ]
+    if not restocked:
+        return []
+
+    times = out_of_stock_times(restocked)
+    return [
+        RestockEvent(
+            nc_code=nc_code,
+            brand_name=brand_names(nc_code),
+            previous_available=changes[nc_code][0],
+            available=changes[nc_code][1],
+            out_of_stock_time=times.get(nc_code),
+            source=source,
+            detected_at=detected_at,
+        )
+        for nc_code in restocked
+    ]
+
+
+class RestockEventStream:
+    """Hands each batch of events to every subscriber and keeps the latest ones for replay"""
+
+    def __init__(self, history: int = 1000, start_id: T.Optional[int] = None) -> None:
+        self.subscribers: T.List[T.Callable[[T.List[RestockEvent]], None]] = []
+        self.history: T.Deque[RestockEvent] = collections.deque(maxlen=history)
+        # counting up from the start time in milliseconds keeps the ids increasing across
+        # restarts, so a client resuming from an id handed out before one still gets new events
+        self.last_id = int(time.time() * 1000) if start_id is None else start_id
+        self.lock = threading.Lock()
+
+    def subscribe(
+        self, subscriber: T.Callable[[T.List[RestockEvent]], None]
+    ) -> T.Callable[[T.List[RestockEvent]], None]:
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: T.Callable[[T.List[RestockEvent]], None]) -> None:
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, events: T.Iterable[RestockEvent]) -> T.List[RestockEvent]:
+        with self.lock:
+            published = []
+            for event in events:
+                self.last_id += 1
+                published.append(event._replace(id=self.last_id))
+            self.history.extend(published)
+            subscribers = list(self.subscribers)
+
+        if not published:
+            return published
+
+        for subscriber in subscribers:
+            try:
+                subscriber(published)
+            except Exception as e:  # pylint: disable=broad-except
+                log.print_fail(f"Restock event subscriber {subscriber} failed: {e}")
+        return published
+
+    def since(self, event_id: int) -> T.List[RestockEvent]:
+        """Events published after the given id that are still in the history"""
+        with self.lock:
+            return [event for event in self.history if event.id > event_id]
@@ -0,0 +1,169 @@
+"""
+Double buffered, columnar storage for the current and previous inventory. Each download is
+copied into preallocated numpy columns of whichever buffer holds the older inventory, so a
+steady state cycle reuses the same arrays instead of keeping two DataFrames alive and
+leaving the old ones for the garbage collector.
+"""
+
+import sys
+import typing as T
+
+import numpy as np
+import pandas as pd
+
+# leave room for the catalog to grow before the arrays have to be reallocated
+GROWTH_FACTOR = 1.25
+
+
+class SnapshotRow:
+    """One inventory row, read straight from the buffer columns"""
+
+    __slots__ = ("buffer", "position")
+
+    def __init__(self, buffer: "ColumnarBuffer", position: int) -> None:
+        self.buffer = buffer
+        self.position = position
+
+    def __getattr__(self, name: str) -> T.Any:
+        try:
+            column = self.buffer.columns[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        value = column[self.position]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __getitem__(self, name: str) -> T.Any:
+        return getattr(self, name)
+
+
+class ColumnarBuffer:
+    def __init__(self, code_key: str) -> None:
+        self.code_key = code_key
+        self.columns: T.Dict[str, np.ndarray] = {}
+        self.capacity = 0
+        self.size = 0
+        self._index: T.Optional[T.Dict[str, int]] = None
+
+    @property
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, dtypes: T.Dict[str, np.dtype], rows: int) -> None:
+        """Make sure there is a column of the right type for every name, with room for rows"""
+        if rows <= self.capacity and dtypes == {n: c.dtype for n, c in self.columns.items()}:
+            return
+
+        capacity = self.capacity if rows <= self.capacity else int(rows * GROWTH_FACTOR) + 1
+        columns = {}
+        for name, dtype in dtypes.items():
+            existing = self.columns.get(name)
+            if existing is not None and existing.dtype == dtype and len(existing) == capacity:
+                columns[name] = existing
+            else:
+                columns[name] = np.empty(capacity, dtype=dtype)
+        self.columns = columns
+        self.capacity = capacity
+
+    def _finish_fill(self, rows: int) -> None:
+        self.size = rows
+        self._index = None
+        # drop references to strings past the end so they can be freed
+        for column in self.columns.values():
+            if column.dtype == object:
+                column[rows:] = None
+
+    def fill(self, frame: T.Optional[pd.DataFrame]) -> None:
+        if frame is None or frame.empty:
+            self._finish_fill(0)
+            return
+
+        dtypes = {}
+        for name in frame.columns:
+            dtype = frame[name].dtype
+            numeric = isinstance(dtype, np.dtype) and dtype.kind in "biuf"
+            dtypes[name] = dtype if numeric else np.dtype(object)
+        self._reserve(dtypes, len(frame))
+
+        for name, column in self.columns.items():
+            column[: len(frame)] = frame[name].to_numpy(dtype=column.dtype)
+        self._finish_fill(len(frame))
+
+    def copy_from(self, other: "ColumnarBuffer") -> None:
+        self._reserve({name: column.dtype for name, column in other.columns.items()}, other.size)
+        for name, column in other.columns.items():
+            self.columns[name][: other.size] = column[: other.size]
+        self._finish_fill(other.size)
+
+    def index(self) -> T.Dict[str, int]:
+        """Row of the first occurrence of each code"""
+        if self._index is None:
+            codes = self.columns[self.code_key][: self.size]
+            index: T.Dict[str, int] = {}
+            for position, code in enumerate(codes.tolist()):
+                index.setdefault(code, position)
+            self._index = index
+        return self._index
+
+    def get(self, code: str) -> T.Optional[SnapshotRow]:
+        if self.empty:
+            return None
+        position = self.index().get(code)
+        return SnapshotRow(self, position) if position is not None else None
+
+    def stock(self, units_key: str = "total_available") -> T.Dict[str, int]:
+        """Units available per code, the first row wins for a duplicated code"""
+        if self.empty:
+            return {}
+        index = self.index()
+        available = self.columns[units_key][list(index.values())].astype(np.int64)
+        return dict(zip(index.keys(), available.tolist()))
+
+    def rows(self) -> T.Iterator[SnapshotRow]:
+        for position in range(self.size):
+            yield SnapshotRow(self, position)
+
+    def frame(self) -> pd.DataFrame:
+        """
+        A DataFrame of the contents for the less frequent whole-inventory paths. Numeric
+        columns are views of the buffer, so it is only valid until the buffer is filled again.
+        """
+        return pd.DataFrame(
+            {name: column[: self.size] for name, column in self.columns.items()}, copy=False
+        )
+
+    def nbytes(self, deep: bool = False) -> int:
+        total = sum(column.nbytes for column in self.columns.values())
+        if deep:
+            for column in self.columns.values():
+                if column.dtype == object:
+                    total += sum(sys.getsizeof(value) for value in column[: self.size])
+        return total
+
+
+class SnapshotBuffers:
+    """The current and previous inventory, swapping roles every download"""
+
+    def __init__(self, code_key: str) -> None:
+        self.current = ColumnarBuffer(code_key)
+        self.previous = ColumnarBuffer(code_key)
+
+    def rotate(self) -> None:
+        """Make the current inventory the previous one, freeing the old buffer for reuse"""
+        self.current, self.previous = self.previous, self.current
+        self.current.fill(None)
+
+    def restore(self) -> None:
+        """Go back to the previous inventory after a failed or skipped download"""
+        self.current.copy_from(self.previous)
+
+    def memory_usage(self, deep: bool = False) -> T.Dict[str, int]:
+        return {
+            "current_bytes": self.current.nbytes(deep),
+            "previous_bytes": self.previous.nbytes(deep),
+            "current_rows": self.current.size,
+            "previous_rows": self.previous.size,
+            "capacity_rows": max(self.current.capacity, self.previous.capacity),
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import dotenv
+
+from async_inventory_monitor import AsyncInventoryMonitor
+from client_evaluation import ShardedEvaluator
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from test.twilio_stub import TwilioUtilStub
+
+
+class AsyncInventoryMonitorTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        init_database(self.test_dir, DEFAULT_DB, True)
+
+        self.before_csv = os.path.join(self.test_dir, "inventory_before.csv")
+        self.after_csv = os.path.join(self.test_dir, "inventory_after.csv")
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.twilio_stub = TwilioUtilStub()
+        self.monitor = AsyncInventoryMonitor(
+            twilio_util=self.twilio_stub,
+            admin_email=None,
+            log_dir=self.temp_dir,
+            credentials_file="",
+            use_local_db=True,
+            time_between_inventory_checks=5,
+        )
+        self.monitor.init()
+        self.monitor.WAIT_TIME = 0
+
+        ClientDb.add_client("test", "test@gmail.com", ["+1234567890"])
+        ClientDb.add_item_to_client_and_track("test", "00009")
+        with ClientDb.client("test") as client:
+            client.has_paid = True
+            client.phone_alerts = True
+            client.update_on_new_data = False
+
+    def tearDown(self) -> None:
+        self.monitor.close()
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_run_is_a_synchronous_wrapper(self):
+        self.monitor.inventory_source.url = self.before_csv
+        self.monitor.run()
+        self.assertEqual(self.twilio_stub.num_sent, 0)
+
+        self.monitor.inventory_source.url = self.after_csv
+        self.monitor.run()
+        self.assertEqual(self.twilio_stub.num_sent, 1)
+
+        # alerts are delivered off of the event loop and the db thread
+        self.assertEqual(len(self.twilio_stub.sent_from_threads), 1)
+        thread_name = next(iter(self.twilio_stub.sent_from_threads))
+        self.assertNotIn("MonitorDb", thread_name)
+        self.assertNotEqual(thread_name, threading.main_thread().name)
+        self.assertIsNone(self.monitor.loop)
+
+    def test_run_async_stops_cleanly(self):
+        self.monitor.inventory_source.url = self.before_csv
+        self.monitor.sharded_evaluator = ShardedEvaluator(1)
+
+        async def _run() -> None:
+            task = asyncio.create_task(self.monitor.run_async())
+            while self.monitor.last_inventory_update_time is None:
+                await asyncio.sleep(0.01)
+            self.monitor.stop()
+            await asyncio.wait_for(task, timeout=10.0)
+
+        asyncio.run(_run())
+
+        self.assertIsNone(self.monitor.loop)
+        self.assertIsNone(self.monitor.http_session)
+        self.assertIsNotNone(self.monitor.new_inventory)
+        # the evaluation pool and its snapshot directory don't outlive the monitor
+        self.assertIsNone(self.monitor.sharded_evaluator.pool)
+        self.assertFalse(os.path.exists(self.monitor.sharded_evaluator.snapshot_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
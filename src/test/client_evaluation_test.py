@@ -0,0 +1,169 @@
+import datetime
+import os
+import shutil
+import tempfile
+import typing as T
+import unittest
+
+import dotenv
+import pandas as pd
+
+from client_evaluation import (
+    ClientRecord,
+    ShardedEvaluator,
+    evaluate_clients,
+    load_snapshot,
+    restock_skip_reason,
+    shard_clients,
+    write_snapshot,
+)
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from inventory_monitor import InventoryMonitor
+from restock_events import diff_stock, find_restocks
+from test.twilio_stub import TwilioUtilStub
+
+
+def make_inventory(stock: T.Dict[str, int]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "nc_code": list(stock.keys()),
+            "brand_name": [f"Brand {nc_code}" for nc_code in stock],
+            "total_available": list(stock.values()),
+        }
+    )
+
+
+class EvaluateClientsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "snapshot.npy")
+        self.now = datetime.datetime(2024, 1, 2, 12)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_alert_rules(self):
+        last_stock = {"001": 0, "002": 5, "003": 0, "004": 0, "005": 3}
+        new_stock = {"001": 4, "002": 9, "003": 1, "004": 0, "006": 2}
+        out_of_stock_times = {"003": self.now - datetime.timedelta(hours=2)}
+        events = find_restocks(
+            diff_stock(last_stock, new_stock),
+            lambda nc_code: f"Brand {nc_code}",
+            lambda nc_codes: {c: out_of_stock_times.get(c) for c in nc_codes},
+            "nc_abc",
+            self.now,
+        )
+        restocks = {event.nc_code: event for event in events}
+
+        write_snapshot(self.path, make_inventory(new_stock), "nc_code")
+        snapshot = load_snapshot(self.path)
+
+        clients = [
+            ClientRecord("a", ("001", "002", "003", "004", "005", "006"), 0, 0),
+            ClientRecord("b", ("001", "003"), 2, 0),
+            ClientRecord("c", ("001", "003"), 0, 10),
+            ClientRecord("d", (), 0, 0),
+        ]
+        result = evaluate_clients(snapshot, clients, restocks, self.now)
+
+        alerts = {intent.client_id: intent.items for intent in result.alerts}
+        # 002 was already in stock and 004 is still out of stock
+        self.assertEqual(alerts["a"], (("001", 4), ("003", 1), ("006", 2)))
+        # 003 only came back with one bottle, below the threshold
+        self.assertEqual(alerts["b"], (("001", 4),))
+        # 003 went out of stock two hours ago, inside the ten hour window
+        self.assertEqual(alerts["c"], (("001", 4),))
+        self.assertNotIn("d", alerts)
+
+        self.assertEqual(result.missing_nc_codes, {"005"})
+        self.assertEqual(result.out_of_stock_nc_codes, {"004"})
+
+        # the stored out of stock times are naive utc, the source ones timezone aware
+        aware_now = self.now.replace(tzinfo=datetime.timezone.utc)
+        self.assertIsNotNone(restock_skip_reason(restocks["003"], clients[2], aware_now))
+
+        # without restock events nothing alerts, but the bookkeeping still happens
+        result = evaluate_clients(snapshot, clients, {}, self.now)
+        self.assertEqual(result.alerts, [])
+        self.assertEqual(result.missing_nc_codes, {"005"})
+
+    def test_sharding_is_stable(self):
+        clients = [ClientRecord(f"client{index}", (), 0, 0) for index in range(100)]
+        shards = shard_clients(clients, 4)
+
+        self.assertEqual(sum(len(shard) for shard in shards), 100)
+        self.assertTrue(all(shards))
+
+        # a client always lands on the same shard regardless of the order they are listed in
+        reversed_shards = shard_clients(reversed(clients), 4)
+        for shard, reversed_shard in zip(shards, reversed_shards):
+            self.assertEqual({c.id for c in shard}, {c.id for c in reversed_shard})
+
+
+class ShardedMonitorTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        self.before_csv = os.path.join(self.test_dir, "inventory_before.csv")
+        self.after_csv = os.path.join(self.test_dir, "inventory_after.csv")
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _run(self, evaluation_workers: int) -> T.List[T.Tuple[str, str]]:
+        init_database(self.test_dir, DEFAULT_DB, True)
+
+        clients = {
+            "a": (["00009", "00107", "00221"], 0),
+            "b": (["00009", "00111"], 2),
+            "c": (["00120", "00127"], 0),
+            "d": (["00018"], 0),
+        }
+        for index, (name, (nc_codes, threshold)) in enumerate(clients.items()):
+            ClientDb.add_client(name, f"{name}@gmail.com", [f"+1555000000{index}"])
+            for nc_code in nc_codes:
+                ClientDb.add_item_to_client_and_track(name, nc_code)
+            with ClientDb.client(name) as client:
+                client.has_paid = True
+                client.phone_alerts = True
+                client.update_on_new_data = False
+                client.threshold_inventory = threshold
+
+        twilio_stub = TwilioUtilStub()
+        monitor = InventoryMonitor(
+            twilio_util=twilio_stub,
+            admin_email=None,
+            log_dir=self.temp_dir,
+            credentials_file="",
+            use_local_db=True,
+            evaluation_workers=evaluation_workers,
+        )
+        if monitor.sharded_evaluator is not None:
+            monitor.sharded_evaluator.min_clients_per_shard = 1
+
+        try:
+            for csv_file in [self.before_csv, self.after_csv]:
+                new_items = monitor.update_inventory(csv_file, skip_db_add=True)
+                monitor._check_inventory(new_items)
+        finally:
+            if monitor.sharded_evaluator is not None:
+                monitor.sharded_evaluator.close()
+            close_engine(DEFAULT_DB)
+            remove_database(self.test_dir, DEFAULT_DB)
+
+        return sorted(twilio_stub.sent)
+
+    def test_sharded_evaluation_matches_sequential(self):
+        sequential = self._run(evaluation_workers=0)
+        sharded = self._run(evaluation_workers=2)
+
+        # nothing alerts on the first pass since there is no previous inventory to diff against
+        self.assertEqual(len(sequential), 3)
+        self.assertEqual(sharded, sequential)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,315 @@
+import copy
+import os
+import typing as T
+import unittest
+
+import dotenv
+
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from firebase import defs
+from firebase.firebase_admin import FirebaseAdmin
+from firebase.firebase_client import FirebaseClient
+from firebase.watcher import WatcherSupervisor
+from test.memory_firestore import DocumentNotFound, MemoryFirestore
+
+
+def make_client_doc(
+    email: str, phone_number: str, items: T.Dict[str, bool], has_paid: bool = True
+) -> defs.Client:
+    doc = copy.deepcopy(defs.NULL_CLIENT)
+    doc["preferences"]["notifications"]["email"]["email"] = email
+    doc["preferences"]["notifications"]["sms"]["phoneNumbers"] = {"0": phone_number}
+    doc["accounting"]["hasPaid"] = has_paid
+    doc["inventory"]["items"] = {
+        nc_code: {
+            "name": "",
+            "available": 0,
+            "action": (defs.Actions.TRACKING if track else defs.Actions.NOT_TRACKING).value,
+        }
+        for nc_code, track in items.items()
+    }
+    return doc
+
+
+class FakeRpc:
+    def __init__(self) -> None:
+        self.callbacks: T.List[T.Callable[["FakeRpc"], None]] = []
+
+    def add_done_callback(self, callback: T.Callable[["FakeRpc"], None]) -> None:
+        self.callbacks.append(callback)
+
+    def exception(self) -> T.Optional[BaseException]:
+        return None
+
+    def done(self) -> None:
+        for callback in self.callbacks:
+            callback(self)
+
+
+class FakeWatch:
+    """Like the firestore watch, closing it completes its rpc"""
+
+    def __init__(self, callback: T.Callable) -> None:
+        self.callback = callback
+        self._rpc = FakeRpc()
+
+    def unsubscribe(self) -> None:
+        self._rpc.done()
+
+
+class FakeQuery:
+    def __init__(self) -> None:
+        self.watches: T.List[FakeWatch] = []
+
+    def on_snapshot(self, callback: T.Callable) -> FakeWatch:
+        self.watches.append(FakeWatch(callback))
+        return self.watches[-1]
+
+
+class WatcherSupervisorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.query = FakeQuery()
+        self.snapshots: T.List[T.Any] = []
+        self.watcher = WatcherSupervisor(
+            "clients", self.query, lambda docs, changes, read_time: self.snapshots.append(docs)
+        )
+
+    def test_closing_a_watch_does_not_fail_its_replacement(self):
+        self.watcher.reconnect()
+        self.assertTrue(self.watcher.is_healthy)
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(len(self.query.watches), 2)
+
+        # a late snapshot from the old watch is dropped
+        self.query.watches[0].callback(["old"], [], None)
+        self.query.watches[1].callback(["new"], [], None)
+        self.assertEqual(self.snapshots, [["new"]])
+
+    def test_current_watch_terminating_is_unhealthy(self):
+        self.query.watches[0]._rpc.done()
+        self.assertFalse(self.watcher.is_healthy)
+        self.assertTrue(self.watcher.check())
+        self.assertTrue(self.watcher.is_healthy)
+
+
+class MemoryFirestoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.backend = MemoryFirestore()
+        self.collection = self.backend.collection("clients")
+        self.events: T.List[T.Tuple[str, str]] = []
+
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        for change in changes:
+            self.events.append((change.type.name, change.document.id))
+
+    def test_set_merge_and_update(self):
+        doc_ref = self.collection.document("a")
+        doc_ref.set({"a": {"b": 1, "c": 2}, "d": 3})
+        doc_ref.set({"a": {"b": 10}}, merge=True)
+        self.assertEqual(doc_ref.get().to_dict(), {"a": {"b": 10, "c": 2}, "d": 3})
+
+        doc_ref.set({"a": {"c": 20}, "d": 30}, merge=["a.c"])
+        self.assertEqual(doc_ref.get().to_dict(), {"a": {"b": 10, "c": 20}, "d": 3})
+
+        doc_ref.update({"inventory.items.`00009`.available": 4})
+        self.assertEqual(
+            doc_ref.get(["inventory.items"]).to_dict()["inventory"]["items"],
+            {"00009": {"available": 4}},
+        )
+
+        doc_ref.set({"heartbeat": self.backend.server_timestamp}, merge=["heartbeat"])
+        self.assertIsNotNone(doc_ref.get().get("heartbeat"))
+
+        with self.assertRaises(DocumentNotFound):
+            self.collection.document("missing").update({"a": 1})
+
+    def test_snapshot_change_types(self):
+        self.collection.document("a").set({"value": 1})
+
+        watch = self.collection.on_snapshot(self._on_snapshot)
+        self.backend.flush()
+        self.assertEqual(self.events, [("ADDED", "a")])
+
+        batch = self.backend.batch()
+        batch.set(self.collection.document("b"), {"value": 2})
+        batch.update(self.collection.document("a"), {"value": 3})
+        batch.commit()
+        self.collection.document("a").set({"value": 3})
+        self.collection.document("b").delete()
+        self.backend.flush()
+
+        self.assertEqual(
+            self.events,
+            [("ADDED", "a"), ("ADDED", "b"), ("MODIFIED", "a"), ("REMOVED", "b")],
+        )
+
+        watch.unsubscribe()
+        self.collection.document("c").set({"value": 4})
+        self.backend.flush()
+        self.assertEqual(len(self.events), 4)
+
+    def test_batch_is_limited_to_500_writes(self):
+        batch = self.backend.batch()
+        for index in range(501):
+            batch.set(self.collection.document(str(index)), {"value": index})
+        with self.assertRaises(ValueError):
+            batch.commit()
+        self.assertEqual(self.collection.list_documents(), [])
+
+
+class FirebaseClientTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        init_database(self.test_dir, DEFAULT_DB, True)
+
+        self.backend = MemoryFirestore()
+        self.clients_ref = self.backend.collection("clients")
+        self.clients_ref.document("a").set(
+            make_client_doc("a@gmail.com", "(123) 456-7890", {"00009": True, "00018": False})
+        )
+        self.clients_ref.document("b").set(make_client_doc("b@gmail.com", "", {"00120": True}))
+
+        self.firebase_client = FirebaseClient("", backend=self.backend)
+        self._sync()
+
+    def tearDown(self) -> None:
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+
+    def _sync(self) -> None:
+        # reconciling can write back to firestore which triggers another round of changes
+        for _ in range(3):
+            self.backend.flush()
+            self.firebase_client.check_and_maybe_handle_firebase_db_updates()
+
+    def test_initial_snapshot_populates_database(self):
+        self.assertEqual(sorted(ClientDb.get_client_names()), ["a", "b"])
+
+        with ClientDb.client("a") as client:
+            self.assertEqual(client.email, "a@gmail.com")
+            self.assertEqual([p.number for p in client.phone_numbers], ["+11234567890"])
+            self.assertEqual(sorted(i.id for i in client.items), ["00009", "00018"])
+            self.assertEqual([t.nc_code for t in client.tracked_items], ["00009"])
+            self.assertTrue(client.has_paid)
+
+    def test_only_changed_clients_are_reconciled(self):
+        handled = self._record_handled()
+        changes = []
+        self.firebase_client.add_change_listener(lambda: changes.append(True))
+
+        self.clients_ref.document("a").update(
+            {f"inventory.items.`00018`.action": defs.Actions.TRACKING.value}
+        )
+        self._sync()
+
+        self.assertEqual(handled, ["a"])
+        self.assertEqual(len(changes), 1)
+        with ClientDb.client("a") as client:
+            self.assertEqual(sorted(t.nc_code for t in client.tracked_items), ["00009", "00018"])
+
+    def _record_handled(self) -> T.List[str]:
+        handled: T.List[str] = []
+        handle_firebase_update = self.firebase_client._handle_firebase_update
+
+        def _record(client: str, db_client: defs.Client) -> None:
+            handled.append(client)
+            handle_firebase_update(client, db_client)
+
+        self.firebase_client._handle_firebase_update = _record
+        return handled
+
+    def test_healthy_watcher_is_not_resubscribed(self):
+        listens_before = self.backend.stats["listen"]
+        self.firebase_client.check_watchers()
+        self.assertEqual(self.backend.stats["listen"], listens_before)
+        self.assertTrue(self.firebase_client.clients_watcher.is_healthy)
+
+    def test_failed_watcher_resumes_without_full_reconcile(self):
+        handled = self._record_handled()
+        listens_before = self.backend.stats["listen"]
+
+        self.firebase_client.clients_watcher.watch.close(reason=ConnectionError("stream reset"))
+        self.clients_ref.document("b").delete()
+        self.clients_ref.document("a").update({"inventory.inventoryChange": 3})
+        self.assertFalse(self.firebase_client.clients_watcher.is_healthy)
+
+        self.firebase_client.check_watchers()
+        self._sync()
+
+        self.assertEqual(self.backend.stats["listen"], listens_before + 1)
+        self.assertEqual(handled, ["a"])
+        self.assertEqual(ClientDb.get_client_names(), ["a"])
+        with ClientDb.client("a") as client:
+            self.assertEqual(client.threshold_inventory, 3)
+
+        # a forced resubscribe with nothing changed doesn't reconcile anything
+        self.firebase_client.update_watchers()
+        self._sync()
+        self.assertEqual(handled, ["a"])
+
+    def test_removed_document_deletes_client(self):
+        self.clients_ref.document("b").delete()
+        self._sync()
+
+        self.assertEqual(ClientDb.get_client_names(), ["a"])
+        self.assertNotIn("b", self.firebase_client.db_cache)
+
+    def test_source_subscriptions_follow_the_client_doc(self):
+        self.assertEqual(ClientDb.get_source_subscribers("youngsville_abc"), [])
+
+        self.clients_ref.document("a").update({"preferences.sources": ["youngsville_abc"]})
+        self._sync()
+        self.assertEqual(ClientDb.get_source_subscribers("youngsville_abc"), ["a"])
+        self.assertEqual(
+            [s.source for s in ClientDb.get_clients()["a"].subscriptions], ["youngsville_abc"]
+        )
+
+        self.clients_ref.document("a").update({"preferences.sources": []})
+        self._sync()
+        self.assertEqual(ClientDb.get_source_subscribers("youngsville_abc"), [])
+
+    def test_item_stock_is_written_back(self):
+        ClientDb.add_or_update_item("00009", brand_name="Bowman", total_available=7)
+        commits_before = self.backend.stats["commit"]
+
+        self.firebase_client.sync_items_to_firebase()
+        self.assertEqual(self.backend.stats["commit"], commits_before + 1)
+
+        item = self.clients_ref.document("a").get().to_dict()["inventory"]["items"]["00009"]
+        self.assertEqual(item["name"], "Bowman")
+        self.assertEqual(item["available"], 7)
+
+        # nothing changed, nothing to write
+        self.firebase_client.sync_items_to_firebase()
+        self.assertEqual(self.backend.stats["commit"], commits_before + 1)
+
+    def test_admin_reset(self):
+        admin = FirebaseAdmin("", backend=self.backend)
+        admin.set_reset(True)
+        self.backend.flush()
+
+        self.assertTrue(admin.is_reset)
+        self.assertTrue(admin.get_reset())
+
+    def test_profile_request_is_taken_once(self):
+        requests: T.List[int] = []
+        self.firebase_client.add_profile_listener(requests.append)
+
+        health_doc = self.backend.collection("admin").document("health_monitor")
+        health_doc.set({"profile_cycles": 5}, merge=["profile_cycles"])
+        self.backend.flush()
+        self.assertEqual(requests, [5])
+        self.assertEqual(health_doc.get().to_dict()["profile_cycles"], 0)
+
+        # the heartbeat doesn't repeat the request
+        self.firebase_client.health_ping()
+        self.backend.flush()
+        self.assertEqual(requests, [5])
+        self.assertEqual(self.firebase_client.take_profile_request(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import copy
+import os
+import typing as T
+import unittest
+
+import dotenv
+
+from database.client import DEFAULT_DB, ClientDb, ItemStock
+from database.connect import close_engine, init_database, remove_database
+from firebase.write_back import (
+    FirestoreWriteBack,
+    apply_field_updates,
+    item_field_path,
+    render_field_path,
+    split_field_path,
+)
+from test.memory_firestore import MemoryFirestore
+
+
+def _make_client_doc(items: T.Dict[str, T.Tuple[str, int]]) -> T.Dict[str, T.Any]:
+    return {
+        "inventory": {
+            "items": {
+                nc_code: {"name": name, "available": available, "action": "TRACKING"}
+                for nc_code, (name, available) in items.items()
+            }
+        }
+    }
+
+
+class FirebaseWriteBackTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        init_database(self.test_dir, DEFAULT_DB, True)
+
+        self.db = MemoryFirestore()
+        self.collection = self.db.collection("clients")
+        self.write_back = FirestoreWriteBack(self.db, self.collection)
+
+    def tearDown(self) -> None:
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+
+    def test_field_path_round_trip(self):
+        path = item_field_path("00009", "available")
+        self.assertEqual(path, "inventory.items.`00009`.available")
+        self.assertEqual(split_field_path(path), ["inventory", "items", "00009", "available"])
+
+        odd_names = ["a.b", "back`tick", "slash\\"]
+        self.assertEqual(split_field_path(render_field_path(odd_names)), odd_names)
+
+    def test_only_changed_fields_are_written(self):
+        doc = _make_client_doc({"00009": ("Bowman", 0), "00018": ("Kentucky Owl", 153)})
+        items = {
+            "00009": ItemStock("Bowman", 12),
+            "00018": ItemStock("Kentucky Owl", 153),
+        }
+
+        updates = FirestoreWriteBack.compute_item_updates(doc, items)
+
+        self.assertEqual(updates, {"inventory.items.`00009`.available": 12})
+
+    def test_commits_are_batched(self):
+        num_clients = 1201
+        for start in range(0, num_clients, 500):
+            batch = self.db.batch()
+            for index in range(start, min(start + 500, num_clients)):
+                batch.set(self.collection.document(f"client{index}"), _make_client_doc({}))
+            batch.commit()
+
+        for index in range(num_clients):
+            self.write_back.stage(f"client{index}", {item_field_path("00009", "available"): 1})
+
+        commits_before = self.db.stats["commit"]
+        num_batches = self.write_back.commit()
+
+        self.assertEqual(num_batches, 3)
+        self.assertEqual(self.db.stats["commit"] - commits_before, 3)
+        for doc_ref in self.collection.list_documents():
+            self.assertEqual(doc_ref.get().get("inventory.items.`00009`"), {"available": 1})
+        self.assertEqual(self.write_back.commit(), 0)
+
+    def test_item_stock_from_database(self):
+        ClientDb.add_or_update_item("00009", brand_name="Bowman", total_available=3)
+        ClientDb.add_or_update_item("00018", brand_name="Kentucky Owl", total_available=0)
+
+        doc = _make_client_doc({"00009": ("", 0), "00018": ("Kentucky Owl", 153), "99999": ("", 0)})
+        items = ClientDb.get_item_stock(doc["inventory"]["items"].keys())
+
+        self.assertEqual(set(items.keys()), {"00009", "00018"})
+
+        self.collection.document("client").set(doc)
+        updates = FirestoreWriteBack.compute_item_updates(doc, items)
+        self.write_back.stage("client", updates)
+        self.write_back.commit()
+
+        expected = copy.deepcopy(doc)
+        apply_field_updates(expected, updates)
+        self.assertEqual(expected["inventory"]["items"]["00009"]["name"], "Bowman")
+        self.assertEqual(expected["inventory"]["items"]["00009"]["available"], 3)
+        self.assertEqual(expected["inventory"]["items"]["00018"]["available"], 0)
+        self.assertEqual(self.collection.document("client").get().to_dict(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import typing as T
+import unittest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that are only needed once a feature is used, loaded at their first use site
+LAZY_MODULES = [
+    "aiohttp",
+    "deepdiff",
+    "firebase_admin",
+    "google.cloud.firestore_v1",
+    "twilio",
+    "yagmail",
+    "yaspin",
+]
+
+# cumulative import time in seconds, with plenty of headroom over a quiet machine
+IMPORT_BUDGETS = {
+    "executables.monitor_inventory": 2.0,
+    "executables.reset_server": 0.5,
+}
+
+
+def measure_import(module: str) -> T.Tuple[float, T.Set[str]]:
+    """Import a module in a fresh interpreter, returning its import time and every module loaded"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    seconds = 0.0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        if name.strip() == module:
+            seconds = int(cumulative) / 1e6
+    return seconds, imported
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_entry_points_defer_heavy_imports(self):
+        for module, budget in IMPORT_BUDGETS.items():
+            with self.subTest(module=module):
+                seconds, imported = measure_import(module)
+                self.assertIn(module, imported)
+                self.assertEqual([m for m in LAZY_MODULES if m in imported], [])
+                self.assertLess(seconds, budget)
+
+    def test_reset_server_does_not_need_pandas_or_sqlalchemy(self):
+        _, imported = measure_import("executables.reset_server")
+        self.assertNotIn("pandas", imported)
+        self.assertNotIn("sqlalchemy", imported)
+
+
+if __name__ == "__main__":
+    unittest.main()
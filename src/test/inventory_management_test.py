@@ -4,6 +4,7 @@ import shutil
 import tempfile
 import typing as T
 import unittest
+import unittest.mock
 
 import dotenv
 
@@ -11,35 +12,8 @@ from database.client import DEFAULT_DB, ClientDb
 from database.connect import close_engine, init_database, remove_database
 from database.models.client import ClientSchema
 from inventory_monitor import InventoryMonitor
+from test.twilio_stub import TwilioUtilStub
 from util import email, log
-from util.twilio_util import TwilioUtil
-
-
-class TwilioUtilStub(TwilioUtil):
-    def __init__(self):
-        super().__init__("", "", "", verbose=True, time_between_sms=0)
-        self.num_sent = 0
-        self.send_to = ""
-        self.content = ""
-        self.now: datetime.datetime = datetime.datetime(2021, 1, 1, 12 + 8, 0, 0)
-
-    def send_sms_if_in_window(
-        self, to_number: str, content: str, now: datetime.datetime = datetime.datetime.utcnow()
-    ) -> None:
-        super().send_sms_if_in_window(to_number, content, self.now)
-
-    def send_sms(self, to_number: str, content: str) -> None:
-        log.print_normal(f"Sending SMS to {to_number} with content:\n{content}")
-        self.num_sent += 1
-        self.send_to = to_number
-        self.content = content
-        return
-
-    def reset(self) -> None:
-        self.num_sent = 0
-        self.send_to = ""
-        self.content = ""
-        return
 
 
 class InventoryManagementTest(unittest.TestCase):
@@ -55,7 +29,7 @@ class InventoryManagementTest(unittest.TestCase):
     test_num = "+1234567890"
 
     def setUp(self) -> None:
-        self.twilio_stub = TwilioUtilStub()
+        self.twilio_stub = TwilioUtilStub(verbose=True)
 
         self.email: email.Email = None
 
@@ -310,6 +284,82 @@ class InventoryManagementTest(unittest.TestCase):
 
         self.assertEqual(updates_sent, 4)
 
+    def test_restocks_are_published_once_per_update(self):
+        nc_codes = ["00107", "00111", "00120", "00127"]
+        client_schema = self._setup_client(nc_codes, True, True)
+        published = []
+
+        self.monitor.update_inventory(self.before_csv)
+        self.monitor.restock_events.subscribe(published.append)
+        self.monitor.update_inventory(self.after_csv_many)
+
+        self.assertEqual(len(published), 1)
+        events = {event.nc_code: event for event in published[0]}
+        self.assertEqual(events, self.monitor.restocks)
+        for nc_code in nc_codes:
+            self.assertEqual(events[nc_code].previous_available, 0)
+            self.assertGreater(events[nc_code].available, 0)
+            self.assertEqual(events[nc_code].source, InventoryMonitor.SOURCE_NAME)
+
+        self.monitor.check_client_inventory(client_schema)
+        self.assertEqual(self.twilio_stub.num_sent, 1)
+
+    def test_cold_start_does_not_publish_restocks(self):
+        client_schema = self._setup_client(["00009"], True, True)
+        published = []
+        self.monitor.restock_events.subscribe(published.append)
+
+        # no saved inventory, so every item in stock would look like it came back in stock
+        os.remove(self.temp_csv_file.name)
+        self.monitor.inventory_buffers.current.fill(None)
+        self.monitor.inventory_buffers.previous.fill(None)
+        self.monitor.init()
+        self.assertTrue(self.monitor.skip_alerts)
+
+        self.monitor.update_inventory(self.before_csv)
+        self.assertEqual(published, [])
+        self.assertEqual(self.monitor.restocks, {})
+
+        # even when alerts are no longer skipped, the first inventory has nothing to diff
+        self.monitor.skip_alerts = False
+        self.monitor.inventory_buffers.current.fill(None)
+        self.monitor.update_inventory(self.after_csv)
+        self.assertEqual(published, [])
+
+        self.monitor.update_inventory(self.before_csv)
+        del published[:]
+        self.monitor.update_inventory(self.after_csv)
+        self.assertEqual(len(published), 1)
+        self.assertIn("00009", [e.nc_code for e in published[0]])
+        self.monitor.check_client_inventory(client_schema)
+        self.assertEqual(self.twilio_stub.num_sent, 1)
+
+    def test_item_lines_are_bounded_and_summarized(self):
+        nc_codes = ["00107", "00111", "00120", "00127"]
+        client_schema = self._setup_client(nc_codes, True, True)
+        self.monitor.item_lines.max_lines = 1
+
+        self.monitor.update_inventory(self.before_csv)
+        self.monitor.update_inventory(self.after_csv_many)
+        self.monitor.check_client_inventory(client_schema)
+
+        self.assertEqual(self.monitor.item_lines.logged, 1)
+        self.assertGreater(self.monitor.item_lines.dropped, 0)
+        self.assertEqual(self.monitor.cycle_stats["items_checked"], 4)
+        self.assertEqual(self.monitor.cycle_stats["items_changed"], 4)
+        self.assertEqual(self.monitor.cycle_stats["items_alerted"], 4)
+
+        with unittest.mock.patch.object(log, "event") as event:
+            self.monitor._log_cycle_summary()
+
+        (name,) = event.call_args.args
+        summary = event.call_args.kwargs
+        self.assertEqual(name, "cycle_summary")
+        self.assertEqual(summary["items_changed"], 4)
+        self.assertGreater(summary["item_lines_dropped"], 0)
+        self.assertEqual(self.monitor.item_lines.seen, 0)
+        self.assertFalse(self.monitor.cycle_stats)
+
     def test_inventory_update_time(self):
         start = datetime.datetime(2023, 1, 1, 12, 0, 0)
         self.assertTrue(self.monitor._is_time_to_check_inventory(now=start))
@@ -446,6 +496,28 @@ class InventoryManagementTest(unittest.TestCase):
 
         self.assertEqual(self.twilio_stub.num_sent, 0)
 
+    def test_clients_sharing_phone_number_get_one_alert(self):
+        self._setup_client(["00009"], True, True)
+
+        ClientDb.add_client("test_family", "family@gmail.com", [self.test_num])
+        for nc_code in ["00009", "00120"]:
+            ClientDb.add_item_to_client_and_track("test_family", nc_code)
+        with ClientDb.client("test_family") as client:
+            client.alert_range_enabled = True
+            client.has_paid = True
+
+        self.monitor.update_inventory(self.before_csv)
+        self.monitor._check_inventory(new_items=None)
+
+        self.assertEqual(self.twilio_stub.num_sent, 0)
+
+        self.monitor.update_inventory(self.after_csv)
+        self.monitor._check_inventory(new_items=None)
+
+        self.assertEqual(self.twilio_stub.num_sent, 1)
+        self.assertEqual(self.twilio_stub.content.count("00009"), 1)
+        self.assertIn("00120", self.twilio_stub.content)
+
     def test_add_phone_numbers_to_db(self):
         client_schema = self._setup_client(["00009"], True, True)
 
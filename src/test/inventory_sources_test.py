@@ -0,0 +1,250 @@
+import os
+import shutil
+import tempfile
+import typing as T
+import unittest
+
+import dotenv
+import pandas as pd
+
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from inventory_monitor import InventoryMonitor
+from inventory_sources.base import InventorySnapshot, InventorySource
+from inventory_sources.manager import InventorySourceManager
+from inventory_sources.nc_abc import NcAbcSource
+from inventory_sources.validators import AnomalyValidator, NotEmptyValidator, RejectReason
+from inventory_sources.youngsville import YoungsvilleSource
+from test.twilio_stub import TwilioUtilStub
+
+YOUNGSVILLE_PAGE = """
+<table>
+<tr><th>Code</th><th>Item</th></tr>
+<tr><td><div class="c-cd"> 00009 </div></td><td><div class="c-nm">Blanton's [3 available]</div></td></tr>
+<tr><td><div class="c-cd">00107</div></td><td><div class="c-nm">Weller 12 [0 available]</div></td></tr>
+</table>
+"""
+
+
+class FakeSource(InventorySource):
+    def __init__(self, name: str, poll_interval: float) -> None:
+        super().__init__(name, poll_interval, validators=[NotEmptyValidator()])
+        self.stock: T.Dict[str, int] = {}
+        self.fetches = 0
+        self.fail = False
+
+    def fetch(self) -> T.Dict[str, int]:
+        self.fetches += 1
+        if self.fail:
+            raise IOError("store is down")
+        return dict(self.stock)
+
+    def parse(self, raw: T.Dict[str, int]) -> InventorySnapshot:
+        return InventorySnapshot(
+            self.name,
+            pd.DataFrame(
+                {
+                    "nc_code": list(raw.keys()),
+                    "brand_name": [f"Brand {nc_code}" for nc_code in raw],
+                    "total_available": list(raw.values()),
+                }
+            ),
+        )
+
+
+class InventorySourceTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def test_youngsville_snapshot(self):
+        source = YoungsvilleSource("", "", 60)
+        snapshot = source.parse(YOUNGSVILLE_PAGE)
+
+        self.assertEqual(snapshot.stock(), {"00009": 3, "00107": 0})
+        self.assertEqual(snapshot.inventory["brand_name"].tolist(), ["Blanton's", "Weller 12"])
+        self.assertIsNotNone(source.validate(source.parse("<table></table>"), None))
+
+    def test_nc_abc_snapshot(self):
+        source = NcAbcSource(60, os.path.join(self.test_dir, "inventory_before.csv"))
+        try:
+            snapshot = source.parse(source.fetch())
+            self.assertGreater(len(snapshot), 0)
+            self.assertIsNone(source.validate(snapshot, None))
+
+            # a failed download leaves nothing behind to be parsed again
+            with open(source.csv_file, "w") as outfile:
+                outfile.write("")
+            with self.assertRaises(ValueError):
+                source.parse(source.csv_file)
+        finally:
+            source.close()
+        self.assertFalse(os.path.exists(source.csv_file))
+
+
+def make_inventory(size: int, step: int = 0, first_code: int = 0) -> pd.DataFrame:
+    codes = [f"{code:05d}" for code in range(first_code, first_code + size)]
+    return pd.DataFrame(
+        {
+            "nc_code": codes,
+            "brand_name": [f"Brand {code}" for code in codes],
+            # a third out of stock with a little churn every step
+            "total_available": [(i + step) % 3 * 10 + (i + step) % 7 for i in range(size)],
+        }
+    )
+
+
+class AnomalyValidatorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.validator = AnomalyValidator(max_consecutive_rejections=3, min_history=5)
+        for step in range(6):
+            self.assertIsNone(self.validator.check(make_inventory(1000, step)))
+
+    def assertRejected(self, inventory: pd.DataFrame, reason: RejectReason) -> None:
+        rejection = self.validator.check(inventory)
+        self.assertIsNotNone(rejection)
+        self.assertTrue(rejection.startswith(reason.value), rejection)
+        self.assertEqual(self.validator.last_reason, reason)
+
+    def test_same_length_truncated_export_is_rejected(self):
+        inventory = make_inventory(1000, 6)
+        inventory.loc[500:, "nc_code"] = [f"X{i}" for i in range(500)]
+        self.assertRejected(inventory, RejectReason.CODES_MISSING)
+
+        inventory = make_inventory(1000, 6)
+        inventory.loc[:100, "nc_code"] = [f"X{i}" for i in range(101)]
+        self.assertRejected(inventory, RejectReason.CODES_MISSING)
+
+    def test_corrupted_values_are_rejected(self):
+        inventory = make_inventory(1000, 6)
+        inventory["total_available"] = 0
+        self.assertRejected(inventory, RejectReason.TOTAL_UNITS)
+
+        inventory = make_inventory(1000, 6)
+        inventory.loc[::2, "brand_name"] = None
+        self.assertRejected(inventory, RejectReason.NULL_RATE)
+
+    def test_large_catalog_change_is_accepted(self):
+        # new products and a few discontinued ones
+        inventory = pd.concat([make_inventory(995, 6, 5), make_inventory(400, 6, 5000)])
+        self.assertIsNone(self.validator.check(inventory))
+
+        # 3% of the catalog discontinued against a history where nothing ever went missing
+        inventory = pd.concat([make_inventory(965, 7, 35), make_inventory(500, 7, 5000)])
+        self.assertIsNone(self.validator.check(inventory))
+
+    def test_persistent_change_becomes_the_new_normal(self):
+        inventory = make_inventory(300, 6)
+        for _ in range(3):
+            self.assertRejected(inventory, RejectReason.CODES_MISSING)
+        self.assertIsNone(self.validator.check(inventory))
+        self.assertEqual(len(self.validator.history), 1)
+        self.assertIsNone(self.validator.check(make_inventory(300, 7)))
+
+
+class InventorySourceManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.fast = FakeSource("fast", 10)
+        self.slow = FakeSource("slow", 60)
+        self.fast.stock = {"001": 1}
+        self.slow.stock = {"001": 2, "002": 3}
+        self.manager = InventorySourceManager([self.fast, self.slow], clock=lambda: self.now)
+
+    def tearDown(self) -> None:
+        self.manager.close()
+
+    def test_sources_poll_on_their_own_interval(self):
+        self.assertEqual(sorted(self.manager.poll_due()), ["fast", "slow"])
+        self.assertEqual(self.manager.time_till_next_poll(), 10)
+
+        self.now += 10
+        self.slow.stock = {"001": 2, "002": 0}
+        self.assertEqual(self.manager.poll_due(), ["fast"])
+        self.assertEqual((self.fast.fetches, self.slow.fetches), (2, 1))
+
+        self.now += 50
+        self.assertEqual(sorted(self.manager.poll_due()), ["fast", "slow"])
+        self.assertEqual(self.manager.snapshots["slow"].stock(), {"001": 2, "002": 0})
+        self.assertEqual(self.manager.previous_snapshots["slow"].stock(), {"001": 2, "002": 3})
+        self.assertIn("002", self.manager.out_of_stock_times["slow"])
+
+    def test_primary_source_is_not_polled(self):
+        primary = FakeSource("primary", 10)
+        manager = InventorySourceManager([self.fast], clock=lambda: self.now, primary=primary)
+        try:
+            self.assertEqual(manager.poll_due(), ["fast"])
+            self.assertEqual(primary.fetches, 0)
+            self.assertIn("primary", manager.sources)
+
+            with self.assertRaises(ValueError):
+                InventorySourceManager([self.fast], primary=FakeSource("fast", 10))
+        finally:
+            manager.executor.shutdown()
+
+    def test_failed_and_invalid_polls_keep_the_last_snapshot(self):
+        self.manager.poll_due()
+
+        self.now += 60
+        self.fast.fail = True
+        self.slow.stock = {}
+        self.assertEqual(self.manager.poll_due(), [])
+        self.assertEqual(self.manager.snapshots["fast"].stock(), {"001": 1})
+        self.assertEqual(self.manager.snapshots["slow"].stock(), {"001": 2, "002": 3})
+        # failures wait for the next interval rather than retrying immediately
+        self.assertEqual(self.manager.time_till_next_poll(), 10)
+
+
+class MultiSourceMonitorTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        init_database(self.test_dir, DEFAULT_DB, True)
+        self.temp_dir = tempfile.mkdtemp()
+
+        for index, name in enumerate(["subscriber", "other"]):
+            ClientDb.add_client(name, f"{name}@gmail.com", [f"+1555000000{index}"])
+            ClientDb.add_item_to_client_and_track(name, "00009")
+            with ClientDb.client(name) as client:
+                client.has_paid = True
+                client.phone_alerts = True
+                client.threshold_inventory = 0
+        ClientDb.subscribe_to_source("subscriber", "store")
+
+        self.store = FakeSource("store", 60)
+        self.twilio_stub = TwilioUtilStub()
+        self.monitor = InventoryMonitor(
+            twilio_util=self.twilio_stub,
+            admin_email=None,
+            log_dir=self.temp_dir,
+            credentials_file="",
+            use_local_db=True,
+            sources=[self.store],
+        )
+
+    def tearDown(self) -> None:
+        self.monitor.close()
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_only_subscribers_are_alerted(self):
+        self.store.stock = {"00009": 0}
+        self.monitor._run_sources_task()
+        self.assertEqual(self.twilio_stub.sent, [])
+
+        self.monitor.source_manager.next_poll["store"] = 0.0
+        self.store.stock = {"00009": 4}
+        self.monitor._run_sources_task()
+
+        self.assertEqual(len(self.twilio_stub.sent), 1)
+        number, message = self.twilio_stub.sent[0]
+        self.assertEqual(number, "+15550000000")
+        self.assertIn("Brand 00009 (store)", message)
+
+        # secondary sources don't touch the warehouse inventory
+        with ClientDb.item("00009") as item:
+            self.assertIsNone(item.total_available)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import typing as T
+import unittest
+from unittest import mock
+
+from util import log
+
+
+class FakeStdout(io.StringIO):
+    def __init__(self, is_tty: bool = False) -> None:
+        super().__init__()
+        self.is_tty = is_tty
+        self.isatty_calls = 0
+        self.flushes = 0
+
+    def isatty(self) -> bool:
+        self.isatty_calls += 1
+        return self.is_tty
+
+    def flush(self) -> None:
+        self.flushes += 1
+        super().flush()
+
+
+class LogTest(unittest.TestCase):
+    def setUp(self) -> None:
+        log.flush()
+        self.stdout = FakeStdout()
+        patcher = mock.patch.object(sys, "stdout", self.stdout)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(log.reset_color_support)
+        self.addCleanup(log.set_console_level, logging.DEBUG)
+        log.reset_color_support()
+
+    def test_lines_are_written_without_flushing_each_one(self):
+        for index in range(200):
+            log.print_normal(f"line {index}")
+        log.flush()
+
+        lines = self.stdout.getvalue().splitlines()
+        self.assertEqual(lines, [f"line {index}" for index in range(200)])
+        self.assertLess(self.stdout.flushes, 50)
+        # the terminal check is cached rather than done per line
+        self.assertEqual(self.stdout.isatty_calls, 1)
+
+    def test_color_and_prefix(self):
+        self.stdout.is_tty = True
+        log.print_ok_arrow("done {}", 1)
+        log.flush()
+
+        line = self.stdout.getvalue()
+        self.assertTrue(line.startswith(log.Colors.OKGREEN))
+        self.assertIn("done 1", line)
+        self.assertTrue(line.rstrip("\n").endswith(log.Colors.ENDC))
+        self.assertEqual(log.format_normal("plain"), log.Colors.ENDC + "plain" + log.Colors.ENDC)
+
+    def test_console_level_skips_formatting(self):
+        log.set_console_level(logging.WARNING)
+        message = mock.MagicMock()
+        log.print_normal(message, 1)
+        log.flush()
+
+        message.format.assert_not_called()
+        self.assertEqual(self.stdout.getvalue(), "")
+
+
+class StructuredLogTest(unittest.TestCase):
+    def _record(self, message: str, **extra: T.Any) -> logging.LogRecord:
+        record = logging.LogRecord("monitor", logging.INFO, __file__, 0, message, None, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_lines_formatter(self):
+        formatter = log.JsonLinesFormatter()
+
+        entry = json.loads(formatter.format(self._record(log.format_ok("+3") + " units")))
+        self.assertEqual(entry["msg"], "+3 units")
+        self.assertEqual(entry["level"], "INFO")
+
+        record = self._record("cycle_summary {}", fields={"event": "cycle_summary", "clients": 2})
+        entry = json.loads(formatter.format(record))
+        self.assertEqual(entry["event"], "cycle_summary")
+        self.assertEqual(entry["clients"], 2)
+        self.assertNotIn("msg", entry)
+
+    def test_line_sampler(self):
+        sampler = log.LineSampler(max_lines=3, sample_every=2)
+        allowed = [sampler.allow() for _ in range(10)]
+
+        self.assertEqual(allowed.count(True), 3)
+        self.assertEqual(allowed[:5], [True, False, True, False, True])
+        self.assertEqual(sampler.reset(), 7)
+        self.assertTrue(sampler.allow())
+
+        unbounded = log.LineSampler()
+        self.assertTrue(all(unbounded.allow() for _ in range(1000)))
+        self.assertEqual(unbounded.dropped, 0)
+
+    def test_multi_handler_writes_text(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            handler = log.MultiHandler(log_dir)
+            handler.emit(self._record("caf\u00e9 restocked"))
+            handler.flush()
+            for fp in handler.files.values():
+                fp.close()
+
+            with open(os.path.join(log_dir, f"{threading.current_thread().name}.log")) as infile:
+                self.assertEqual(infile.read(), "caf\u00e9 restocked\n")
+
+
+class LogRotationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.logs_dir = temp_dir.name
+
+    def _handler(self, compressor: log.SegmentCompressor, **kwargs: T.Any) -> logging.Handler:
+        handler = log.SegmentRotatingFileHandler(
+            os.path.join(self.logs_dir, "monitor.log"), compressor, **kwargs
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.addCleanup(handler.close)
+        return handler
+
+    def _emit(self, handler: logging.Handler, message: str, created: float = 0.0) -> None:
+        record = logging.LogRecord("monitor", logging.INFO, __file__, 0, message, None, None)
+        record.created = created or record.created
+        handler.handle(record)
+
+    def _segments(self) -> T.List[str]:
+        return sorted(f for f in os.listdir(self.logs_dir) if f.endswith(".gz"))
+
+    def test_rotates_by_size_and_compresses_segments(self):
+        compressor = log.SegmentCompressor(self.logs_dir)
+        handler = self._handler(compressor, max_bytes=100)
+
+        for index in range(30):
+            self._emit(handler, f"line {index:04d}")
+        compressor.join()
+
+        segments = self._segments()
+        self.assertGreater(len(segments), 1)
+
+        lines = []
+        for segment in segments:
+            with gzip.open(os.path.join(self.logs_dir, segment), "rt") as infile:
+                lines.extend(infile.read().splitlines())
+        handler.flush()
+        with open(os.path.join(self.logs_dir, "monitor.log")) as infile:
+            lines.extend(infile.read().splitlines())
+
+        self.assertEqual(sorted(lines), [f"line {index:04d}" for index in range(30)])
+        self.assertFalse([f for f in os.listdir(self.logs_dir) if f.endswith(".tmp")])
+
+    def test_rotates_by_time(self):
+        compressor = log.SegmentCompressor(self.logs_dir)
+        handler = self._handler(compressor, rotate_seconds=60)
+
+        self._emit(handler, "first")
+        self._emit(handler, "second", created=handler.rollover_at + 1)
+        compressor.join()
+
+        self.assertEqual(len(self._segments()), 1)
+
+    def test_retention_removes_oldest_segments(self):
+        for index in range(5):
+            path = os.path.join(self.logs_dir, f"old_{index}.log.gz")
+            with open(path, "wb") as outfile:
+                outfile.write(b"x" * 1000)
+            os.utime(path, (index, index))
+
+        compressor = log.SegmentCompressor(self.logs_dir, max_total_bytes=2500)
+        removed = compressor.enforce_retention()
+
+        self.assertEqual(
+            [os.path.basename(path) for path in removed],
+            ["old_0.log.gz", "old_1.log.gz", "old_2.log.gz"],
+        )
+        self.assertEqual(self._segments(), ["old_3.log.gz", "old_4.log.gz"])
+
+    def test_stale_logs_are_compressed(self):
+        for name in ("previous_run.log", "current.log"):
+            with open(os.path.join(self.logs_dir, name), "w") as outfile:
+                outfile.write("history\n")
+
+        compressor = log.SegmentCompressor(self.logs_dir)
+        current = os.path.join(self.logs_dir, "current.log")
+        self.assertEqual(log.compress_stale_logs(compressor, keep=[current]), 1)
+        compressor.join()
+
+        self.assertEqual(sorted(os.listdir(self.logs_dir)), ["current.log", "previous_run.log.gz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,485 @@
+"""
+In-memory firestore backend. Supports the parts of the firestore api used by this
+project (collections, documents, set/update with merge, batched writes and on_snapshot
+listeners with change types) so the firebase sync path can be exercised and benchmarked
+without credentials. Listener callbacks are delivered on a background thread like the
+real client; call flush() to wait for them. It lives with the test doubles, which the
+benchmarks share, since the monitor itself never uses it.
+"""
+
+import collections
+import copy
+import datetime
+import enum
+import queue
+import threading
+import time
+import typing as T
+import uuid
+
+from firebase.backend import FirestoreBackend
+from firebase.write_back import MAX_WRITES_PER_BATCH, apply_field_updates, split_field_path
+from util import log
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentNotFound(Exception):
+    pass
+
+
+class _ServerTimestamp:
+    def __repr__(self) -> str:
+        return "SERVER_TIMESTAMP"
+
+
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+
+def _resolve_server_timestamps(value: T.Any, now: datetime.datetime) -> T.Any:
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, dict):
+        return {k: _resolve_server_timestamps(v, now) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve_server_timestamps(v, now) for v in value]
+    return value
+
+
+def _get_nested(data: T.Dict[str, T.Any], field_names: T.List[str]) -> T.Any:
+    for field_name in field_names:
+        if not isinstance(data, dict) or field_name not in data:
+            raise KeyError(".".join(field_names))
+        data = data[field_name]
+    return data
+
+
+def _deep_merge(target: T.Dict[str, T.Any], source: T.Dict[str, T.Any]) -> None:
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class _StoredDocument(T.NamedTuple):
+    data: T.Dict[str, T.Any]
+    update_time: datetime.datetime
+    create_time: datetime.datetime
+
+
+class MemoryDocumentSnapshot:
+    def __init__(
+        self,
+        reference: "MemoryDocumentReference",
+        stored: T.Optional[_StoredDocument],
+        read_time: datetime.datetime,
+        field_paths: T.Optional[T.List[str]] = None,
+    ) -> None:
+        self.reference = reference
+        self.read_time = read_time
+        self._data = stored.data if stored is not None else None
+        self.update_time = stored.update_time if stored is not None else None
+        self.create_time = stored.create_time if stored is not None else None
+        self._field_paths = field_paths
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> T.Optional[T.Dict[str, T.Any]]:
+        if self._data is None:
+            return None
+        if self._field_paths is None:
+            return copy.deepcopy(self._data)
+
+        projected: T.Dict[str, T.Any] = {}
+        for path in self._field_paths:
+            try:
+                value = _get_nested(self._data, split_field_path(path))
+            except KeyError:
+                continue
+            apply_field_updates(projected, {path: copy.deepcopy(value)})
+        return projected
+
+    def get(self, field_path: str) -> T.Any:
+        if self._data is None:
+            return None
+        return copy.deepcopy(_get_nested(self._data, split_field_path(field_path)))
+
+
+class MemoryDocumentChange(T.NamedTuple):
+    type: ChangeType
+    document: MemoryDocumentSnapshot
+    old_index: int
+    new_index: int
+
+
+class MemoryWatch:
+    def __init__(
+        self,
+        backend: "MemoryFirestore",
+        collection: str,
+        callback: T.Callable[
+            [T.List[MemoryDocumentSnapshot], T.List[MemoryDocumentChange], T.Any], None
+        ],
+    ) -> None:
+        self.backend = backend
+        self.collection = collection
+        self.callback = callback
+        self.error: T.Optional[BaseException] = None
+        self._closed = False
+
+    @property
+    def is_active(self) -> bool:
+        return not self._closed
+
+    def close(self, reason: T.Optional[BaseException] = None) -> None:
+        """Stop the listener, a reason marks the stream as having failed"""
+        self.error = reason
+        self._closed = True
+        self.backend._remove_watch(self)
+
+    def unsubscribe(self) -> None:
+        self.close()
+
+
+class MemoryWriteBatch:
+    def __init__(self, backend: "MemoryFirestore") -> None:
+        self.backend = backend
+        self._writes: T.List[T.Tuple[str, "MemoryDocumentReference", T.Any, T.Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(
+        self,
+        reference: "MemoryDocumentReference",
+        document_data: T.Dict[str, T.Any],
+        merge: T.Union[bool, T.List[str]] = False,
+    ) -> "MemoryWriteBatch":
+        self._writes.append(("set", reference, copy.deepcopy(document_data), merge))
+        return self
+
+    def update(
+        self, reference: "MemoryDocumentReference", field_updates: T.Dict[str, T.Any]
+    ) -> "MemoryWriteBatch":
+        self._writes.append(("update", reference, copy.deepcopy(field_updates), None))
+        return self
+
+    def delete(self, reference: "MemoryDocumentReference") -> "MemoryWriteBatch":
+        self._writes.append(("delete", reference, None, None))
+        return self
+
+    def commit(self) -> T.List[datetime.datetime]:
+        if len(self._writes) > MAX_WRITES_PER_BATCH:
+            raise ValueError(
+                f"Batch of {len(self._writes)} writes exceeds the limit of {MAX_WRITES_PER_BATCH}"
+            )
+        writes, self._writes = self._writes, []
+        return self.backend._commit(writes)
+
+
+class MemoryDocumentReference:
+    def __init__(self, backend: "MemoryFirestore", collection: str, doc_id: str) -> None:
+        self.backend = backend
+        self.collection_id = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection_id}/{self.id}"
+
+    @property
+    def parent(self) -> "MemoryCollectionReference":
+        return self.backend.collection(self.collection_id)
+
+    def get(
+        self, field_paths: T.Optional[T.List[str]] = None, transaction: T.Any = None
+    ) -> MemoryDocumentSnapshot:
+        # a transaction holds the backend lock, so its reads need nothing extra
+        return self.backend._get(self, field_paths)
+
+    def set(
+        self, document_data: T.Dict[str, T.Any], merge: T.Union[bool, T.List[str]] = False
+    ) -> datetime.datetime:
+        return self.backend.batch().set(self, document_data, merge=merge).commit()[0]
+
+    def update(self, field_updates: T.Dict[str, T.Any]) -> datetime.datetime:
+        return self.backend.batch().update(self, field_updates).commit()[0]
+
+    def delete(self) -> datetime.datetime:
+        return self.backend.batch().delete(self).commit()[0]
+
+
+class MemoryCollectionReference:
+    def __init__(self, backend: "MemoryFirestore", collection: str) -> None:
+        self.backend = backend
+        self.id = collection
+
+    def document(self, doc_id: T.Optional[str] = None) -> MemoryDocumentReference:
+        return MemoryDocumentReference(self.backend, self.id, doc_id or uuid.uuid4().hex)
+
+    def list_documents(self) -> T.List[MemoryDocumentReference]:
+        return self.backend._list_documents(self.id)
+
+    def stream(self) -> T.Iterator[MemoryDocumentSnapshot]:
+        for reference in self.list_documents():
+            yield reference.get()
+
+    def on_snapshot(self, callback: T.Callable) -> MemoryWatch:
+        return self.backend._add_watch(self.id, callback)
+
+
+class MemoryFirestore(FirestoreBackend):
+    """
+    Thread safe in-memory firestore. `latency` seconds are added to every simulated rpc
+    and `stats` counts document reads, writes, commits and listener traffic.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.stats: T.Counter[str] = collections.Counter()
+
+        self._lock = threading.RLock()
+        self._documents: T.Dict[str, T.Dict[str, _StoredDocument]] = {}
+        self._watches: T.Dict[str, T.List[MemoryWatch]] = {}
+        self._last_time = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+
+        self._events: "queue.Queue[T.Tuple[MemoryWatch, T.Any, T.Any, T.Any]]" = queue.Queue()
+        self._dispatcher: T.Optional[threading.Thread] = None
+
+    @property
+    def server_timestamp(self) -> T.Any:
+        return SERVER_TIMESTAMP
+
+    def collection(self, name: str) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self, name)
+
+    def batch(self) -> MemoryWriteBatch:
+        return MemoryWriteBatch(self)
+
+    def run_transaction(self, func: T.Callable[[T.Any], T.Any]) -> T.Any:
+        """Runs func under the lock every read and write takes, so nothing can interleave"""
+        with self._lock:
+            transaction = MemoryWriteBatch(self)
+            result = func(transaction)
+            if len(transaction):
+                transaction.commit()
+            return result
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Block until all pending listener callbacks have been delivered"""
+        deadline = time.time() + timeout
+        while self._events.unfinished_tasks:
+            if time.time() > deadline:
+                raise TimeoutError("Timed out waiting for snapshot listeners")
+            time.sleep(0.001)
+
+    def _rpc(self, name: str) -> None:
+        self.stats[name] += 1
+        if self.latency > 0.0:
+            time.sleep(self.latency)
+
+    def _now(self) -> datetime.datetime:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + datetime.timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _get(
+        self, reference: MemoryDocumentReference, field_paths: T.Optional[T.List[str]]
+    ) -> MemoryDocumentSnapshot:
+        self._rpc("get")
+        with self._lock:
+            stored = self._documents.get(reference.collection_id, {}).get(reference.id)
+            self.stats["reads"] += 1
+            return MemoryDocumentSnapshot(reference, stored, self._now(), field_paths)
+
+    def _list_documents(self, collection: str) -> T.List[MemoryDocumentReference]:
+        self._rpc("list_documents")
+        with self._lock:
+            return [
+                MemoryDocumentReference(self, collection, doc_id)
+                for doc_id in sorted(self._documents.get(collection, {}).keys())
+            ]
+
+    def _apply_write(
+        self,
+        op: str,
+        existing: T.Optional[_StoredDocument],
+        data: T.Any,
+        merge: T.Any,
+        now: datetime.datetime,
+    ) -> T.Optional[T.Dict[str, T.Any]]:
+        if op == "delete":
+            return None
+
+        data = _resolve_server_timestamps(data, now)
+        current = copy.deepcopy(existing.data) if existing is not None else None
+
+        if op == "update":
+            if current is None:
+                raise DocumentNotFound("No document to update")
+            apply_field_updates(current, data)
+            return current
+
+        if not merge or current is None and merge is True:
+            return data
+        if current is None:
+            current = {}
+        if merge is True:
+            _deep_merge(current, data)
+            return current
+
+        for path in merge:
+            apply_field_updates(current, {path: _get_nested(data, split_field_path(path))})
+        return current
+
+    def _commit(
+        self, writes: T.List[T.Tuple[str, MemoryDocumentReference, T.Any, T.Any]]
+    ) -> T.List[datetime.datetime]:
+        self._rpc("commit")
+        with self._lock:
+            now = self._now()
+            # validate and build every write before applying so the batch is atomic
+            staged: T.Dict[T.Tuple[str, str], T.Optional[_StoredDocument]] = {}
+            originals: T.Dict[T.Tuple[str, str], T.Optional[_StoredDocument]] = {}
+            for op, reference, data, merge in writes:
+                key = (reference.collection_id, reference.id)
+                if key not in originals:
+                    originals[key] = self._documents.get(key[0], {}).get(key[1])
+                existing = staged.get(key, originals[key])
+                new_data = self._apply_write(op, existing, data, merge, now)
+                if new_data is None:
+                    staged[key] = None
+                elif existing is not None and existing.data == new_data:
+                    staged[key] = existing
+                else:
+                    create_time = existing.create_time if existing is not None else now
+                    staged[key] = _StoredDocument(new_data, now, create_time)
+
+            changes: T.Dict[str, T.List[T.Tuple[str, T.Optional[_StoredDocument], T.Any]]] = {}
+            for (collection, doc_id), stored in staged.items():
+                original = originals[(collection, doc_id)]
+                documents = self._documents.setdefault(collection, {})
+                if stored is None:
+                    documents.pop(doc_id, None)
+                else:
+                    documents[doc_id] = stored
+                self.stats["writes"] += 1
+
+                if original is None and stored is None:
+                    continue
+                if original is None:
+                    change_type = ChangeType.ADDED
+                elif stored is None:
+                    change_type = ChangeType.REMOVED
+                elif original is stored:
+                    continue
+                else:
+                    change_type = ChangeType.MODIFIED
+                changes.setdefault(collection, []).append((doc_id, stored or original, change_type))
+
+            for collection, collection_changes in changes.items():
+                self._notify(collection, collection_changes, now)
+
+            return [now] * len(writes)
+
+    def _collection_snapshot(
+        self, collection: str, read_time: datetime.datetime
+    ) -> T.Tuple[T.List[MemoryDocumentSnapshot], T.Dict[str, int]]:
+        documents = self._documents.get(collection, {})
+        doc_ids = sorted(documents.keys())
+        snapshots = [
+            MemoryDocumentSnapshot(
+                MemoryDocumentReference(self, collection, doc_id), documents[doc_id], read_time
+            )
+            for doc_id in doc_ids
+        ]
+        return snapshots, {doc_id: index for index, doc_id in enumerate(doc_ids)}
+
+    def _notify(
+        self,
+        collection: str,
+        collection_changes: T.List[T.Tuple[str, _StoredDocument, ChangeType]],
+        now: datetime.datetime,
+    ) -> None:
+        watches = self._watches.get(collection, [])
+        if not watches:
+            return
+
+        snapshots, indices = self._collection_snapshot(collection, now)
+        changes = []
+        for doc_id, stored, change_type in collection_changes:
+            reference = MemoryDocumentReference(self, collection, doc_id)
+            changes.append(
+                MemoryDocumentChange(
+                    type=change_type,
+                    document=MemoryDocumentSnapshot(reference, stored, now),
+                    old_index=-1 if change_type == ChangeType.ADDED else 0,
+                    new_index=-1 if change_type == ChangeType.REMOVED else indices[doc_id],
+                )
+            )
+
+        for watch in watches:
+            self.stats["listen_reads"] += len(changes)
+            self._enqueue(watch, snapshots, changes, now)
+
+    def _add_watch(self, collection: str, callback: T.Callable) -> MemoryWatch:
+        self._rpc("listen")
+        with self._lock:
+            watch = MemoryWatch(self, collection, callback)
+            self._watches.setdefault(collection, []).append(watch)
+
+            now = self._now()
+            snapshots, _ = self._collection_snapshot(collection, now)
+            changes = [
+                MemoryDocumentChange(ChangeType.ADDED, snapshot, -1, index)
+                for index, snapshot in enumerate(snapshots)
+            ]
+            # the initial snapshot is billed as a read of every document
+            self.stats["listen_reads"] += len(changes)
+            self._enqueue(watch, snapshots, changes, now)
+            return watch
+
+    def _remove_watch(self, watch: MemoryWatch) -> None:
+        with self._lock:
+            watches = self._watches.get(watch.collection, [])
+            if watch in watches:
+                watches.remove(watch)
+
+    def _enqueue(
+        self,
+        watch: MemoryWatch,
+        snapshots: T.List[MemoryDocumentSnapshot],
+        changes: T.List[MemoryDocumentChange],
+        read_time: datetime.datetime,
+    ) -> None:
+        self._events.put((watch, snapshots, changes, read_time))
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_events, name="MemoryFirestoreListener", daemon=True
+            )
+            self._dispatcher.start()
+
+    def _dispatch_events(self) -> None:
+        while True:
+            watch, snapshots, changes, read_time = self._events.get()
+            try:
+                if watch.is_active:
+                    watch.callback(snapshots, changes, read_time)
+            except Exception as exception:  # pylint: disable=broad-except
+                log.print_fail(f"Snapshot listener failed: {exception}")
+                watch.close(reason=exception)
+            finally:
+                self._events.task_done()
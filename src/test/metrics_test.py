@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.request
+
+import dotenv
+
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from inventory_monitor import ALERTS_SENT, STAGE_SECONDS, InventoryMonitor
+from util import metrics
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = metrics.MetricsRegistry()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_prometheus_text(self):
+        counter = self.registry.counter("rows_total", "Rows", ["source"])
+        gauge = self.registry.gauge("clients", "Clients")
+        histogram = self.registry.histogram("stage_seconds", "Stages", ["stage"], [0.1, 1.0])
+
+        counter.inc(3, source="nc_abc")
+        counter.inc(source="nc_abc")
+        gauge.set(12)
+        histogram.observe(0.05, stage="parse")
+        histogram.observe(0.5, stage="parse")
+
+        text = self.registry.render()
+        self.assertIn("# TYPE rows_total counter", text)
+        self.assertIn('rows_total{source="nc_abc"} 4', text)
+        self.assertIn("clients 12", text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="0.1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="+Inf"} 2', text)
+        self.assertIn('stage_seconds_count{stage="parse"} 2', text)
+
+        # registering again hands back the same metric
+        self.assertIs(self.registry.counter("rows_total", "Rows", ["source"]), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("rows_total", "Rows")
+        with self.assertRaises(ValueError):
+            counter.inc(store="youngsville")
+
+    def test_server_and_rolling_file(self):
+        self.registry.counter("requests_total", "Requests").inc()
+
+        server = metrics.MetricsServer(0, self.registry).start()
+        try:
+            url = f"http://127.0.0.1:{server.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn("requests_total 1", response.read().decode("utf-8"))
+        finally:
+            server.stop()
+
+        path = os.path.join(self.temp_dir, "metrics.jsonl")
+        writer = metrics.MetricsFileWriter(path, self.registry, max_bytes=1, backup_count=2)
+        for _ in range(4):
+            writer.write()
+
+        self.assertTrue(os.path.exists(f"{path}.1"))
+        self.assertTrue(os.path.exists(f"{path}.2"))
+        self.assertFalse(os.path.exists(f"{path}.3"))
+        with open(path) as infile:
+            record = json.loads(infile.readline())
+        self.assertEqual(record["metrics"]["requests_total"], {"": 1.0})
+
+
+class MonitorMetricsTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        dotenv.load_dotenv(".env")
+        init_database(self.test_dir, DEFAULT_DB, True)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_cycle_stages_are_timed(self):
+        ClientDb.add_client("test", "test@gmail.com", ["+1234567890"])
+        ClientDb.add_item_to_client_and_track("test", "00009")
+
+        monitor = InventoryMonitor(
+            twilio_util=None,
+            admin_email=None,
+            log_dir=self.temp_dir,
+            credentials_file="",
+            use_local_db=True,
+            metrics_file=os.path.join(self.temp_dir, "metrics.jsonl"),
+        )
+        monitor.inventory_source.url = os.path.join(self.test_dir, "inventory_before.csv")
+
+        before = {
+            stage: STAGE_SECONDS.get_count(stage=stage)
+            for stage in ["cycle", "parse", "validate", "db_write", "evaluate"]
+        }
+        monitor._run_inventory_task()
+        for stage, count in before.items():
+            self.assertEqual(STAGE_SECONDS.get_count(stage=stage), count + 1, stage)
+
+        monitor.metrics_writer.write()
+        with open(monitor.metrics_writer.path) as infile:
+            record = json.loads(infile.readline())
+        self.assertEqual(record["metrics"]["inventory_monitor_clients"], {"": 1})
+        self.assertIn("inventory_monitor_db_commits_total", record["metrics"])
+        self.assertIs(ALERTS_SENT, metrics.REGISTRY.metrics["inventory_monitor_alerts_sent_total"])
+
+
+if __name__ == "__main__":
+    unittest.main()
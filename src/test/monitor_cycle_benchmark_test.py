@@ -0,0 +1,36 @@
+import unittest
+
+from benchmarks.monitor_cycle_benchmark import CycleBenchmark, find_regressions
+from inventory_monitor import STAGE_SECONDS
+
+
+class MonitorCycleBenchmarkTest(unittest.TestCase):
+    def test_small_run_reports_every_stage(self):
+        results = CycleBenchmark(50, 3, 0.1, items_per_client=10).run(cycles=1)
+
+        for stage in ("parse", "db_write", "evaluate", "firestore_sync", "cycle"):
+            self.assertIn(stage, results)
+            self.assertIn(f"initial_{stage}", results)
+            self.assertGreater(results[stage]["seconds"], 0.0)
+            self.assertGreater(results[stage]["peak_rss_mb"], 0.0)
+        # the recorder is removed again afterwards
+        self.assertNotIn("observe", vars(STAGE_SECONDS))
+
+    def test_find_regressions(self):
+        baseline = {"case": {"evaluate": {"seconds": 1.0, "peak_rss_mb": 100.0}}}
+
+        def results(seconds, peak_rss_mb):
+            return {"case": {"evaluate": {"seconds": seconds, "peak_rss_mb": peak_rss_mb}}}
+
+        self.assertEqual(find_regressions(results(1.2, 110.0), baseline, 0.25), [])
+        self.assertEqual(len(find_regressions(results(1.5, 100.0), baseline, 0.25)), 1)
+        self.assertEqual(len(find_regressions(results(1.0, 200.0), baseline, 0.25)), 1)
+        self.assertEqual(find_regressions(results(9.0, 900.0), {}, 0.25), [])
+
+        # tiny stages can double without it meaning anything
+        small = {"case": {"evaluate": {"seconds": 0.01, "peak_rss_mb": 100.0}}}
+        self.assertEqual(find_regressions(results(0.03, 100.0), small, 0.25), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import signal
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+from util.profiler import CycleProfiler
+
+
+class CycleProfilerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.profile_dir = os.path.join(self.temp_dir, "profiles")
+        self.profiler = CycleProfiler(self.profile_dir, default_cycles=2)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _run_cycle(self) -> None:
+        with self.profiler.cycle():
+            sorted(str(i) for i in range(10000))
+
+    def test_profiles_only_requested_cycles(self):
+        self._run_cycle()
+        self.assertFalse(os.path.exists(self.profile_dir))
+        self.assertFalse(tracemalloc.is_tracing())
+
+        self.profiler.request()
+        for _ in range(3):
+            self._run_cycle()
+
+        files = sorted(os.listdir(self.profile_dir))
+        self.assertEqual(len([f for f in files if f.endswith(".prof")]), 2)
+        self.assertEqual(len([f for f in files if f.endswith(".txt")]), 2)
+        with open(os.path.join(self.profile_dir, files[-1])) as infile:
+            summary = infile.read()
+        self.assertIn("cumulative", summary)
+        self.assertIn("allocations by line", summary)
+
+        self.assertEqual(self.profiler.remaining_cycles, 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "SIGUSR1 is not available")
+    def test_signal_requests_profile(self):
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            self.assertTrue(self.profiler.install_signal_handler())
+            os.kill(os.getpid(), signal.SIGUSR1)
+            # the handler runs between bytecodes on the main thread
+            time.sleep(0.01)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+        self.assertEqual(self.profiler.remaining_cycles, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
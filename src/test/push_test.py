@@ -0,0 +1,171 @@
+import datetime
+import http.client
+import http.server
+import json
+import queue
+import threading
+import time
+import typing as T
+import unittest
+import urllib.request
+
+from alerts import push
+from restock_events import RestockEvent, RestockEventStream
+
+SECRET = "not-a-real-secret"
+NOW = datetime.datetime(2024, 1, 2, 12, 0, 0)
+
+
+def make_event(nc_code: str, available: int = 5) -> RestockEvent:
+    return RestockEvent(nc_code, "Brand", 0, available, None, "nc_abc", NOW)
+
+
+def make_receiver(received: "queue.Queue[T.Tuple[T.Dict[str, str], bytes]]", delay: float = 0.0):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args: T.Any) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay)
+            received.put((dict(self.headers), body))
+            self.send_response(204)
+            self.end_headers()
+
+    return Handler
+
+
+def read_sse_events(response: http.client.HTTPResponse, count: int) -> T.List[T.Dict[str, str]]:
+    events: T.List[T.Dict[str, str]] = []
+    fields: T.Dict[str, str] = {}
+    while len(events) < count:
+        line = response.readline().decode("utf-8").rstrip("\n")
+        if not line:
+            if fields:
+                events.append(fields)
+            fields = {}
+        elif not line.startswith(":"):
+            name, _, value = line.partition(": ")
+            fields[name] = value
+    return events
+
+
+class PushTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stream = RestockEventStream(start_id=0)
+        self.server = push.PushServer(self.stream, 0, keepalive_seconds=0.2).start()
+        self.received: "queue.Queue[T.Tuple[T.Dict[str, str], bytes]]" = queue.Queue()
+        self.receiver = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_receiver(self.received)
+        )
+        threading.Thread(target=self.receiver.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.receiver.shutdown()
+        self.receiver.server_close()
+
+    def _connect(self, headers: T.Optional[T.Dict[str, str]] = None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        connection.request("GET", "/events", headers=headers or {})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+        # the connected comment, after which the client is subscribed
+        self.assertEqual(response.readline(), b": connected\n")
+        return response
+
+    def test_signed_webhook_delivery(self):
+        url = f"http://127.0.0.1:{self.receiver.server_address[1]}/restocks"
+        self.server.add_webhook(url, SECRET)
+
+        published = self.stream.publish([make_event("00009"), make_event("00107", 12)])
+        headers, body = self.received.get(timeout=5)
+
+        signature = headers[push.SIGNATURE_HEADER]
+        timestamp = headers[push.TIMESTAMP_HEADER]
+        self.assertTrue(push.verify_signature(SECRET, timestamp, body, signature))
+        self.assertFalse(push.verify_signature("wrong", timestamp, body, signature))
+        self.assertFalse(push.verify_signature(SECRET, timestamp, body + b" ", signature))
+        self.assertFalse(
+            push.verify_signature(SECRET, timestamp, body, signature, now=float(timestamp) + 3600)
+        )
+
+        events = json.loads(body)["events"]
+        self.assertEqual(events, [event.to_json() for event in published])
+        self.assertEqual(events[1]["available"], 12)
+
+    def test_server_sent_events(self):
+        response = self._connect()
+        first = self.stream.publish([make_event("00009")])
+        self.stream.publish([make_event("00107"), make_event("00111")])
+
+        events = read_sse_events(response, 3)
+        self.assertEqual([e["id"] for e in events], ["1", "2", "3"])
+        self.assertEqual({e["event"] for e in events}, {"restock"})
+        self.assertEqual(json.loads(events[0]["data"]), first[0].to_json())
+
+        # a reconnecting client picks up where it left off
+        self.stream.publish([make_event("00120")])
+        response = self._connect({"Last-Event-ID": "2"})
+        self.assertEqual([e["id"] for e in read_sse_events(response, 2)], ["3", "4"])
+
+        url = f"http://127.0.0.1:{self.server.port}/events/recent?since=3"
+        with urllib.request.urlopen(url, timeout=5) as recent:
+            self.assertEqual([e["nc_code"] for e in json.load(recent)["events"]], ["00120"])
+
+    def test_unknown_last_event_id_is_ignored(self):
+        # an id the stream hasn't handed out, e.g. from a clock that went backwards
+        self.stream.publish([make_event("00009")])
+        response = self._connect({"Last-Event-ID": "500"})
+        self.stream.publish([make_event("00107")])
+        self.assertEqual([e["id"] for e in read_sse_events(response, 1)], ["2"])
+
+    def test_publishing_does_not_wait_for_slow_subscribers(self):
+        slow_receiver = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_receiver(self.received, delay=0.5)
+        )
+        threading.Thread(target=slow_receiver.serve_forever, daemon=True).start()
+        try:
+            self.server.add_webhook(f"http://127.0.0.1:{slow_receiver.server_address[1]}", SECRET)
+            start = time.perf_counter()
+            for i in range(10):
+                self.stream.publish([make_event(f"{i:05d}")])
+            self.assertLess(time.perf_counter() - start, 0.2)
+            self.received.get(timeout=5)
+        finally:
+            slow_receiver.shutdown()
+            slow_receiver.server_close()
+
+    def test_full_subscriber_drops_oldest_events(self):
+        subscriber = push.PushSubscriber(max_pending=2)
+        for i in range(5):
+            subscriber.offer([make_event(f"{i:05d}")])
+
+        self.assertEqual(subscriber.dropped, 3)
+        self.assertEqual(subscriber.next_batch(0)[0].nc_code, "00003")
+        self.assertEqual(subscriber.next_batch(0)[0].nc_code, "00004")
+        self.assertIsNone(subscriber.next_batch(0))
+
+        subscriber.close()
+        subscriber.offer([make_event("00005")])
+        self.assertIsNone(subscriber.next_batch(0))
+
+    def test_closed_webhook_stops_with_a_full_queue(self):
+        with self.assertRaises(ValueError):
+            push.WebhookSubscriber("http://127.0.0.1:1", "")
+
+        webhook = push.WebhookSubscriber("http://127.0.0.1:1", SECRET, max_pending=1)
+        webhook.POLL_SECONDS = 0.05
+        webhook.offer([make_event("00001")])
+        # the close sentinel doesn't fit, and a late offer can't push anything in
+        webhook.close()
+        webhook.offer([make_event("00002")])
+
+        webhook.start()
+        webhook.thread.join(timeout=5)
+        self.assertFalse(webhook.thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import typing as T
+import unittest
+
+from benchmarks.synthetic_data import make_catalog, make_clients, populate_database
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from database.models.client import ClientSchema
+from database.records import ClientRow, ItemRow, PhoneNumberRow, SubscriptionRow, TrackingItemRow
+
+
+class RecordsTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        self.catalog = make_catalog(100)
+        self.specs = make_clients(5, self.catalog, items_per_client=10, tracked_fraction=0.5)
+        init_database(self.test_dir, DEFAULT_DB, True)
+        populate_database(self.specs, self.catalog)
+
+    def tearDown(self) -> None:
+        close_engine(DEFAULT_DB)
+        remove_database(self.test_dir, DEFAULT_DB)
+
+    def test_clients_match_the_schema_dumps(self):
+        ClientDb.subscribe_to_source(self.specs[0].id, "youngsville")
+        clients = ClientDb.get_clients()
+        self.assertEqual(sorted(clients), sorted(spec.id for spec in self.specs))
+
+        for name, client in clients.items():
+            with ClientDb.client(name) as db:
+                schema = ClientSchema().dump(db)
+            for key in ("id", "email", "threshold_inventory", "has_paid", "alert_time_zone"):
+                self.assertEqual(client[key], schema[key])
+            self.assertEqual(
+                sorted(i["id"] for i in client["items"]), sorted(i["id"] for i in schema["items"])
+            )
+            self.assertEqual(
+                sorted(t["nc_code"] for t in client["tracked_items"]),
+                sorted(t["nc_code"] for t in schema["tracked_items"]),
+            )
+            self.assertEqual(
+                [p["number"] for p in client["phone_numbers"]],
+                [p["number"] for p in schema["phone_numbers"]],
+            )
+
+        self.assertEqual(
+            [s.source for s in clients[self.specs[0].id].subscriptions], ["youngsville"]
+        )
+
+    def test_items_are_shared_between_clients(self):
+        clients = ClientDb.get_clients()
+        all_items = ClientDb.all_items()
+        self.assertEqual(len(all_items), len(self.catalog))
+
+        items = {}
+        for client in clients.values():
+            for item in client.items:
+                self.assertIs(items.setdefault(item.id, item), item)
+                self.assertEqual(item, all_items[item.id])
+
+    def test_record_lookups(self):
+        item = ItemRow(id="00009", brand_name="Bowman", total_available=12)
+        self.assertEqual(item["brand_name"], "Bowman")
+        self.assertIsNone(item.size)
+        self.assertEqual(item.get("missing", 1), 1)
+        with self.assertRaises(KeyError):
+            item["missing"]  # pylint: disable=pointless-statement
+        with self.assertRaises(AttributeError):
+            item.missing = 1  # pylint: disable=attribute-defined-outside-init
+        self.assertNotEqual(item, ClientRow(id="00009"))
+
+    def test_annotations_match_the_columns(self):
+        for record in (ItemRow, PhoneNumberRow, TrackingItemRow, SubscriptionRow, ClientRow):
+            annotated = set(T.get_type_hints(record)) - {"__slots__"}
+            self.assertEqual(annotated, set(record.__slots__), record.__name__)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import datetime
+import time
+import unittest
+
+from restock_events import RestockEvent, RestockEventStream, diff_stock, find_restocks
+
+NOW = datetime.datetime(2024, 1, 2, 12, 0, 0)
+
+
+def make_event(nc_code: str, available: int = 5) -> RestockEvent:
+    return RestockEvent(nc_code, "Brand", 0, available, None, "nc_abc", NOW)
+
+
+class RestockEventsTest(unittest.TestCase):
+    def test_diff_stock(self):
+        previous = {"00001": 0, "00002": 4, "00003": 7, "00004": 0}
+        current = {"00001": 3, "00002": 4, "00003": 2, "00005": 6, "00006": 0}
+        self.assertEqual(
+            diff_stock(previous, current),
+            {"00001": (0, 3), "00003": (7, 2), "00005": (0, 6)},
+        )
+        self.assertEqual(
+            diff_stock(current, {}),
+            {"00001": (3, 0), "00002": (4, 0), "00003": (2, 0), "00005": (6, 0)},
+        )
+
+    def test_find_restocks(self):
+        changes = {"00001": (0, 3), "00003": (7, 2), "00005": (0, 6), "00007": (2, 0)}
+        out_of_stock = NOW - datetime.timedelta(hours=30)
+        asked = []
+
+        def out_of_stock_times(nc_codes):
+            asked.extend(nc_codes)
+            return {"00001": out_of_stock}
+
+        events = find_restocks(changes, str.upper, out_of_stock_times, "nc_abc", NOW)
+        self.assertEqual([e.nc_code for e in events], ["00001", "00005"])
+        self.assertEqual(sorted(asked), ["00001", "00005"])
+        self.assertEqual(events[0].delta, 3)
+        self.assertEqual(events[0].hours_out_of_stock(NOW), 30)
+        self.assertIsNone(events[1].hours_out_of_stock(NOW))
+        self.assertEqual(events[0].to_json()["out_of_stock_time"], out_of_stock.isoformat())
+        self.assertEqual(find_restocks({"00003": (7, 2)}, str, lambda c: 1 / 0, "nc_abc", NOW), [])
+
+    def test_stream_assigns_ids_and_replays(self):
+        stream = RestockEventStream(history=3, start_id=0)
+        received = []
+        subscriber = stream.subscribe(received.append)
+
+        first = stream.publish([make_event("00001"), make_event("00002")])
+        self.assertEqual([e.id for e in first], [1, 2])
+        self.assertEqual(stream.publish([]), [])
+
+        stream.unsubscribe(subscriber)
+        stream.publish([make_event("00003"), make_event("00004")])
+
+        self.assertEqual(received, [first])
+        self.assertEqual([e.id for e in stream.since(0)], [2, 3, 4])
+        self.assertEqual([e.nc_code for e in stream.since(3)], ["00004"])
+
+    def test_ids_keep_increasing_across_restarts(self):
+        before_restart = RestockEventStream().publish([make_event("00001")])
+        # a restart takes well over the millisecond the ids are counted from
+        time.sleep(0.01)
+        after_restart = RestockEventStream().publish([make_event("00001")])
+        self.assertGreater(after_restart[0].id, before_restart[0].id)
+
+    def test_failing_subscriber_does_not_stop_delivery(self):
+        stream = RestockEventStream()
+        received = []
+
+        def fail(_):
+            raise RuntimeError("subscriber is down")
+
+        stream.subscribe(fail)
+        stream.subscribe(received.extend)
+        stream.publish([make_event("00001")])
+
+        self.assertEqual([e.nc_code for e in received], ["00001"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import typing as T
+import unittest
+
+from util.scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock)
+        self.runs: T.List[str] = []
+
+    def _task(
+        self, name: str, delay: T.Optional[float] = None
+    ) -> T.Callable[[], T.Optional[float]]:
+        def _run() -> T.Optional[float]:
+            self.runs.append(name)
+            return delay
+
+        return _run
+
+    def test_tasks_run_when_due(self):
+        self.scheduler.add_task("fast", self._task("fast"), 10)
+        self.scheduler.add_task("slow", self._task("slow"), 60, run_immediately=False)
+
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.runs, ["fast"])
+        self.assertEqual(self.scheduler.time_till_next_task(), 10)
+
+        self.clock.now = 5
+        self.assertEqual(self.scheduler.run_pending(), 0)
+
+        self.clock.now = 60
+        self.scheduler.run_pending()
+        self.assertEqual(self.runs, ["fast", "fast", "slow"])
+
+    def test_trigger_runs_task_early(self):
+        self.scheduler.add_task("firebase", self._task("firebase"), 300, run_immediately=False)
+        self.scheduler.add_task("inventory", self._task("inventory"), 300, run_immediately=False)
+
+        self.scheduler.trigger("firebase")
+        self.scheduler.trigger("unknown")
+        self.assertEqual(self.scheduler.time_till_next_task(), 0.0)
+
+        self.scheduler.run_pending()
+        self.assertEqual(self.runs, ["firebase"])
+        self.assertEqual(self.scheduler.time_till_next_task(), 300)
+
+    def test_task_can_override_next_run(self):
+        self.scheduler.add_task("inventory", self._task("inventory", delay=30), 300)
+        self.scheduler.run_pending()
+        self.assertEqual(self.scheduler.time_till_next_task(), 30)
+
+    def test_run_forever_wakes_on_trigger(self):
+        scheduler = Scheduler()
+        triggered = threading.Event()
+
+        def _on_trigger() -> None:
+            triggered.set()
+            scheduler.stop()
+
+        scheduler.add_task("idle", lambda: None, 3600, run_immediately=False)
+        scheduler.add_task("event", _on_trigger, 3600, run_immediately=False)
+
+        thread = threading.Thread(target=scheduler.run_forever, daemon=True)
+        thread.start()
+        scheduler.trigger("event")
+        thread.join(timeout=5.0)
+
+        self.assertTrue(triggered.is_set())
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
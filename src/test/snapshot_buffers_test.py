@@ -0,0 +1,81 @@
+import os
+import unittest
+
+from inventory_sources.nc_abc import INVENTORY_CODE_KEY, clean_inventory_csv
+from snapshot_buffers import SnapshotBuffers
+
+
+class SnapshotBuffersTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def setUp(self) -> None:
+        self.before = clean_inventory_csv(os.path.join(self.test_dir, "inventory_before.csv"))
+        self.after = clean_inventory_csv(os.path.join(self.test_dir, "inventory_after.csv"))
+        self.buffers = SnapshotBuffers(INVENTORY_CODE_KEY)
+
+    def test_frame_round_trips(self):
+        self.buffers.current.fill(self.before)
+        frame = self.buffers.current.frame()
+
+        self.assertTrue(frame.equals(self.before))
+        self.assertEqual(list(frame.dtypes), list(self.before.dtypes))
+
+    def test_get_reads_the_first_matching_row(self):
+        self.buffers.current.fill(self.before)
+        first = self.before.drop_duplicates(INVENTORY_CODE_KEY).iloc[0]
+
+        row = self.buffers.current.get(first[INVENTORY_CODE_KEY])
+        self.assertIsNotNone(row)
+        self.assertEqual(row.total_available, first["total_available"])
+        self.assertEqual(row["brand_name"], first["brand_name"])
+        self.assertIsInstance(row.total_available, int)
+
+        self.assertIsNone(self.buffers.current.get("not a code"))
+        self.assertIsNone(self.buffers.previous.get(first[INVENTORY_CODE_KEY]))
+
+    def test_rotation_reuses_the_arrays(self):
+        self.buffers.current.fill(self.before)
+        self.buffers.rotate()
+        self.buffers.current.fill(self.after)
+        arrays = {
+            id(c) for b in (self.buffers.current, self.buffers.previous) for c in b.columns.values()
+        }
+
+        for _ in range(5):
+            self.buffers.rotate()
+            self.buffers.current.fill(self.before)
+            self.buffers.rotate()
+            self.buffers.current.fill(self.after)
+
+        reused = {
+            id(c) for b in (self.buffers.current, self.buffers.previous) for c in b.columns.values()
+        }
+        self.assertEqual(arrays, reused)
+        self.assertTrue(self.buffers.current.frame().equals(self.after))
+        self.assertTrue(self.buffers.previous.frame().equals(self.before))
+
+    def test_restore_copies_the_previous_inventory(self):
+        self.buffers.current.fill(self.before)
+        self.buffers.rotate()
+        self.assertTrue(self.buffers.current.empty)
+
+        self.buffers.restore()
+        self.assertTrue(self.buffers.current.frame().equals(self.before))
+        self.assertIsNot(
+            self.buffers.current.columns[INVENTORY_CODE_KEY],
+            self.buffers.previous.columns[INVENTORY_CODE_KEY],
+        )
+
+    def test_memory_usage(self):
+        self.assertEqual(self.buffers.memory_usage()["current_bytes"], 0)
+
+        self.buffers.current.fill(self.before)
+        usage = self.buffers.memory_usage(deep=True)
+        self.assertEqual(usage["current_rows"], len(self.before))
+        self.assertGreaterEqual(usage["capacity_rows"], len(self.before))
+        self.assertGreater(usage["current_bytes"], self.buffers.current.nbytes())
+        self.assertEqual(usage["previous_bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_data import (
+    InventoryGenerator,
+    make_catalog,
+    make_clients,
+    populate_database,
+    write_inventory_csv,
+)
+from database.client import DEFAULT_DB, ClientDb
+from database.connect import close_engine, init_database, remove_database
+from database.models.client import ClientSchema
+from inventory_sources.nc_abc import INVENTORY_CODE_KEY, clean_inventory_csv
+
+
+class SyntheticDataTest(unittest.TestCase):
+    test_dir: str = os.path.join(os.path.dirname(__file__), "test_data")
+
+    def test_export_matches_the_real_format(self):
+        catalog = make_catalog(20, seed=1)
+        generator = InventoryGenerator(catalog, seed=1)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "inventory.csv")
+            generator.write_csv(path)
+            with open(path) as infile:
+                lines = infile.read().splitlines()
+            with open(os.path.join(self.test_dir, "inventory_before.csv")) as infile:
+                fixture_header = infile.readline().rstrip("\n")
+
+            inventory = clean_inventory_csv(path)
+
+        self.assertEqual(lines[0], fixture_header)
+        self.assertTrue(lines[1].startswith('="00000","'))
+        self.assertTrue(lines[1].endswith('",'))
+        self.assertEqual(list(inventory[INVENTORY_CODE_KEY]), [item.nc_code for item in catalog])
+        self.assertEqual(
+            dict(zip(inventory[INVENTORY_CODE_KEY], inventory["total_available"])),
+            generator.available,
+        )
+
+    def test_generation_is_deterministic(self):
+        def run(seed):
+            catalog = make_catalog(500, seed)
+            generator = InventoryGenerator(catalog, seed=seed)
+            return catalog, list(generator.snapshots(3)), make_clients(10, catalog, 20, seed)
+
+        self.assertEqual(run(3), run(3))
+        self.assertNotEqual(run(3)[1], run(4)[1])
+
+    def test_churn(self):
+        catalog = make_catalog(1000)
+        generator = InventoryGenerator(
+            catalog, in_stock_fraction=0.5, restock_rate=0.1, depletion_rate=0.1
+        )
+        in_stock = sum(1 for available in generator.available.values() if available)
+        before = dict(generator.available)
+
+        changes = generator.step()
+
+        restocked = [code for code in changes if before[code] == 0]
+        depleted = [code for code in changes if before[code] > 0]
+        self.assertEqual(len(restocked), round((len(catalog) - in_stock) * 0.1))
+        self.assertEqual(len(depleted), round(in_stock * 0.1))
+        self.assertTrue(all(changes[code] > 0 for code in restocked))
+        self.assertTrue(all(changes[code] < before[code] for code in depleted))
+
+        quiet = InventoryGenerator(catalog, restock_rate=0, depletion_rate=0)
+        self.assertEqual(quiet.step(), {})
+
+    def test_populate_database(self):
+        catalog = make_catalog(100)
+        clients = make_clients(5, catalog, items_per_client=10, tracked_fraction=1.0)
+
+        init_database(self.test_dir, DEFAULT_DB, True)
+        try:
+            populate_database(clients, catalog)
+            schemas = {}
+            for name in ClientDb.get_client_names():
+                with ClientDb.client(name) as client:
+                    schemas[name] = ClientSchema().dump(client)
+        finally:
+            close_engine(DEFAULT_DB)
+            remove_database(self.test_dir, DEFAULT_DB)
+
+        self.assertEqual(sorted(schemas), [client.id for client in clients])
+        first = schemas[clients[0].id]
+        self.assertEqual(sorted(item["id"] for item in first["items"]), clients[0].items)
+        self.assertEqual(len(first["tracked_items"]), 10)
+        self.assertEqual(first["alert_time_zone"], clients[0].alert_time_zone)
+
+
+if __name__ == "__main__":
+    unittest.main()
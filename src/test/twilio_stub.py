@@ -0,0 +1,42 @@
+import datetime
+import threading
+import typing as T
+
+from util import log
+from util.twilio_util import TwilioUtil
+
+
+class TwilioUtilStub(TwilioUtil):
+    """Records the texts instead of sending them, inside the send window unless `now` is moved"""
+
+    def __init__(self, verbose: bool = False):
+        super().__init__("", "", "", verbose=verbose, time_between_sms=0)
+        self.sent: T.List[T.Tuple[str, str]] = []
+        self.sent_from_threads: T.Set[str] = set()
+        self.now: datetime.datetime = datetime.datetime(2021, 1, 1, 12 + 8, 0, 0)
+
+    def send_sms_if_in_window(
+        self, to_number: str, content: str, now: datetime.datetime = datetime.datetime.utcnow()
+    ) -> None:
+        super().send_sms_if_in_window(to_number, content, self.now)
+
+    def send_sms(self, to_number: str, content: str) -> None:
+        log.print_normal(f"Sending SMS to {to_number} with content:\n{content}")
+        self.sent.append((to_number, content))
+        self.sent_from_threads.add(threading.current_thread().name)
+
+    @property
+    def num_sent(self) -> int:
+        return len(self.sent)
+
+    @property
+    def send_to(self) -> str:
+        return self.sent[-1][0] if self.sent else ""
+
+    @property
+    def content(self) -> str:
+        return self.sent[-1][1] if self.sent else ""
+
+    def reset(self) -> None:
+        self.sent = []
+        self.sent_from_threads = set()
@@ -0,0 +1,249 @@
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import time
+import typing as T
+import unittest
+import urllib.parse
+import uuid
+
+from benchmarks.youngsville_parse_benchmark import make_item_list_page
+from youngsville_inventory import (
+    LOGIN_BUTTON_FIELD,
+    PASSWORD_FIELD,
+    USERNAME_FIELD,
+    LoginError,
+    YoungsvilleAbcInventory,
+)
+
+LOGIN_PAGE = """
+<html><body><form method="post" action="./Login.aspx?logout=1">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="C2EE9ABB" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{viewstate}-ev" />
+<input name="ctl00$ContentPlaceHolder1$txtUserName" type="text" />
+<input name="ctl00$ContentPlaceHolder1$txtPassword" type="password" />
+</form></body></html>
+"""
+
+
+class FakeStore:
+    """Just enough of shopncabc.com's asp.net login flow to exercise the scraper"""
+
+    def __init__(
+        self, username: str, password: str, rows: int = 50, pages: int = 1, page_delay: float = 0.0
+    ) -> None:
+        self.username = username
+        self.password = password
+        self.page_delay = page_delay
+        self.item_lists = [self._item_list(rows, page, pages) for page in range(pages)]
+        # clear the sessions after this many item list pages have been served
+        self.expire_after_requests = 0
+        self.viewstates: T.Set[str] = set()
+        self.sessions: T.Set[str] = set()
+        self.logins = 0
+        self.item_list_requests = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _item_list(rows: int, page: int, pages: int) -> str:
+        pager = ""
+        if pages > 1:
+            pager = "<div class=\"pager\"><a href=\"javascript:__doPostBack('pager','')\">Next</a>"
+            pager += "".join(
+                f'<a href="ItemList.aspx?page={p + 1}">{p + 1}</a>' for p in range(pages)
+            )
+            pager += "</div>"
+        return make_item_list_page(rows, seed=page, first_code=page * rows, footer=pager)
+
+    def expire_sessions(self) -> None:
+        with self.lock:
+            self.sessions.clear()
+
+
+def make_handler(store: FakeStore) -> T.Type[http.server.BaseHTTPRequestHandler]:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args: T.Any) -> None:
+            pass
+
+        def _session(self) -> str:
+            for cookie in self.headers.get_all("Cookie") or []:
+                for part in cookie.split(";"):
+                    name, _, value = part.strip().partition("=")
+                    if name == "ASP.NET_SessionId":
+                        return value
+            return ""
+
+        def _send(self, body: str, status: int = 200, headers: T.Dict[str, str] = None) -> None:
+            data = body.encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _login_page(self) -> None:
+            viewstate = uuid.uuid4().hex
+            with store.lock:
+                store.viewstates.add(viewstate)
+            self._send(LOGIN_PAGE.format(viewstate=viewstate))
+
+        def do_GET(self) -> None:
+            path = urllib.parse.urlparse(self.path).path
+            if path == "/Login.aspx":
+                self._login_page()
+            elif path == "/Default.aspx":
+                self._send("<html>Welcome</html>")
+            elif path == "/ItemList.aspx":
+                with store.lock:
+                    logged_in = self._session() in store.sessions
+                if not logged_in:
+                    self._send("", 302, {"Location": "/Login.aspx?ReturnUrl=%2fItemList.aspx"})
+                    return
+
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                page = int(query.get("page", ["1"])[0]) - 1
+                time.sleep(store.page_delay)
+                self._send(store.item_lists[page])
+
+                with store.lock:
+                    store.item_list_requests += 1
+                    if store.item_list_requests == store.expire_after_requests:
+                        store.sessions.clear()
+            else:
+                self._send("", 404)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+            field = lambda name: form.get(name, [""])[0]
+
+            with store.lock:
+                viewstate = field("__VIEWSTATE")
+                valid = (
+                    viewstate in store.viewstates
+                    and field("__EVENTVALIDATION") == f"{viewstate}-ev"
+                    and field(USERNAME_FIELD) == store.username
+                    and field(PASSWORD_FIELD) == store.password
+                    and field(LOGIN_BUTTON_FIELD) == "Login"
+                )
+                store.viewstates.discard(viewstate)
+                if valid:
+                    session = uuid.uuid4().hex
+                    store.sessions.add(session)
+                    store.logins += 1
+
+            if not valid:
+                self._login_page()
+                return
+            self._send(
+                "",
+                302,
+                {"Location": "/Default.aspx", "Set-Cookie": f"ASP.NET_SessionId={session}; path=/"},
+            )
+
+    return Handler
+
+
+class FakeStoreServer:
+    def __init__(self, store: FakeStore) -> None:
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), make_handler(store))
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class YoungsvilleSessionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = FakeStore("user", "secret")
+        self.server = FakeStoreServer(self.store)
+        self.temp_dir = tempfile.mkdtemp()
+        self.cookie_file = os.path.join(self.temp_dir, "cookies.json")
+
+    def tearDown(self) -> None:
+        self.server.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _scraper(self, password: str = "secret", **kwargs: T.Any) -> YoungsvilleAbcInventory:
+        return YoungsvilleAbcInventory(
+            "user", password, cookie_file=self.cookie_file, base_url=self.server.url, **kwargs
+        )
+
+    def test_session_is_reused(self):
+        scraper = self._scraper()
+        self.assertEqual(len(scraper.get_inventory()), 50)
+        self.assertEqual(len(scraper.get_inventory()), 50)
+        self.assertEqual(self.store.logins, 1)
+
+        # a new process picks the saved session back up
+        self.assertEqual(len(self._scraper().get_inventory()), 50)
+        self.assertEqual(self.store.logins, 1)
+        self.assertEqual(self.store.item_list_requests, 3)
+
+    def test_expired_session_logs_in_again(self):
+        scraper = self._scraper()
+        scraper.get_inventory()
+
+        self.store.expire_sessions()
+        self.assertEqual(len(scraper.get_inventory()), 50)
+        self.assertEqual(self.store.logins, 2)
+        self.assertEqual(scraper.logins, 2)
+
+    def test_rejected_login_raises(self):
+        with self.assertRaises(LoginError):
+            self._scraper(password="wrong").get_inventory()
+        self.assertFalse(os.path.exists(self.cookie_file))
+
+
+class YoungsvillePaginationTest(unittest.TestCase):
+    PAGES = 6
+    PAGE_DELAY = 0.3
+
+    def setUp(self) -> None:
+        self.store = FakeStore("user", "secret", pages=self.PAGES, page_delay=self.PAGE_DELAY)
+        self.server = FakeStoreServer(self.store)
+        self.scraper = YoungsvilleAbcInventory(
+            "user", "secret", base_url=self.server.url, max_page_workers=self.PAGES
+        )
+
+    def tearDown(self) -> None:
+        self.server.close()
+
+    def test_pages_are_fetched_concurrently(self):
+        self.scraper.login()
+
+        start = time.perf_counter()
+        inventory = self.scraper.get_inventory()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(inventory), 50 * self.PAGES)
+        self.assertEqual(inventory["nc_code"].tolist(), sorted(inventory["nc_code"].tolist()))
+        # the first page, then every other page at once, rather than one after another
+        self.assertEqual(self.store.item_list_requests, self.PAGES + 1)
+        self.assertLess(elapsed, self.PAGE_DELAY * 4)
+
+    def test_expired_session_during_a_scrape_logs_in_once(self):
+        self.scraper.login()
+        self.store.expire_after_requests = 1
+
+        inventory = self.scraper.get_inventory()
+
+        self.assertEqual(len(inventory), 50 * self.PAGES)
+        self.assertEqual(self.store.logins, 2)
+
+    def test_page_links(self):
+        links = self.scraper.page_links(self.store.item_lists[0])
+        self.assertEqual(len(links), self.PAGES)
+        self.assertEqual(links[1], f"{self.server.url}/ItemList.aspx?page=2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from benchmarks.youngsville_parse_benchmark import make_item_list_page
+from youngsville_parser import available_parsers, get_parser
+
+PAGE = """
+<table>
+<tr><th>Code</th><th>Item</th></tr>
+<tr><td><div class="c-cd"> 00009 </div></td><td><div class="c-nm">Blanton's [3 available]</div></td></tr>
+<tr><td><div class="c-cd item">00107</div></td><td><div class="item c-nm">Weller 12 [0 available] <span>750ml</span></div></td></tr>
+</table>
+"""
+
+
+class YoungsvilleParserTest(unittest.TestCase):
+    def test_parsers_agree(self):
+        page = make_item_list_page(200, seed=1)
+        expected = get_parser("bs4").parse(page)
+        self.assertEqual(len(expected), 200)
+
+        for name in available_parsers():
+            inventory = get_parser(name).parse(page)
+            self.assertTrue(inventory.equals(expected), name)
+
+    def test_parse_rows(self):
+        for name in available_parsers():
+            inventory = get_parser(name).parse(PAGE)
+            self.assertEqual(inventory["nc_code"].tolist(), ["00009", "00107"], name)
+            self.assertEqual(inventory["brand_name"].tolist(), ["Blanton's", "Weller 12"], name)
+            self.assertEqual(inventory["total_available"].tolist(), [3, 0], name)
+
+    def test_empty_and_malformed_pages(self):
+        for name in available_parsers():
+            parser = get_parser(name)
+            self.assertTrue(parser.parse("<table></table>").empty, name)
+            with self.assertRaises(ValueError):
+                parser.parse('<div class="c-cd">00009</div><div class="c-nm">No count</div>')
+
+    def test_unavailable_parser(self):
+        with self.assertRaises(ValueError):
+            get_parser("html5lib")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,6 @@
 import re
 import typing as T
 
-import yagmail
-
 from util import log
 
 
@@ -43,6 +41,8 @@ def send_email_raw(
     attachments: T.Optional[T.List[str]] = None,
     verbose: bool = False,
 ) -> None:
+    import yagmail
+
     with yagmail.SMTP(email["address"], email["password"]) as email_sender:
         if isinstance(to_addresses, str):
             to_addresses = [to_addresses]
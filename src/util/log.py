@@ -1,8 +1,15 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import re
 import shutil
 import sys
 import tarfile
+import threading
 import time
 import typing as T
 
@@ -69,13 +76,282 @@ class MultiHandler(logging.Handler):
                 return
             fp = self._get_or_open(name)
             msg = self.format(record)
-            fp.write(f"{msg.encode('utf-8')}\n")
+            fp.write(msg + "\n")
         except (KeyboardInterrupt, SystemExit):
             raise
         except:
             self.handleError(record)
 
 
+# console colors end up in messages through the format_* helpers
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, with any fields passed to event() merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            # the text version of the message just repeats the fields
+            entry.update(fields)
+        else:
+            entry["msg"] = _ANSI_ESCAPE.sub("", record.getMessage())
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LineSampler:
+    """
+    Bounds the number of repetitive lines (one per item, one per client) logged in a cycle.
+    Every `sample_every`th line is kept until `max_lines` have been, the rest are counted
+    and reported with the cycle summary.
+    """
+
+    def __init__(self, max_lines: int = 0, sample_every: int = 1) -> None:
+        self.max_lines = max_lines
+        self.sample_every = max(sample_every, 1)
+        self.seen = 0
+        self.logged = 0
+
+    def allow(self) -> bool:
+        self.seen += 1
+        if (self.seen - 1) % self.sample_every != 0:
+            return False
+        if self.max_lines and self.logged >= self.max_lines:
+            return False
+        self.logged += 1
+        return True
+
+    def print(self, printer: T.Callable, message: str, *args: T.Any) -> None:
+        if self.allow():
+            printer(message, *args)
+
+    @property
+    def dropped(self) -> int:
+        return self.seen - self.logged
+
+    def reset(self) -> int:
+        """Start a new cycle, returning how many lines were dropped in the last one"""
+        dropped = self.dropped
+        self.seen = 0
+        self.logged = 0
+        return dropped
+
+
+class _PreformattedQueueHandler(logging.handlers.QueueHandler):
+    """Console messages are colored and formatted before they are queued"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _ConsoleHandler(logging.Handler):
+    """
+    Writes to whatever sys.stdout currently is without flushing per line, the listener
+    flushes once the queue runs dry
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        text = record.msg + "\n"
+        try:
+            sys.stdout.write(text)
+        except UnicodeEncodeError:
+            encoding = sys.stdout.encoding or "utf-8"
+            sys.stdout.write(text.encode(encoding, errors="ignore").decode(encoding))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        try:
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            pass
+
+
+class _FlushingQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        # nothing else is waiting, so this is the time to flush what was written
+        for handler in self.handlers:
+            handler.flush()
+        return self.queue.get(block)
+
+
+class SegmentCompressor:
+    """
+    Gzips closed log segments on a daemon thread, one file at a time, then deletes the
+    oldest compressed segments until the directory is under its byte budget.
+    """
+
+    def __init__(self, logs_dir: str, max_total_bytes: int = 0) -> None:
+        self.logs_dir = logs_dir
+        self.max_total_bytes = max_total_bytes
+        self.queue: "queue.Queue[str]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="LogCompressor", daemon=True)
+        self.thread.start()
+
+    def submit(self, path: str) -> None:
+        self.queue.put(path)
+
+    def join(self) -> None:
+        """Block until every submitted segment is compressed"""
+        self.queue.join()
+
+    def _run(self) -> None:
+        while True:
+            path = self.queue.get()
+            try:
+                self.compress(path)
+                self.enforce_retention()
+            except OSError as e:
+                print_warn(f"Failed to compress {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def compress(path: str) -> str:
+        if not os.path.isfile(path):
+            return ""
+        compressed = f"{path}.gz"
+        with open(path, "rb") as infile, gzip.open(f"{compressed}.tmp", "wb") as outfile:
+            shutil.copyfileobj(infile, outfile, 1024 * 1024)
+        os.replace(f"{compressed}.tmp", compressed)
+        os.remove(path)
+        return compressed
+
+    def enforce_retention(self) -> T.List[str]:
+        if not self.max_total_bytes:
+            return []
+
+        segments = []
+        for filename in os.listdir(self.logs_dir):
+            path = os.path.join(self.logs_dir, filename)
+            if filename.endswith(".gz") and os.path.isfile(path):
+                stat = os.stat(path)
+                segments.append((stat.st_mtime, path, stat.st_size))
+
+        total = sum(size for _, _, size in segments)
+        removed = []
+        for _, path, size in sorted(segments):
+            if total <= self.max_total_bytes:
+                break
+            os.remove(path)
+            removed.append(path)
+            total -= size
+        return removed
+
+
+class SegmentRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Starts a new segment once the current one reaches `max_bytes` or is `rotate_seconds`
+    old. Closed segments are handed to a SegmentCompressor so the logging thread only
+    pays for a rename.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        compressor: SegmentCompressor,
+        max_bytes: int = 0,
+        rotate_seconds: float = 0,
+    ) -> None:
+        super().__init__(filename, mode="a", encoding="utf-8", delay=True)
+        self.compressor = compressor
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.segments = 0
+        self.rollover_at = self._next_rollover(time.time())
+
+    def _next_rollover(self, now: float) -> float:
+        return now + self.rotate_seconds if self.rotate_seconds else float("inf")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if record.created >= self.rollover_at:
+            return True
+        if not self.max_bytes:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() >= self.max_bytes
+
+    def doRollover(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        self.rollover_at = self._next_rollover(time.time())
+        if not os.path.isfile(self.baseFilename) or not os.path.getsize(self.baseFilename):
+            return
+
+        self.segments += 1
+        stamp = time.strftime("%Y_%m_%d__%H_%M_%S", time.localtime())
+        segment = f"{self.baseFilename}.{stamp}.{self.segments}"
+        os.replace(self.baseFilename, segment)
+        self.compressor.submit(segment)
+
+
+_CONSOLE_QUEUE: "queue.Queue[logging.LogRecord]" = queue.Queue()
+_CONSOLE_HANDLER = _PreformattedQueueHandler(_CONSOLE_QUEUE)
+_CONSOLE_LISTENER: T.Optional[_FlushingQueueListener] = None
+_CONSOLE_LOCK = threading.Lock()
+_CONSOLE_LEVEL = logging.DEBUG
+
+_FILE_LISTENER: T.Optional[logging.handlers.QueueListener] = None
+
+_COLOR_SUPPORTED: T.Optional[bool] = None
+
+
+def _start_console() -> None:
+    global _CONSOLE_LISTENER  # pylint: disable=global-statement
+    with _CONSOLE_LOCK:
+        if _CONSOLE_LISTENER is None:
+            _CONSOLE_LISTENER = _FlushingQueueListener(_CONSOLE_QUEUE, _ConsoleHandler())
+            _CONSOLE_LISTENER.start()
+
+
+def set_console_level(level: int) -> None:
+    """Drop console lines below this level before they are formatted"""
+    global _CONSOLE_LEVEL  # pylint: disable=global-statement
+    _CONSOLE_LEVEL = level
+
+
+def flush() -> None:
+    """Block until everything logged so far has been written out"""
+    if _CONSOLE_LISTENER is not None:
+        _CONSOLE_QUEUE.join()
+        sys.stdout.flush()
+    if _FILE_LISTENER is not None:
+        _FILE_LISTENER.queue.join()
+
+
+def _shutdown() -> None:
+    global _CONSOLE_LISTENER, _FILE_LISTENER  # pylint: disable=global-statement
+    # stopping a listener drains its queue first
+    if _CONSOLE_LISTENER is not None:
+        _CONSOLE_LISTENER.stop()
+        _CONSOLE_LISTENER = None
+        sys.stdout.flush()
+    if _FILE_LISTENER is not None:
+        _FILE_LISTENER.stop()
+        _FILE_LISTENER = None
+
+
+atexit.register(_shutdown)
+
+
 def clean_log_dir(log_dir: str) -> None:
     """Clean the log directory by removing all files and directories in the directory."""
     for filename in os.listdir(log_dir):
@@ -100,7 +376,17 @@ def get_logging_dir(name: str, create_if_not_exist: bool = True) -> str:
 
 
 def is_color_supported() -> bool:
-    return hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+    # checking isatty on every line is a syscall, the answer doesn't change
+    global _COLOR_SUPPORTED  # pylint: disable=global-statement
+    if _COLOR_SUPPORTED is None:
+        _COLOR_SUPPORTED = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+    return _COLOR_SUPPORTED
+
+
+def reset_color_support() -> None:
+    """Check the terminal again, e.g. after sys.stdout has been replaced"""
+    global _COLOR_SUPPORTED  # pylint: disable=global-statement
+    _COLOR_SUPPORTED = None
 
 
 def get_pretty_seconds(s: int) -> str:
@@ -120,6 +406,16 @@ def make_formatter_printer(
     return_formatter: bool = False,
 ) -> T.Callable:
     logger = logging.getLogger(__name__)
+    # errors have always gone to the log file as critical
+    file_level = {
+        logging.DEBUG: logging.DEBUG,
+        logging.INFO: logging.INFO,
+        logging.ERROR: logging.CRITICAL,
+    }.get(log_level)
+    if prefix and sys.platform.lower() == "linux":
+        prefix = prefix + "\t"
+    else:
+        prefix = ""
 
     def formatter(message, *args, **kwargs):
         if args or kwargs:
@@ -127,27 +423,25 @@ def make_formatter_printer(
         else:
             formatted_text = message
 
-        if prefix and sys.platform.lower() == "linux":
-            formatted_text = prefix + "\t" + formatted_text
+        formatted_text = prefix + formatted_text
 
         if is_color_supported():
-            return (
-                str(color + formatted_text + Colors.ENDC)
-                .encode("utf-8")
-                .decode(sys.stdout.encoding, errors="ignore")
-            )
-        return formatted_text.encode("utf-8").decode(sys.stdout.encoding, errors="ignore")
+            return color + formatted_text + Colors.ENDC
+        return formatted_text
 
     def printer(message, *args, **kwargs):
-        if log_level == logging.DEBUG:
-            logger.debug(message)
-        elif log_level == logging.ERROR:
-            logger.critical(message)
-        elif log_level == logging.INFO:
-            logger.info(message)
-
-        print(formatter(message, *args, **kwargs))
-        sys.stdout.flush()
+        # check the levels before doing any formatting
+        if file_level is not None and logger.isEnabledFor(file_level):
+            logger.log(file_level, message)
+
+        if log_level >= _CONSOLE_LEVEL:
+            if _CONSOLE_LISTENER is None:
+                _start_console()
+            # skip Logger.log, looking up the caller's frame for every line adds up
+            record = logging.LogRecord(
+                __name__, log_level, __file__, 0, formatter(message, *args, **kwargs), None, None
+            )
+            _CONSOLE_HANDLER.emit(record)
 
     if return_formatter:
         return formatter
@@ -180,12 +474,53 @@ def tar_logs(log_dir: str, tarname: str, remove_after: bool = False, max_tars: i
         shutil.rmtree(logs_dir)
 
 
-def setup_log(log_level: str, log_dir: str, id_string: str) -> None:
+def event(name: str, **fields: T.Any) -> None:
+    """
+    Log a structured record to the log file. In json mode the fields become keys of the
+    record, otherwise they are appended to the line as a json object.
+    """
+    logger = logging.getLogger(__name__)
+    if logger.isEnabledFor(logging.INFO):
+        message = f"{name} {json.dumps(fields, default=str, sort_keys=True)}"
+        logger.info(message, extra={"fields": dict(fields, event=name)})
+
+
+def compress_stale_logs(compressor: SegmentCompressor, keep: T.Sequence[str] = ()) -> int:
+    """Queue up logs left uncompressed by earlier runs, e.g. ones that were killed"""
+    stale = 0
+    for filename in sorted(os.listdir(compressor.logs_dir)):
+        path = os.path.join(compressor.logs_dir, filename)
+        if path in keep or filename.endswith((".gz", ".tmp")) or not os.path.isfile(path):
+            continue
+        compressor.submit(path)
+        stale += 1
+    return stale
+
+
+def setup_log(
+    log_level: str,
+    log_dir: str,
+    id_string: str,
+    json_format: bool = False,
+    rotate: bool = False,
+    max_bytes: int = 0,
+    rotate_seconds: float = 0,
+    max_total_bytes: int = 0,
+) -> None:
+    """
+    Log to a new file under log_dir/logs. With `rotate` the file is split into segments
+    by size and age, which are compressed in the background and trimmed to
+    `max_total_bytes` along with anything left over from previous runs.
+    """
+    global _FILE_LISTENER  # pylint: disable=global-statement
+
     if log_level == "NONE":
         return
 
+    extension = "jsonl" if json_format else "log"
     log_name = (
-        time.strftime("%Y_%m_%d__%H_%M_%S", time.localtime(time.time())) + f"_{id_string}.log"
+        time.strftime("%Y_%m_%d__%H_%M_%S", time.localtime(time.time()))
+        + f"_{id_string}.{extension}"
     )
 
     logs_dir = os.path.join(log_dir, "logs")
@@ -194,13 +529,37 @@ def setup_log(log_level: str, log_dir: str, id_string: str) -> None:
 
     log_file = os.path.join(logs_dir, log_name)
 
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.getLevelName(log_level),
-        format="[%(levelname)s][%(asctime)s][%(name)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        filemode="w",
-    )
+    file_handler: logging.FileHandler
+    if rotate:
+        compressor = SegmentCompressor(logs_dir, max_total_bytes)
+        compress_stale_logs(compressor, keep=[log_file])
+        file_handler = SegmentRotatingFileHandler(
+            log_file, compressor, max_bytes=max_bytes, rotate_seconds=rotate_seconds
+        )
+    else:
+        file_handler = logging.FileHandler(log_file, mode="w")
+    if json_format:
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler.setFormatter(
+            logging.Formatter(
+                "[%(levelname)s][%(asctime)s][%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+            )
+        )
+
+    # file writes happen on the listener thread instead of the thread that logged
+    if _FILE_LISTENER is not None:
+        _FILE_LISTENER.stop()
+    file_queue: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    _FILE_LISTENER = logging.handlers.QueueListener(file_queue, file_handler)
+    _FILE_LISTENER.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(file_queue))
+    root.setLevel(logging.getLevelName(log_level))
 
 
 print_ok_blue = make_formatter_printer(Colors.OKBLUE)
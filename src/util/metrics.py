@@ -0,0 +1,280 @@
+"""
+Minimal in-process metrics: counters, gauges and histograms with labels. The registry can
+be served in the Prometheus text format over HTTP and appended to a rolling JSON-lines file.
+"""
+
+import bisect
+import contextlib
+import http.server
+import json
+import math
+import os
+import threading
+import time
+import typing as T
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = T.Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: T.Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key: LabelValues, extra: T.Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> T.List[T.Tuple[str, str, float]]:
+        """(name suffix, label text, value) for every series"""
+        raise NotImplementedError
+
+    def to_json(self) -> T.Any:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: T.Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self) -> T.List[T.Tuple[str, str, float]]:
+        with self.lock:
+            return [("", self._label_text(key), value) for key, value in self.values.items()]
+
+    def to_json(self) -> T.Any:
+        with self.lock:
+            return {",".join(key): value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class _HistogramSeries:
+    def __init__(self, num_buckets: int) -> None:
+        self.bucket_counts = [0] * num_buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: T.Sequence[str] = (),
+        buckets: T.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.series: T.Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _HistogramSeries(len(self.buckets))
+            series.bucket_counts[index] += 1
+            series.count += 1
+            series.sum += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> T.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels: str) -> int:
+        series = self.series.get(self._key(labels))
+        return series.count if series is not None else 0
+
+    def samples(self) -> T.List[T.Tuple[str, str, float]]:
+        samples = []
+        with self.lock:
+            for key, series in self.series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series.bucket_counts):
+                    cumulative += count
+                    labels = self._label_text(key, {"le": _format_value(bound)})
+                    samples.append(("_bucket", labels, cumulative))
+                samples.append(("_sum", self._label_text(key), series.sum))
+                samples.append(("_count", self._label_text(key), series.count))
+        return samples
+
+    def to_json(self) -> T.Any:
+        with self.lock:
+            return {
+                ",".join(key): {"count": series.count, "sum": round(series.sum, 6)}
+                for key, series in self.series.items()
+            }
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: T.Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric_type: T.Type[Metric], name: str, *args: T.Any) -> T.Any:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_type(name, *args)
+            elif not isinstance(metric, metric_type):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: T.Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: T.Sequence[str] = (),
+        buckets: T.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        """The registry in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> T.Dict[str, T.Any]:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.to_json() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves the registry at /metrics from a daemon thread"""
+
+    def __init__(self, port: int, registry: MetricsRegistry = REGISTRY, host: str = "127.0.0.1"):
+        self.registry = registry
+        self.server = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="MetricsServer", daemon=True
+        )
+
+    def _make_handler(self) -> T.Type[http.server.BaseHTTPRequestHandler]:
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args: T.Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "MetricsServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileWriter:
+    """Appends a JSON snapshot of the registry per write, rolling the file over by size"""
+
+    def __init__(
+        self,
+        path: str,
+        registry: MetricsRegistry = REGISTRY,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+    ) -> None:
+        self.path = path
+        self.registry = registry
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def _roll_over(self) -> None:
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._roll_over()
+
+        record = {"time": time.time(), "metrics": self.registry.to_json()}
+        with open(self.path, "a") as outfile:
+            outfile.write(json.dumps(record, sort_keys=True) + "\n")
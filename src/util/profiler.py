@@ -0,0 +1,99 @@
+"""
+On demand profiling of monitor cycles. A request (SIGUSR1 or the admin doc) arms the
+profiler for the next N cycles, each of which writes cProfile stats and the top
+tracemalloc allocations to the profile directory. While nothing is requested a cycle
+only costs an integer check.
+"""
+
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+import typing as T
+
+from util import log
+from util.file_util import make_sure_path_exists
+
+DEFAULT_CYCLES = 3
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class CycleProfiler:
+    def __init__(self, profile_dir: str, default_cycles: int = DEFAULT_CYCLES) -> None:
+        self.profile_dir = profile_dir
+        self.default_cycles = default_cycles
+        self.remaining_cycles = 0
+        self.profiles_written = 0
+        self.started_tracemalloc = False
+        self.lock = threading.Lock()
+
+    def request(self, cycles: int = 0) -> None:
+        """Profile the next `cycles` cycles, safe to call from a signal handler"""
+        self.remaining_cycles = max(self.remaining_cycles, cycles or self.default_cycles)
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", 0)) -> bool:
+        if not signum or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.request())
+        return True
+
+    @contextlib.contextmanager
+    def cycle(self, name: str = "cycle") -> T.Iterator[None]:
+        if self.remaining_cycles <= 0:
+            yield
+            return
+
+        with self.lock:
+            self._start_tracemalloc()
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._write(name, profile, time.perf_counter() - start)
+                self.remaining_cycles -= 1
+                if self.remaining_cycles <= 0:
+                    self._stop_tracemalloc()
+
+    def _start_tracemalloc(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+
+    def _stop_tracemalloc(self) -> None:
+        # leave it running if someone else started it
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def _write(self, name: str, profile: cProfile.Profile, duration: float) -> None:
+        make_sure_path_exists(self.profile_dir)
+        self.profiles_written += 1
+        stamp = time.strftime("%Y_%m_%d__%H_%M_%S", time.localtime())
+        base_path = os.path.join(self.profile_dir, f"{name}_{stamp}_{self.profiles_written}")
+
+        profile.dump_stats(f"{base_path}.prof")
+
+        summary = io.StringIO()
+        summary.write(f"{name} took {duration:.3f}s\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        summary.write(f"\nTop {TOP_ALLOCATIONS} allocations by line\n")
+        current, peak = tracemalloc.get_traced_memory()
+        summary.write(f"current {current / 1e6:.1f}MB, peak {peak / 1e6:.1f}MB\n")
+        snapshot = tracemalloc.take_snapshot()
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            summary.write(f"{stat}\n")
+
+        with open(f"{base_path}.txt", "w") as outfile:
+            outfile.write(summary.getvalue())
+
+        log.print_ok_arrow(f"Wrote profile of {name} to {base_path}.prof")
@@ -0,0 +1,102 @@
+"""
+Small event driven scheduler. Tasks run when their timer is due or when another thread
+triggers them, and the loop sleeps on a condition variable in between so an idle
+process doesn't burn cpu.
+"""
+
+import threading
+import time
+import typing as T
+
+# a task may return the number of seconds until it next wants to run, otherwise its interval is used
+TaskCallback = T.Callable[[], T.Optional[float]]
+
+
+class ScheduledTask:
+    def __init__(self, name: str, callback: TaskCallback, interval: float, next_run: float):
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.next_run = next_run
+        self.runs = 0
+        self.last_duration = 0.0
+
+
+class Scheduler:
+    def __init__(self, clock: T.Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.tasks: T.Dict[str, ScheduledTask] = {}
+
+        self._triggered: T.Set[str] = set()
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def add_task(
+        self, name: str, callback: TaskCallback, interval: float, run_immediately: bool = True
+    ) -> None:
+        now = self.clock()
+        with self._condition:
+            self.tasks[name] = ScheduledTask(
+                name, callback, interval, now if run_immediately else now + interval
+            )
+            self._condition.notify()
+
+    def trigger(self, name: str) -> None:
+        """Run a task as soon as possible, safe to call from any thread"""
+        with self._condition:
+            if name not in self.tasks:
+                return
+            self._triggered.add(name)
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def time_till_next_task(self) -> float:
+        # the condition's lock is reentrant so this is also safe to call from run_forever
+        with self._condition:
+            if self._triggered:
+                return 0.0
+            if not self.tasks:
+                return float("inf")
+            return max(0.0, min(t.next_run for t in self.tasks.values()) - self.clock())
+
+    def run_pending(self) -> int:
+        """Run every task that is due or triggered, returns the number of tasks run"""
+        now = self.clock()
+        with self._condition:
+            due = [
+                task
+                for task in self.tasks.values()
+                if task.name in self._triggered or task.next_run <= now
+            ]
+            self._triggered.difference_update(task.name for task in due)
+
+        for task in due:
+            start = self.clock()
+            delay = task.callback()
+            end = self.clock()
+
+            task.runs += 1
+            task.last_duration = end - start
+            task.next_run = end + (task.interval if delay is None else delay)
+
+        return len(due)
+
+    def run_forever(self) -> None:
+        with self._condition:
+            self._stopped = False
+
+        while True:
+            self.run_pending()
+
+            with self._condition:
+                if self._stopped:
+                    return
+                timeout = self.time_till_next_task()
+                if timeout > 0.0:
+                    self._condition.wait(timeout=None if timeout == float("inf") else timeout)
+                if self._stopped:
+                    return
@@ -1,10 +1,8 @@
 import datetime
+import threading
 import time
 import typing as T
 
-import pytz
-from twilio.rest import Client
-
 from util import log
 
 
@@ -21,7 +19,11 @@ class TwilioUtil:
         self.dry_run = dry_run
         self.verbose = verbose
 
-        self.sms_client = Client(sid, auth_token) if auth_token else None
+        self.sms_client = None
+        if auth_token:
+            from twilio.rest import Client
+
+            self.sms_client = Client(sid, auth_token)
         self.my_number = my_number
 
         if dry_run:
@@ -33,6 +35,8 @@ class TwilioUtil:
         self.message_queue: T.Dict[str, T.List[Tuple[str, str]]] = {}
         self.window: T.Dict[str, T.Dict[str, T.Any]] = {}
         self.ignore_time_window: T.Dict[str, bool] = {}
+        # alerts can be queued and released from different threads
+        self.queue_lock = threading.Lock()
 
         self.time_between_sms: int = time_between_sms
 
@@ -47,6 +51,8 @@ class TwilioUtil:
     def update_send_window(
         self, to_number: str, start_time: int, end_time: int, timezone: str
     ) -> None:
+        import pytz
+
         if self.verbose:
             log.print_bright(
                 f"Updating {timezone} send window for {to_number} to: {start_time // 60}:{start_time % 60:02} - {end_time // 60}:{end_time % 60:02} ({timezone})"
@@ -60,9 +66,10 @@ class TwilioUtil:
     def send_sms_if_in_window(
         self, to_number: str, content: str, now: datetime.datetime = datetime.datetime.utcnow()
     ) -> None:
-        if to_number not in self.message_queue:
-            self.message_queue[to_number] = []
-        self.message_queue[to_number].append((to_number, content))
+        with self.queue_lock:
+            if to_number not in self.message_queue:
+                self.message_queue[to_number] = []
+            self.message_queue[to_number].append((to_number, content))
         log.print_normal(f"Added SMS to queue: {to_number} - {content}")
         self.check_sms_queue(to_number, now)
 
@@ -87,7 +94,7 @@ class TwilioUtil:
             end_time = self.window[to_number].get("end_time", 60 * 60 * 18)
             timezone = self.window[to_number].get("timezone", "America/Los_Angeles")
 
-            now_with_tz = pytz.utc.localize(now)
+            now_with_tz = now.replace(tzinfo=datetime.timezone.utc)
             converted_to_tz = now_with_tz.astimezone(timezone)
 
             if self.verbose:
@@ -110,8 +117,13 @@ class TwilioUtil:
         else:
             should_send = True
 
-        if should_send and to_number in self.message_queue:
-            for message in self.message_queue[to_number]:
-                self.send_sms(message[0], message[1])
-                time.sleep(self.time_between_sms)
+        if not should_send:
+            return
+
+        with self.queue_lock:
+            messages = self.message_queue.get(to_number, [])
             self.message_queue[to_number] = []
+
+        for message in messages:
+            self.send_sms(message[0], message[1])
+            time.sleep(self.time_between_sms)
@@ -1,8 +1,8 @@
 import time
 
-from yaspin import yaspin
 
-
-@yaspin(text="Waiting...")
 def wait(wait_time) -> None:
-    time.sleep(wait_time)
+    from yaspin import yaspin
+
+    with yaspin(text="Waiting..."):
+        time.sleep(wait_time)
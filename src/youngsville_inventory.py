@@ -1,10 +1,17 @@
+import concurrent.futures
+import json
 import os
+import threading
 import typing as T
+import urllib.parse
+from html.parser import HTMLParser
 
 import dotenv
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+
+from util import log
+from youngsville_parser import get_parser
 
 HEADERS = {
     "login": {
@@ -50,7 +57,56 @@ PARAMS = {
     "logout": "1",
 }
 
-DATA = "__VIEWSTATE=M9MU9LFbiMDREFyfwqHPKqjkwwIauCAecfhRShaDIG%2BgIPc0TQ4H16D6%2BYYAAD0NdxMOiI%2F4Kleka%2Fy0WxqmvipUvz%2BELWsxD9F%2FuBb4cTcHDxcBemwtFA9lxrW0pDu5DU7VLU5HbdQMG4a5r72qgdr1rWZS6%2BIEoIf%2Bij%2BbMV3wenTeB9FmXA8QFW7UNUng7wUgjC%2BwxKB%2B%2BhZVxjYv3kqINpZsDo2%2Bt%2BYukOg62mBBxLeNg9o00eTAyqRW0y7ho%2Bjs2UxIu8Ve5pH3UasTEOO98lmarJS%2FsNAejTPqaMmojKqcO3r9hislUjRJ%2F4k73mmMTKhKLzqlR2GChddsSBRg4Hw1hvVOO%2FpUiNzejpGMWted%2BH2RNl3DxdAuBcVzeopjvHaFfdF6MlB8VE9pbQqLBzi%2BN6xfRdkxjZCHjsY%3D&__VIEWSTATEGENERATOR=C2EE9ABB&__EVENTTARGET=&__EVENTARGUMENT=&__EVENTVALIDATION=1e5W%2B8R2bBn0DUA3kvw4a2oLsEz%2B%2BP%2FFCa0QH9BQjIfdQj%2Fqg1zQdgXazQZ5Zza1VjTUQYyUbvDJLCdIvui3dJp1bc%2FIgCk78%2Fxf0s8uFsuRFrY0tbiLTwcVJPmYDMqgZzrn%2FZZMGMUlr%2BwGd8jPjikZL%2B42%2BufFSJJYR8p4cZ8%3D&ctl00%24ContentPlaceHolder1%24txtUserName={}&ctl00%24ContentPlaceHolder1%24txtPassword={}&ctl00%24ContentPlaceHolder1%24btnLogin=Login"
+USERNAME_FIELD = "ctl00$ContentPlaceHolder1$txtUserName"
+PASSWORD_FIELD = "ctl00$ContentPlaceHolder1$txtPassword"
+LOGIN_BUTTON_FIELD = "ctl00$ContentPlaceHolder1$btnLogin"
+# hidden asp.net fields that have to be posted back with the login form
+REQUIRED_FORM_FIELDS = ["__VIEWSTATE", "__EVENTVALIDATION"]
+
+BASE_URL = "https://shopncabc.com"
+REQUEST_TIMEOUT = 30.0
+MAX_PAGE_WORKERS = 4
+# guard against a pager that keeps linking to new urls
+MAX_PAGES = 200
+
+
+class LoginError(Exception):
+    pass
+
+
+class _FormStateParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.fields: T.Dict[str, str] = {}
+
+    def handle_starttag(self, tag: str, attrs: T.List[T.Tuple[str, T.Optional[str]]]) -> None:
+        if tag != "input":
+            return
+        attributes = dict(attrs)
+        name = attributes.get("name")
+        if name and (attributes.get("type") or "").lower() == "hidden":
+            self.fields[name] = attributes.get("value") or ""
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.links: T.List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: T.List[T.Tuple[str, T.Optional[str]]]) -> None:
+        if tag != "a":
+            return
+        href = dict(attrs).get("href")
+        if href:
+            self.links.append(href)
+
+
+def parse_form_state(html_content: str) -> T.Dict[str, str]:
+    """Pull the hidden inputs (__VIEWSTATE, __EVENTVALIDATION, ...) out of a page"""
+    parser = _FormStateParser()
+    parser.feed(html_content)
+    parser.close()
+    return parser.fields
 
 
 class YoungsvilleAbcInventory:
@@ -58,43 +114,201 @@ class YoungsvilleAbcInventory:
     NC_CODE = "NC Code"
     TOTAL_AVAILABLE = "Total Available"
 
-    def __init__(self, username: str, password: str) -> None:
-        self.inventory: T.Dict[str, T.Dict[str, T.Any]] = {}
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        parser: str = "",
+        cookie_file: str = "",
+        base_url: str = BASE_URL,
+        max_page_workers: int = MAX_PAGE_WORKERS,
+    ) -> None:
+        self.username = username
+        self.password = password
         self.session = requests.Session()
-        self.data = DATA.format(username, password)
+        self.parser = get_parser(parser)
+        self.cookie_file = cookie_file
+        self.login_url = f"{base_url}/Login.aspx"
+        self.item_list_url = f"{base_url}/ItemList.aspx"
+        self.max_page_workers = max_page_workers
+        self.logins = 0
+        # pages are fetched concurrently, only one of them should log back in
+        self.login_lock = threading.Lock()
+
+        self.load_cookies()
+
+    def load_cookies(self) -> None:
+        if not self.cookie_file or not os.path.isfile(self.cookie_file):
+            return
+
+        try:
+            with open(self.cookie_file, "r") as infile:
+                cookies = json.load(infile)
+        except (OSError, ValueError) as e:
+            log.print_warn(f"Ignoring saved cookies in {self.cookie_file}: {e}")
+            return
+
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"]
+            )
+
+    def save_cookies(self) -> None:
+        if not self.cookie_file:
+            return
+
+        cookies = [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in self.session.cookies
+        ]
+        temp_file = f"{self.cookie_file}.tmp"
+        with open(temp_file, "w") as outfile:
+            json.dump(cookies, outfile)
+        os.replace(temp_file, self.cookie_file)
+
+    @staticmethod
+    def _is_login_page(response: requests.Response) -> bool:
+        return "login.aspx" in response.url.lower()
 
     def login(self) -> None:
-        self.session.post(
-            "https://shopncabc.com/Login.aspx",
+        # the viewstate is tied to the page it was rendered on, so always use a fresh one
+        response = self.session.get(
+            self.login_url, params=PARAMS, headers=HEADERS["inventory"], timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+
+        form = parse_form_state(response.text)
+        missing_fields = [f for f in REQUIRED_FORM_FIELDS if f not in form]
+        if missing_fields:
+            raise LoginError(f"Login page is missing {', '.join(missing_fields)}")
+
+        form.update(
+            {
+                "__EVENTTARGET": "",
+                "__EVENTARGUMENT": "",
+                USERNAME_FIELD: self.username,
+                PASSWORD_FIELD: self.password,
+                LOGIN_BUTTON_FIELD: "Login",
+            }
+        )
+        response = self.session.post(
+            self.login_url,
             params=PARAMS,
             headers=HEADERS["login"],
-            data=self.data,
+            data=form,
+            timeout=REQUEST_TIMEOUT,
         )
+        response.raise_for_status()
+        self.logins += 1
 
-    def get_inventory(self) -> T.Dict[str, T.Dict[str, int]]:
+        if self._is_login_page(response):
+            raise LoginError("Login was rejected")
+
+        log.print_ok_arrow("Logged in to shopncabc.com")
+        self.save_cookies()
+
+    def fetch_page(self, url: str, params: T.Optional[T.Dict[str, str]] = None) -> str:
+        """
+        Fetch a page with the current session. The site redirects to the login page once
+        the session expires, which is the only time we log in again.
+        """
+        logins = self.logins
         response = self.session.get(
-            "https://shopncabc.com/ItemList.aspx", headers=HEADERS["inventory"]
+            url, params=params, headers=HEADERS["inventory"], timeout=REQUEST_TIMEOUT
         )
-        html_content = response.text
-        soup = BeautifulSoup(html_content, "html.parser")
-        rows = soup.find_all("tr")
+        response.raise_for_status()
+
+        if self._is_login_page(response):
+            with self.login_lock:
+                # another page may have logged in while this one was in flight
+                if self.logins == logins:
+                    log.print_normal_arrow("Session expired, logging in")
+                    self.login()
+            response = self.session.get(
+                url, params=params, headers=HEADERS["inventory"], timeout=REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            if self._is_login_page(response):
+                raise LoginError(f"Still redirected to login after logging in for {url}")
+
+        return response.text
+
+    def fetch_inventory_page(self) -> str:
+        return self.fetch_page(self.item_list_url)
+
+    def page_links(self, html_content: str) -> T.List[str]:
+        """Other item list pages (pager and filter links) linked from a page"""
+        parser = _LinkParser()
+        parser.feed(html_content)
+        parser.close()
+
+        links = []
+        for href in parser.links:
+            url = urllib.parse.urldefrag(urllib.parse.urljoin(self.item_list_url, href)).url
+            parsed = urllib.parse.urlparse(url)
+            if parsed.path.lower().endswith("/itemlist.aspx") and parsed.query and url not in links:
+                links.append(url)
+        return links
+
+    def scrape_inventory(self) -> pd.core.frame.DataFrame:
+        """
+        Fetch the item list along with every page it links to. Pages are fetched
+        concurrently over the shared session and parsed as they arrive, so a full scrape
+        takes about as long as the slowest page.
+        """
+        first_page = self.fetch_inventory_page()
+
+        order = [self.item_list_url]
+        pages = {self.item_list_url: self.parser.parse(first_page)}
+        pending: T.Dict[concurrent.futures.Future, str] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_page_workers, thread_name_prefix="StorePage"
+        ) as executor:
+
+            def submit_links(html_content: str) -> None:
+                for url in self.page_links(html_content):
+                    if url in order:
+                        continue
+                    if len(order) >= MAX_PAGES:
+                        log.print_warn(f"Not fetching more than {MAX_PAGES} item list pages")
+                        return
+                    order.append(url)
+                    pending[executor.submit(self.fetch_page, url)] = url
+
+            submit_links(first_page)
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    url = pending.pop(future)
+                    html_content = future.result()
+                    pages[url] = self.parser.parse(html_content)
+                    # filtered views can have their own pager
+                    submit_links(html_content)
+
+        if len(order) > 1:
+            log.print_normal_arrow(f"Scraped {len(order)} item list pages")
+
+        # page order rather than arrival order, so duplicates resolve the same way every time
+        inventory = pd.concat([pages[url] for url in order], ignore_index=True)
+        return inventory.drop_duplicates(subset="nc_code", keep="last", ignore_index=True)
 
-        inventory = {}
-        for row in rows[1:]:  # Skip the first row (header row)
-            class_cd, class_nm = row.find_all("div", class_=["c-cd", "c-nm"])
+    def parse_inventory_page(self, html_content: str) -> pd.core.frame.DataFrame:
+        inventory = self.parser.parse(html_content)
+        return inventory.drop_duplicates(subset="nc_code", keep="last", ignore_index=True)
 
-            nc_code = class_cd.text.strip()
-            info = class_nm.text.strip()
-            name = info.split("[")[0].strip()
-            available = int(info.split("[")[1].split(" ")[0])
-            inventory[nc_code] = {"name": name, "available": available}
-        return inventory
+    def get_inventory(self) -> pd.core.frame.DataFrame:
+        return self.scrape_inventory()
 
     def inventory_to_dataframe(self) -> pd.core.frame.DataFrame:
-        df = pd.DataFrame.from_dict(self.get_inventory(), orient="index")
-        df = df.reset_index()
-        df = df.rename(
-            columns={"index": self.NC_CODE, "name": self.NAME, "available": self.TOTAL_AVAILABLE}
+        df = self.get_inventory().rename(
+            columns={
+                "nc_code": self.NC_CODE,
+                "brand_name": self.NAME,
+                "total_available": self.TOTAL_AVAILABLE,
+            }
         )
         df = df.sort_values(by=[self.NC_CODE])
         return df
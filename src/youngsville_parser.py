@@ -0,0 +1,130 @@
+"""
+Parsers for the shopncabc.com item list. Every row has a `c-cd` div with the NC code and
+a `c-nm` div with "Brand Name [N available]". The backends only pull out the raw cell
+text, the name and count are split column-wise with pandas afterwards.
+
+lxml and selectolax are used when installed, BeautifulSoup is the fallback.
+"""
+
+import abc
+import typing as T
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = None
+    lxml_html = None
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+CODE_CLASS = "c-cd"
+INFO_CLASS = "c-nm"
+
+# "Brand Name [12 available]" -> ("Brand Name ", "12")
+INFO_PATTERN = r"^(?P<name>[^\[]*)\[(?P<available>[^ ]*)"
+
+
+class ItemListParser(abc.ABC):
+    name = ""
+
+    @abc.abstractmethod
+    def cells(self, html_content: str) -> T.Tuple[T.List[str], T.List[str]]:
+        """Return the code and info cell text for every row, in page order"""
+
+    def parse(self, html_content: str) -> pd.core.frame.DataFrame:
+        codes, infos = self.cells(html_content)
+        if len(codes) != len(infos):
+            raise ValueError(f"Mismatched item list: {len(codes)} codes and {len(infos)} names")
+        return build_dataframe(codes, infos)
+
+
+class LxmlItemListParser(ItemListParser):
+    name = "lxml"
+
+    def __init__(self) -> None:
+        self.code_xpath = etree.XPath(self._class_xpath(CODE_CLASS))
+        self.info_xpath = etree.XPath(self._class_xpath(INFO_CLASS))
+
+    @staticmethod
+    def _class_xpath(class_name: str) -> str:
+        # match the class as a token the way a css class selector does
+        return f"//div[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+    def cells(self, html_content: str) -> T.Tuple[T.List[str], T.List[str]]:
+        if not html_content.strip():
+            return [], []
+        document = lxml_html.document_fromstring(html_content)
+        return (
+            [div.text_content() for div in self.code_xpath(document)],
+            [div.text_content() for div in self.info_xpath(document)],
+        )
+
+
+class SelectolaxItemListParser(ItemListParser):
+    name = "selectolax"
+
+    def cells(self, html_content: str) -> T.Tuple[T.List[str], T.List[str]]:
+        tree = HTMLParser(html_content)
+        return (
+            [node.text() for node in tree.css(f"div.{CODE_CLASS}")],
+            [node.text() for node in tree.css(f"div.{INFO_CLASS}")],
+        )
+
+
+class SoupItemListParser(ItemListParser):
+    name = "bs4"
+
+    def cells(self, html_content: str) -> T.Tuple[T.List[str], T.List[str]]:
+        soup = BeautifulSoup(html_content, "html.parser")
+        return (
+            [div.text for div in soup.find_all("div", class_=CODE_CLASS)],
+            [div.text for div in soup.find_all("div", class_=INFO_CLASS)],
+        )
+
+
+PARSERS: T.Dict[str, T.Type[ItemListParser]] = {
+    LxmlItemListParser.name: LxmlItemListParser,
+    SelectolaxItemListParser.name: SelectolaxItemListParser,
+    SoupItemListParser.name: SoupItemListParser,
+}
+
+
+def available_parsers() -> T.List[str]:
+    available = []
+    if etree is not None:
+        available.append(LxmlItemListParser.name)
+    if HTMLParser is not None:
+        available.append(SelectolaxItemListParser.name)
+    available.append(SoupItemListParser.name)
+    return available
+
+
+def get_parser(name: str = "") -> ItemListParser:
+    """Return the named backend, or the fastest one that is installed"""
+    available = available_parsers()
+    if not name:
+        name = available[0]
+    if name not in available:
+        raise ValueError(f"{name} parser is not available, choose from {available}")
+    return PARSERS[name]()
+
+
+def build_dataframe(codes: T.List[str], infos: T.List[str]) -> pd.core.frame.DataFrame:
+    info = pd.Series(infos, dtype=object).str.strip().str.extract(INFO_PATTERN)
+    if info["available"].isna().any():
+        raise ValueError("Could not parse the item counts")
+
+    return pd.DataFrame(
+        {
+            "nc_code": pd.Series(codes, dtype=object).str.strip(),
+            "brand_name": info["name"].str.strip(),
+            "total_available": info["available"].astype("int64"),
+        }
+    )